@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'contact.apps.ContactConfig',
     'exportopportunity.apps.ExportOpportunityConfig',
     'notifications.apps.NotificationsConfig',
+    'exportjob.apps.ExportJobConfig',
     'directory_constants',
 ]
 
@@ -78,6 +79,15 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # parse each template once per process instead of on every render
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        (
+            'django.template.loaders.cached.Loader',
+            TEMPLATES[0]['OPTIONS']['loaders'],
+        ),
+    ]
+
 WSGI_APPLICATION = 'api.wsgi.application'
 
 # Database
@@ -235,6 +245,25 @@ else:
 
 # CH
 COMPANIES_HOUSE_API_KEY = os.getenv('COMPANIES_HOUSE_API_KEY')
+# Companies House allows 600 requests per 5 minutes per API key
+COMPANIES_HOUSE_REQUESTS_PER_SECOND = float(
+    os.getenv('COMPANIES_HOUSE_REQUESTS_PER_SECOND', '2')
+)
+COMPANIES_HOUSE_TIMEOUT = int(os.getenv('COMPANIES_HOUSE_TIMEOUT', '5'))
+COMPANIES_HOUSE_POOL_SIZE = int(os.getenv('COMPANIES_HOUSE_POOL_SIZE', '10'))
+# Profiles are cached in Redis, and briefly in process
+COMPANIES_HOUSE_CACHE_TIMEOUT = int(
+    os.getenv('COMPANIES_HOUSE_CACHE_TIMEOUT', '86400')
+)
+COMPANIES_HOUSE_NOT_FOUND_CACHE_TIMEOUT = int(
+    os.getenv('COMPANIES_HOUSE_NOT_FOUND_CACHE_TIMEOUT', '3600')
+)
+COMPANIES_HOUSE_LOCAL_CACHE_TIMEOUT = int(
+    os.getenv('COMPANIES_HOUSE_LOCAL_CACHE_TIMEOUT', '60')
+)
+COMPANIES_HOUSE_LOCAL_CACHE_SIZE = int(
+    os.getenv('COMPANIES_HOUSE_LOCAL_CACHE_SIZE', '1024')
+)
 
 # Settings for company email confirmation
 COMPANY_EMAIL_CONFIRMATION_SUBJECT = os.environ[
@@ -298,6 +327,12 @@ STANNP_TEST_MODE = os.getenv('STANNP_TEST_MODE') != 'false'
 STANNP_VERIFICATION_LETTER_TEMPLATE_ID = os.environ[
     "STANNP_VERIFICATION_LETTER_TEMPLATE_ID"
 ]
+STANNP_TIMEOUT = int(os.getenv('STANNP_TIMEOUT', '10'))
+# Letters are sent in chunks, each chunk is one task. Requests are throttled
+# to the rate Stannp allows across all workers, through the shared cache
+STANNP_LETTER_CHUNK_SIZE = int(os.getenv('STANNP_LETTER_CHUNK_SIZE', '50'))
+STANNP_REQUESTS_PER_SECOND = int(os.getenv('STANNP_REQUESTS_PER_SECOND', '2'))
+STANNP_MAX_RETRIES = int(os.getenv('STANNP_MAX_RETRIES', '5'))
 
 GECKO_API_KEY = os.getenv('GECKO_API_KEY')
 # At present geckoboard's api assumes the password will always be X
@@ -313,6 +348,12 @@ CONTACT_SUPPLIER_SUBJECT = os.getenv(
 CONTACT_SUPPLIER_FROM_EMAIL = os.getenv('CONTACT_SUPPLIER_FROM_EMAIL')
 
 # Automated email settings
+# Recipients per sub-task when a notification is fanned out to the workers
+NOTIFICATIONS_CHUNK_SIZE = int(os.getenv('NOTIFICATIONS_CHUNK_SIZE', '500'))
+# Seconds a chunk is held by a worker after its last heartbeat
+NOTIFICATIONS_LEASE_TIMEOUT = int(
+    os.getenv('NOTIFICATIONS_LEASE_TIMEOUT', '300')
+)
 NO_CASE_STUDIES_SUBJECT = os.getenv(
     "NO_CASE_STUDIES_SUBJECT",
     "Get seen by more international buyers by improving your profile"
@@ -332,6 +373,14 @@ HASNT_LOGGED_IN_SUBJECT = os.getenv(
     "Update your Find a buyer profile"
 )
 HASNT_LOGGED_IN_DAYS = int(os.getenv('HASNT_LOGGED_IN_DAYS', '30'))
+# last logins are requested from SSO a window of the day at a time, and
+# matched to suppliers a batch of sso ids at a time
+HASNT_LOGGED_IN_WINDOW_MINUTES = int(
+    os.getenv('HASNT_LOGGED_IN_WINDOW_MINUTES', '60')
+)
+HASNT_LOGGED_IN_BATCH_SIZE = int(
+    os.getenv('HASNT_LOGGED_IN_BATCH_SIZE', '1000')
+)
 
 HASNT_LOGGED_IN_URL = os.getenv(
     "HASNT_LOGGED_IN_URL",
@@ -406,6 +455,16 @@ FAB_NOTIFICATIONS_UNSUBSCRIBE_URL = os.getenv(
     'FAB_NOTIFICATIONS_UNSUBSCRIBE_URL'
 )
 
+# Seconds company saves are coalesced for before being sent to Elasticsearch
+SEARCH_INDEX_QUEUE_WINDOW = int(os.getenv('SEARCH_INDEX_QUEUE_WINDOW', '5'))
+# Search results are cached for the first pages only, to bound the cache size
+SEARCH_CACHE_TIMEOUT = int(os.getenv('SEARCH_CACHE_TIMEOUT', '600'))
+SEARCH_CACHE_MAX_PAGE = int(os.getenv('SEARCH_CACHE_MAX_PAGE', '3'))
+# Serialized public profiles are also invalidated whenever the company changes
+PUBLIC_PROFILE_CACHE_TIMEOUT = int(
+    os.getenv('PUBLIC_PROFILE_CACHE_TIMEOUT', '3600')
+)
+
 # Initialise default Elasticsearch connection
 connections.create_connection(
     alias='default',
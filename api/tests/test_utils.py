@@ -0,0 +1,178 @@
+from unittest.mock import patch
+
+import pytest
+from rest_framework import serializers
+
+from api.utils import (
+    LocalCache,
+    SharedRateLimiter,
+    TokenBucket,
+    generate_csv_lines,
+    get_eager_loading_lookups,
+    iterate_queryset_server_side,
+)
+from company.models import Company, CompanyCaseStudy
+from company.serializers import (
+    CompanyCaseStudySerializer,
+    CompanyCaseStudyWithCompanySerializer,
+    CompanySerializer,
+)
+from company.tests.factories import CompanyFactory
+from user.models import User as Supplier
+
+
+class SupplierSerializer(serializers.ModelSerializer):
+    company_name = serializers.ReadOnlyField(source='company.name')
+
+    class Meta:
+        model = Supplier
+        fields = ('company_name', 'sso_id')
+
+
+class CaseStudySupplierSerializer(serializers.ModelSerializer):
+    suppliers = SupplierSerializer(
+        source='company.suppliers', many=True, read_only=True
+    )
+
+    class Meta:
+        model = CompanyCaseStudy
+        fields = ('suppliers', 'title')
+
+
+class CompanyNameSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Company
+        fields = ('name',)
+
+
+def test_eager_loading_lookups_pk_only():
+    lookups = get_eager_loading_lookups(CompanyCaseStudySerializer())
+
+    assert lookups == ([], [])
+
+
+def test_eager_loading_lookups_no_relations():
+    lookups = get_eager_loading_lookups(CompanyNameSerializer())
+
+    assert lookups == ([], [])
+
+
+def test_eager_loading_lookups_nested_many():
+    lookups = get_eager_loading_lookups(CompanySerializer())
+
+    assert lookups == ([], ['supplier_case_studies'])
+
+
+def test_eager_loading_lookups_depth():
+    lookups = get_eager_loading_lookups(
+        CompanyCaseStudyWithCompanySerializer()
+    )
+
+    assert lookups == (['company'], [])
+
+
+def test_eager_loading_lookups_dotted_source():
+    lookups = get_eager_loading_lookups(SupplierSerializer())
+
+    assert lookups == (['company'], [])
+
+
+def test_eager_loading_lookups_nested_through_relation():
+    lookups = get_eager_loading_lookups(CaseStudySupplierSerializer())
+
+    assert lookups == (
+        [], ['company__suppliers', 'company__suppliers__company']
+    )
+
+
+def test_generate_csv_lines_chunks():
+    rows = [{'a': i, 'b': 'x'} for i in range(5)]
+
+    chunks = list(
+        generate_csv_lines(fieldnames=['a', 'b'], rows=rows, lines_per_chunk=2)
+    )
+
+    assert chunks == [
+        'a,b\r\n',
+        '0,x\r\n1,x\r\n',
+        '2,x\r\n3,x\r\n',
+        '4,x\r\n',
+    ]
+
+
+@pytest.mark.django_db
+def test_iterate_queryset_server_side():
+    companies = CompanyFactory.create_batch(3)
+    queryset = Company.objects.order_by('-pk').values('number', 'pk')
+
+    rows = list(iterate_queryset_server_side(queryset, chunk_size=2))
+
+    assert rows == list(queryset)
+    assert [row['pk'] for row in rows] == [
+        company.pk for company in reversed(companies)
+    ]
+
+
+@pytest.mark.django_db
+def test_iterate_queryset_server_side_empty():
+    queryset = Company.objects.filter(pk__in=[]).values('pk')
+
+    assert list(iterate_queryset_server_side(queryset)) == []
+
+
+@patch('api.utils.time.sleep')
+@patch('api.utils.time.monotonic')
+def test_token_bucket_waits_for_token(mock_monotonic, mock_sleep):
+    now = [100.0]
+    mock_monotonic.side_effect = lambda: now[0]
+    mock_sleep.side_effect = lambda seconds: now.__setitem__(
+        0, now[0] + seconds
+    )
+    bucket = TokenBucket(rate=2, capacity=2)
+
+    bucket.consume()
+    bucket.consume()
+    assert mock_sleep.called is False
+
+    bucket.consume()
+    mock_sleep.assert_called_once_with(0.5)
+
+
+@patch('api.utils.time.sleep')
+@patch('api.utils.time.time')
+def test_shared_rate_limiter_waits_for_next_second(mock_time, mock_sleep):
+    now = [100.25]
+    mock_time.side_effect = lambda: now[0]
+    mock_sleep.side_effect = lambda seconds: now.__setitem__(
+        0, now[0] + seconds
+    )
+    limiter = SharedRateLimiter(name='test', rate=2)
+    # another process sharing the cache
+    other_limiter = SharedRateLimiter(name='test', rate=2)
+
+    limiter.consume()
+    other_limiter.consume()
+    assert mock_sleep.called is False
+
+    limiter.consume()
+    mock_sleep.assert_called_once_with(0.75)
+
+
+@patch('api.utils.time.monotonic')
+def test_local_cache(mock_monotonic):
+    mock_monotonic.return_value = 100
+    local_cache = LocalCache(maxsize=2, timeout=10)
+
+    local_cache.set('a', 1)
+    local_cache.set('b', 2)
+    local_cache.get('a')
+    local_cache.set('c', 3)
+
+    assert local_cache.get('a') == 1
+    assert local_cache.get('b') is None
+    assert local_cache.get('c') == 3
+
+    mock_monotonic.return_value = 111
+
+    assert local_cache.get('a') is None
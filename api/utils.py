@@ -1,26 +1,334 @@
+from collections import OrderedDict
 import csv
+from functools import lru_cache
+import threading
+import time
+from uuid import uuid4
 
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+from rest_framework import relations, serializers
 
 
 def generate_csv(model, queryset, filename, excluded_fields):
-    response = HttpResponse(content_type='text/csv')
+    fieldnames = sorted(
+        [field.name for field in model._meta.get_fields()
+         if field.name not in excluded_fields]
+    )
+
+    return stream_csv(
+        queryset=queryset.all().values(*fieldnames),
+        fieldnames=fieldnames,
+        filename=filename,
+    )
+
+
+def stream_csv(queryset, fieldnames, filename):
+    """Streams the rows of a values() queryset as a CSV attachment."""
+
+    response = StreamingHttpResponse(
+        generate_csv_lines(
+            fieldnames=fieldnames,
+            rows=iterate_queryset_server_side(queryset),
+        ),
+        content_type='text/csv',
+    )
     response['Content-Disposition'] = (
         'attachment; filename="{filename}"'.format(
             filename=filename
         )
     )
+    return response
 
-    fieldnames = sorted(
-        [field.name for field in model._meta.get_fields()
-         if field.name not in excluded_fields]
+
+class Echo:
+    """File-like object whose write returns the value instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def generate_csv_lines(fieldnames, rows, lines_per_chunk=500):
+    writer = csv.DictWriter(Echo(), fieldnames=fieldnames)
+    # DictWriter.writeheader does not return the written value until 3.8
+    yield writer.writerow(dict(zip(fieldnames, fieldnames)))
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) == lines_per_chunk:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def iterate_queryset_server_side(queryset, chunk_size=2000):
+    """Yields the rows of a values() queryset from a server-side cursor.
+
+    Django 1.9's iterator() still has psycopg2 load the whole result set into
+    memory, so the query is run through a named cursor that fetches
+    `chunk_size` rows at a time. The cursor is created WITH HOLD so it can be
+    read after the view returns, for example by a StreamingHttpResponse.
+    Django's field converters are not applied, which makes no difference to
+    the types psycopg2 returns for the fields exported here.
+
+    """
+
+    query = queryset.query
+    # the order Django selects the columns of a values() queryset in
+    names = (
+        list(query.extra_select) +
+        list(query.values_select) +
+        list(query.annotation_select)
     )
+    try:
+        sql, params = query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return
+    connection = connections[queryset.db]
+    connection.ensure_connection()
+    cursor_name = 'stream_{}'.format(uuid4().hex)
+    with connection.connection.cursor(
+        name=cursor_name, withhold=True
+    ) as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(sql, params)
+        for row in cursor:
+            yield dict(zip(names, row))
 
-    objects = queryset.all().values(*fieldnames)
-    writer = csv.DictWriter(response, fieldnames=fieldnames)
-    writer.writeheader()
 
-    for obj in objects:
-        writer.writerow(obj)
+def iterate_queryset_in_chunks(queryset, chunk_size):
+    """
+    Yields the rows of `queryset` as lists of at most `chunk_size` items.
 
-    return response
+    Rows are read in primary key order with one bounded query per chunk
+    (keyset pagination), so `prefetch_related` is honoured and memory use
+    does not grow with the size of the table. Querysets built with
+    `values()` must include 'pk' in the selected fields.
+
+    """
+
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        if last_pk is None:
+            chunk = list(queryset[:chunk_size])
+        else:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+        last_pk = last['pk'] if isinstance(last, dict) else last.pk
+
+
+class TokenBucket:
+    """
+    Thread safe rate limiter allowing `rate` calls per second on average,
+    with bursts of up to `capacity` calls.
+
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self):
+        """Blocks until a token is available, then takes it."""
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Rate limiter allowing at most `rate` calls in each second across every
+    process sharing the cache, for limits set by third party APIs.
+
+    """
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.rate = rate
+
+    def consume(self):
+        """Blocks until a call is allowed in the current second."""
+
+        while True:
+            now = time.time()
+            key = 'rate-limit:{name}:{second}'.format(
+                name=self.name, second=int(now)
+            )
+            cache.add(key, 0, timeout=2)
+            try:
+                calls = cache.incr(key)
+            except ValueError:
+                # expired between add and incr
+                continue
+            if calls <= self.rate:
+                return
+            time.sleep(int(now) + 1 - now)
+
+
+class LocalCache:
+    """
+    Thread safe in-process cache that keeps the `maxsize` most recently used
+    values for at most `timeout` seconds.
+
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return default
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+def estimate_queryset_count(queryset):
+    """Returns the query planner's estimate of the number of rows.
+
+    Reads the estimate from EXPLAIN rather than running COUNT(*), so it is
+    cheap regardless of table size but only as accurate as the table
+    statistics.
+
+    """
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_relation_path(model, source_attrs):
+    """Returns the relations traversed by a serializer field's source.
+
+    Returns:
+        tuple -- The relation names and whether any of them is to-many.
+
+    """
+
+    path = []
+    many = False
+    for attr in source_attrs:
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not model_field.is_relation:
+            break
+        path.append(attr)
+        many = many or model_field.many_to_many or model_field.one_to_many
+        model = model_field.related_model
+    return path, many
+
+
+def get_eager_loading_lookups(serializer, prefix=''):
+    """Returns the related lookups rendered by a model serializer.
+
+    Walks the serializer's readable fields, including nested serializers, so
+    the relations they render can be loaded up front rather than once per
+    object.
+
+    Returns:
+        tuple -- The select_related lookups and the prefetch_related lookups.
+
+    """
+
+    select_related = []
+    prefetch_related = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        path, many = get_relation_path(
+            serializer.Meta.model, field.source_attrs
+        )
+        if not path:
+            continue
+        if (
+            isinstance(field, relations.RelatedField) and
+            field.use_pk_only_optimization() and
+            len(field.source_attrs) == 1
+        ):
+            # the foreign key's column is enough to render the pk
+            continue
+        lookup = prefix + '__'.join(path)
+        if many or isinstance(field, relations.ManyRelatedField):
+            prefetch_related.append(lookup)
+        else:
+            select_related.append(lookup)
+        child = getattr(field, 'child', field)
+        if isinstance(child, serializers.ModelSerializer):
+            nested_select, nested_prefetch = get_eager_loading_lookups(
+                child, prefix=lookup + '__'
+            )
+            if lookup in prefetch_related:
+                prefetch_related += nested_select + nested_prefetch
+            else:
+                select_related += nested_select
+                prefetch_related += nested_prefetch
+    return select_related, prefetch_related
+
+
+@lru_cache()
+def get_serializer_class_lookups(serializer_class):
+    select_related, prefetch_related = get_eager_loading_lookups(
+        serializer_class()
+    )
+    return tuple(select_related), tuple(prefetch_related)
+
+
+class EagerLoadingMixin:
+    """Eager loads the relations rendered by the view's serializer class."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select_related, prefetch_related = get_serializer_class_lookups(
+            self.get_serializer_class()
+        )
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
@@ -46,7 +46,8 @@ class DownloadCSVTestCase(TestCase):
             ('name', buyer.name),
             ('sector', buyer.sector),
         ])
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
 
         assert actual[0] == ','.join(expected_data.keys())
         assert actual[1] == ','.join(expected_data.values())
@@ -96,7 +97,8 @@ class DownloadCSVTestCase(TestCase):
             follow=True
         )
 
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
         assert actual[0] == ','.join(buyer_one_expected_data.keys())
         assert actual[1] == ','.join(buyer_three_expected_data.values())
         assert actual[2] == ','.join(buyer_two_expected_data.values())
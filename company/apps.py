@@ -1,13 +1,14 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_save, pre_save
-
-from company import signals
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class CompanyConfig(AppConfig):
     name = 'company'
 
     def ready(self):
+        # signals enqueue celery tasks, which need the models to be loaded
+        from company import signals
+
         post_save.connect(
             receiver=signals.send_first_verification_letter,
             sender='company.Company'
@@ -16,6 +17,46 @@ class CompanyConfig(AppConfig):
             receiver=signals.save_to_elasticsearch,
             sender='company.Company'
         )
+        post_delete.connect(
+            receiver=signals.delete_from_elasticsearch,
+            sender='company.Company'
+        )
+        post_save.connect(
+            receiver=signals.update_case_studies_in_elasticsearch,
+            sender='company.CompanyCaseStudy'
+        )
+        post_delete.connect(
+            receiver=signals.update_case_studies_in_elasticsearch,
+            sender='company.CompanyCaseStudy'
+        )
+        pre_save.connect(
+            receiver=signals.store_previous_company_of_case_study,
+            sender='company.CompanyCaseStudy'
+        )
+        post_save.connect(
+            receiver=signals.update_case_study_count,
+            sender='company.CompanyCaseStudy'
+        )
+        post_delete.connect(
+            receiver=signals.update_case_study_count,
+            sender='company.CompanyCaseStudy'
+        )
+        post_save.connect(
+            receiver=signals.invalidate_public_profile_cache,
+            sender='company.Company'
+        )
+        post_delete.connect(
+            receiver=signals.invalidate_public_profile_cache,
+            sender='company.Company'
+        )
+        post_save.connect(
+            receiver=signals.touch_company_of_case_study,
+            sender='company.CompanyCaseStudy'
+        )
+        post_delete.connect(
+            receiver=signals.touch_company_of_case_study,
+            sender='company.CompanyCaseStudy'
+        )
         pre_save.connect(
             receiver=signals.publish_companies_that_meet_criteria,
             sender='company.Company'
@@ -1,3 +1,4 @@
+from collections import Counter
 from datetime import datetime
 import logging
 import http
@@ -5,11 +6,16 @@ import os
 from uuid import uuid4
 
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.crypto import get_random_string
 from django.utils.deconstruct import deconstructible
 
 from directory_validators.constants import choices
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from api.utils import LocalCache
 
 
 MESSAGE_AUTH_FAILED = 'Auth failed with Companies House'
@@ -20,7 +26,31 @@ SECTOR_CHOICES = dict(choices.COMPANY_CLASSIFICATIONS)
 logger = logging.getLogger(__name__)
 company_profile_url = 'https://api.companieshouse.gov.uk/company/{number}'
 
+COMPANIES_HOUSE_PROFILE_CACHE_KEY = 'companies-house-profile:{number}'
+PROFILE_NOT_FOUND = 'not-found'
+
 companies_house_session = requests.Session()
+companies_house_session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=settings.COMPANIES_HOUSE_POOL_SIZE,
+    max_retries=Retry(
+        total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]
+    ),
+))
+companies_house_profile_cache = LocalCache(
+    maxsize=settings.COMPANIES_HOUSE_LOCAL_CACHE_SIZE,
+    timeout=settings.COMPANIES_HOUSE_LOCAL_CACHE_TIMEOUT,
+)
+# hits of the in-process cache, hits of the shared cache, and misses
+companies_house_profile_cache_stats = Counter()
+
+
+def get_public_profile_cache_key(number):
+    return 'public-company-profile:{number}'.format(number=number)
+
+
+def get_public_case_study_cache_key(pk):
+    return 'public-case-study:{pk}'.format(pk=pk)
 
 
 def get_sector_label(sectors_value):
@@ -33,12 +63,14 @@ def generate_verification_code():
     )
 
 
-def get_date_of_creation(number):
+def get_date_of_creation(number, rate_limiter=None):
     """
     Returns the date a company was created on companies house.
 
     Args:
         number (str): companies house number
+        rate_limiter (api.utils.TokenBucket): consumed before a request to
+            companies house
 
     Returns:
         datetime.date
@@ -52,17 +84,69 @@ def get_date_of_creation(number):
 
     """
 
-    response = get_companies_house_profile(number=number)
-    if not response.ok:
-        raise response.raise_for_status()
+    profile = get_cached_companies_house_profile(
+        number=number, rate_limiter=rate_limiter
+    )
+    if profile is None:
+        raise requests.exceptions.HTTPError(
+            'Company {} not found'.format(number)
+        )
+    raw = profile['date_of_creation']
+    return datetime.strptime(raw, COMPANIES_HOUSE_DATE_FORMAT).date()
+
+
+def get_cached_companies_house_profile(number, rate_limiter=None):
+    """
+    Returns the company's parsed Companies House profile, looked up in the
+    in-process cache, then the shared cache, then Companies House.
+
+    Args:
+        number (str): companies house number
+        rate_limiter (api.utils.TokenBucket): consumed before a request to
+            companies house, but not for cache hits
+
+    Returns:
+        dict -- None if the company does not exist
+
+    Raises:
+        requests.exceptions.HTTPError: companies house may return non-200.
+        requests.exceptions.RequestException: A network error could occur.
+        ValueError: The companies house api may return invalid json.
+
+    """
+
+    key = COMPANIES_HOUSE_PROFILE_CACHE_KEY.format(number=number)
+    profile = companies_house_profile_cache.get(key)
+    if profile is not None:
+        companies_house_profile_cache_stats['local_hit'] += 1
     else:
-        raw = response.json()['date_of_creation']
-        return datetime.strptime(raw, COMPANIES_HOUSE_DATE_FORMAT).date()
+        profile = cache.get(key)
+        if profile is not None:
+            companies_house_profile_cache_stats['hit'] += 1
+        else:
+            companies_house_profile_cache_stats['miss'] += 1
+            if rate_limiter:
+                rate_limiter.consume()
+            response = get_companies_house_profile(number=number)
+            if response.status_code == http.client.NOT_FOUND:
+                profile = PROFILE_NOT_FOUND
+                timeout = settings.COMPANIES_HOUSE_NOT_FOUND_CACHE_TIMEOUT
+            else:
+                response.raise_for_status()
+                profile = response.json()
+                timeout = settings.COMPANIES_HOUSE_CACHE_TIMEOUT
+            cache.set(key, profile, timeout)
+        companies_house_profile_cache.set(key, profile)
+    if profile == PROFILE_NOT_FOUND:
+        return None
+    return profile
 
 
 def companies_house_client(url):
     auth = requests.auth.HTTPBasicAuth(settings.COMPANIES_HOUSE_API_KEY, '')
-    response = companies_house_session.get(url=url, auth=auth)
+    response = companies_house_session.get(
+        url=url, auth=auth, timeout=settings.COMPANIES_HOUSE_TIMEOUT
+    )
     if response.status_code == http.client.UNAUTHORIZED:
         logger.error(MESSAGE_AUTH_FAILED)
     return response
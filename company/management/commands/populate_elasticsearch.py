@@ -1,12 +1,40 @@
 from django.core.management.base import BaseCommand
 
-from company import models
+from company import models, search
 
 
 class Command(BaseCommand):
     help = 'Populates ElasticSearch with companies'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=search.BULK_CHUNK_SIZE,
+            help='Number of companies sent in each bulk request',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=search.BULK_THREAD_COUNT,
+            help='Number of bulk requests sent in parallel',
+        )
+        parser.add_argument(
+            '--max-retries',
+            type=int,
+            default=search.BULK_MAX_RETRIES,
+            help='Retries of bulk requests rejected with 429',
+        )
+
     def handle(self, *args, **options):
         companies = models.Company.objects.filter(is_published=True)
-        for company in companies:
-            company.to_doc_type().save()
+        indexed = search.bulk_index_companies(
+            companies,
+            chunk_size=options['chunk_size'],
+            thread_count=options['workers'],
+            max_retries=options['max_retries'],
+        )
+        search.bump_search_generation()
+        self.stdout.write(
+            self.style.SUCCESS('Indexed {} companies'.format(indexed))
+        )
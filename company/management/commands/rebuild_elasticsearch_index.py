@@ -1,19 +1,81 @@
-from django.core.management.base import BaseCommand
-from django.core import management
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
-from elasticsearch_dsl import Index, analyzer
+from elasticsearch_dsl import Index
 
-from company.search import CompanyDocType
+from company import models, search
 
 
 class Command(BaseCommand):
-    help = 'Rebuilds Elasticsearch companies index'
+    help = (
+        'Builds a new Elasticsearch companies index and swaps the alias used '
+        'for searching over to it once populated'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=1,
+            help='Number of previous index generations to keep',
+        )
 
     def handle(self, *args, **options):
-        companies = Index('companies')
-        companies.delete(ignore=404)
+        started = timezone.now()
+        name = '{alias}-{timestamp}'.format(
+            alias=search.CompanyDocType._doc_type.index,
+            timestamp=started.strftime('%Y%m%d%H%M%S%f'),
+        )
+        index = search.create_company_index(name)
+
+        companies = models.Company.objects.filter(is_published=True)
+        indexed_pks = set(companies.values_list('pk', flat=True))
+        search.bulk_index_companies(companies, index=name)
+        # live changes are written through the alias to the old index until
+        # it is swapped, so catch up with the companies changed meanwhile
+        caught_up = timezone.now()
+        self.catch_up(name, since=started, indexed_pks=indexed_pks)
+        index.refresh()
+
+        expected = companies.count()
+        indexed = search.CompanyDocType.search(index=name).count()
+        if indexed != expected:
+            index.delete()
+            raise CommandError(
+                'Indexed {indexed} of {expected} companies, alias not '
+                'swapped'.format(indexed=indexed, expected=expected)
+            )
+
+        search.swap_company_index_alias(name)
+        # changes made between the first catch up and the swap
+        self.catch_up(name, since=caught_up, indexed_pks=indexed_pks)
+        search.bump_search_generation()
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed {} companies in {}'.format(indexed, name)
+        ))
+
+        generations = search.get_company_index_generations()
+        generations.remove(name)
+        stale = generations[:max(len(generations) - options['keep'], 0)]
+        for stale_name in stale:
+            Index(stale_name).delete()
+            self.stdout.write('Deleted {}'.format(stale_name))
+
+    @staticmethod
+    def catch_up(name, since, indexed_pks):
+        """
+        Indexes the companies saved since `since`, and removes the companies
+        among `indexed_pks` that have been unpublished or deleted since.
+
+        """
 
-        companies.doc_type(CompanyDocType)
-        companies.analyzer(analyzer('english'))
-        companies.create()
-        management.call_command('populate_elasticsearch')
+        companies = models.Company.objects.filter(is_published=True)
+        search.bulk_index_companies(
+            companies.filter(modified__gte=since), index=name
+        )
+        removed_pks = indexed_pks - set(companies.values_list('pk', flat=True))
+        if removed_pks:
+            search.bulk_send([
+                search.company_pk_to_delete_action(pk, index=name)
+                for pk in sorted(removed_pks)
+            ])
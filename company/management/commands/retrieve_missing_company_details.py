@@ -1,14 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
+from django.db.models import Case, DateField, Value, When
+from django.utils import timezone
+
+import requests
+
+from api.utils import TokenBucket, iterate_queryset_in_chunks
+from company import helpers, models, tasks, utils
+
+
+logger = logging.getLogger(__name__)
 
-from company import helpers, models
+CHECKPOINT_KEY = 'retrieve-missing-company-details:checkpoint'
+CHECKPOINT_TIMEOUT = 60 * 60 * 24 * 7
 
 
 class Command(BaseCommand):
     help = 'Retrieves missing data of companies such as date of creation'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of companies updated in each query',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of Companies House requests sent in parallel',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=settings.COMPANIES_HOUSE_REQUESTS_PER_SECOND,
+            help='Companies House requests sent per second',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint left by an interrupted run',
+        )
+
     def handle(self, *args, **options):
-        querystring = models.Company.objects.exclude(number='')
-        for company in querystring.filter(date_of_creation__isnull=True):
-            date_of_creation = helpers.get_date_of_creation(company.number)
-            company.date_of_creation = date_of_creation
-            company.save()
+        self.bucket = TokenBucket(rate=options['rate'])
+        if options['restart']:
+            cache.delete(CHECKPOINT_KEY)
+        checkpoint = cache.get(CHECKPOINT_KEY, 0)
+
+        companies = (
+            models.Company.objects
+            .exclude(number='')
+            .filter(date_of_creation__isnull=True, pk__gt=checkpoint)
+            .values('pk', 'number')
+        )
+        updated = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            chunks = iterate_queryset_in_chunks(
+                companies, options['chunk_size']
+            )
+            for chunk in chunks:
+                numbers = [row['number'] for row in chunk]
+                dates = executor.map(self.get_date_of_creation, numbers)
+                updated += self.update_companies(chunk, dates)
+                cache.set(CHECKPOINT_KEY, chunk[-1]['pk'], CHECKPOINT_TIMEOUT)
+        # companies that failed are retried by the next run
+        cache.delete(CHECKPOINT_KEY)
+        stats = helpers.companies_house_profile_cache_stats
+        self.stdout.write(self.style.SUCCESS(
+            'Updated {} companies. Companies House profile cache: {} local '
+            'hits, {} hits, {} misses'.format(
+                updated, stats['local_hit'], stats['hit'], stats['miss']
+            )
+        ))
+
+    def get_date_of_creation(self, number):
+        # cached lookups do not consume the rate limit
+        try:
+            return helpers.get_date_of_creation(
+                number, rate_limiter=self.bucket
+            )
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            logger.exception('Unable to retrieve %s', number)
+            return None
+
+    @staticmethod
+    def update_companies(rows, dates):
+        # one query per chunk, and update() skips the post_save handlers, so
+        # the work they would do is done here once per chunk
+        dates_by_pk = {
+            row['pk']: date_of_creation
+            for row, date_of_creation in zip(rows, dates)
+            if date_of_creation
+        }
+        if not dates_by_pk:
+            return 0
+        pks = list(dates_by_pk)
+        updated = models.Company.objects.filter(pk__in=pks).update(
+            date_of_creation=Case(
+                *[
+                    When(pk=pk, then=Value(date_of_creation))
+                    for pk, date_of_creation in dates_by_pk.items()
+                ],
+                output_field=DateField()
+            ),
+            modified=timezone.now(),
+        )
+        utils.clear_public_profile_cache(pks)
+        published_pks = models.Company.objects.filter(
+            pk__in=pks, is_published=True
+        ).values_list('pk', flat=True)
+        for pk in published_pks:
+            tasks.enqueue_search_index(pk)
+        return updated
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-06-28 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0045_auto_20170620_1426'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='case_study_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='has_case_studies',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunSQL(
+            sql=(
+                'UPDATE company_company '
+                'SET case_study_count = counts.total, has_case_studies = true '
+                'FROM ('
+                '    SELECT company_id, COUNT(*) AS total '
+                '    FROM company_companycasestudy GROUP BY company_id'
+                ') AS counts '
+                'WHERE company_company.id = counts.company_id;'
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX company_company_public_listing '
+                'ON company_company (is_published, has_case_studies, modified) '
+                'WHERE is_published;'
+            ),
+            reverse_sql='DROP INDEX company_company_public_listing;',
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX company_company_sectors_gin '
+                'ON company_company USING gin (sectors jsonb_path_ops);'
+            ),
+            reverse_sql='DROP INDEX company_company_sectors_gin;',
+        ),
+    ]
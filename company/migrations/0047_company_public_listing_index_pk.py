@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-06-29 09:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0046_company_case_study_count'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                'DROP INDEX company_company_public_listing;'
+                'CREATE INDEX company_company_public_listing '
+                'ON company_company '
+                '(is_published, has_case_studies, modified, id) '
+                'WHERE is_published;'
+            ),
+            reverse_sql=(
+                'DROP INDEX company_company_public_listing;'
+                'CREATE INDEX company_company_public_listing '
+                'ON company_company (is_published, has_case_studies, modified) '
+                'WHERE is_published;'
+            ),
+        ),
+    ]
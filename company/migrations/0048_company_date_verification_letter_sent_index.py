@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-07-04 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0047_company_public_listing_index_pk'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='company',
+            name='date_verification_letter_sent',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+    ]
@@ -12,6 +12,13 @@ from company import helpers, search
 
 
 class Company(TimeStampedModel):
+    REQUIRED_ADDRESS_FIELDS = (
+        'postal_full_name',
+        'address_line_1',
+        'postal_code',
+    )
+    CASE_STUDY_COUNT_FIELDS = ('case_study_count', 'has_case_studies')
+
     to_doc_type = search.company_model_to_doc_type
     summary = models.CharField(
         max_length=250,
@@ -70,6 +77,17 @@ class Company(TimeStampedModel):
         )
     )
     date_published = models.DateField(null=True)
+    # maintained by signals on CompanyCaseStudy to avoid counting case studies
+    # when ordering the public profile listing. Not written by save(), so a
+    # stale instance cannot overwrite the count.
+    case_study_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    has_case_studies = models.BooleanField(
+        default=False,
+        editable=False,
+    )
     verification_code = models.CharField(
         _('verification code'),
         max_length=255,
@@ -78,7 +96,9 @@ class Company(TimeStampedModel):
     )
     verified_with_code = models.BooleanField(default=False)
     is_verification_letter_sent = models.BooleanField(default=False)
-    date_verification_letter_sent = models.DateTimeField(null=True)
+    date_verification_letter_sent = models.DateTimeField(
+        null=True, db_index=True
+    )
     # social links
     twitter_url = models.URLField(
         max_length=255,
@@ -158,15 +178,19 @@ class Company(TimeStampedModel):
         return settings.FAS_COMPANY_PROFILE_URL.format(number=self.number)
 
     def has_valid_address(self):
-        required_address_fields = [
-            'postal_full_name',
-            'address_line_1',
-            'postal_code',
-        ]
-        return all(getattr(self, field) for field in required_address_fields)
+        return all(
+            getattr(self, field) for field in self.REQUIRED_ADDRESS_FIELDS
+        )
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)[:50]
+        is_update = not self._state.adding and not kwargs.get('force_insert')
+        if is_update and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.CASE_STUDY_COUNT_FIELDS
+            ]
         return super().save(*args, **kwargs)
 
 
@@ -1,7 +1,156 @@
+import base64
+import binascii
+from collections import OrderedDict
+import json
+
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.utils import estimate_queryset_count
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reports the query planner's estimate as the count.
+
+    The estimate can be out in either direction, so it is not used to bound
+    the page number or to truncate the last page.
+
+    """
+
+    @cached_property
+    def count(self):
+        return estimate_queryset_count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        return Page(self.object_list[bottom:top], number, self)
 
 
 class CompanyPublicProfile(pagination.PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class CompanyPublicProfileCursor(pagination.BasePagination):
+    """Keyset pagination on (has_case_studies, modified, pk).
+
+    Each page seeks past the last company of the previous page rather than
+    using OFFSET, and no count is made, so every page costs the same. Only a
+    next link is provided.
+
+    """
+
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-has_case_studies', '-modified', '-pk')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = self.seek_queryset(queryset, self.decode_cursor(request))
+        results = list(queryset[:page_size + 1])
+        self.next_instance = (
+            results[page_size - 1] if len(results) > page_size else None
+        )
+        return results[:page_size]
+
+    def seek_queryset(self, queryset, position):
+        # companies without a modified date cannot be positioned
+        queryset = queryset.filter(modified__isnull=False)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            # a row comparison lets postgres seek the listing index
+            where = '({t}.has_case_studies, {t}.modified, {t}.{pk}) < %s'
+            queryset = queryset.extra(
+                where=[where.format(
+                    t=queryset.model._meta.db_table,
+                    pk=queryset.model._meta.pk.column,
+                )],
+                params=[tuple(position)],
+            )
+        return queryset
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            has_case_studies, modified, pk = json.loads(
+                base64.urlsafe_b64decode(encoded.encode()).decode()
+            )
+            modified = parse_datetime(modified)
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if modified is None or not isinstance(pk, int):
+            raise NotFound(self.invalid_cursor_message)
+        return [bool(has_case_studies), modified, pk]
+
+    def encode_cursor(self, instance):
+        # pages of the public listing are values() rows
+        if not isinstance(instance, dict):
+            instance = {
+                'has_case_studies': instance.has_case_studies,
+                'modified': instance.modified,
+                'pk': instance.pk,
+            }
+        position = [
+            instance['has_case_studies'], instance['modified'].isoformat(),
+            instance['pk'],
+        ]
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if self.next_instance is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_instance),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_fields(self, view):
+        return [self.cursor_query_param, self.page_size_query_param]
@@ -1,8 +1,56 @@
-from elasticsearch_dsl import field, DocType
+import base64
+import binascii
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import time
 
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from elasticsearch import TransportError
+from elasticsearch.helpers import bulk, BulkIndexError
+from elasticsearch_dsl import analyzer, field, DocType, Index
+from elasticsearch_dsl.connections import connections
+from elasticsearch_dsl.query import Q
+
+from api.utils import iterate_queryset_in_chunks
 from company import helpers
 
 
+BULK_CHUNK_SIZE = 500
+BULK_THREAD_COUNT = 4
+BULK_MAX_RETRIES = 3
+BULK_INITIAL_BACKOFF = 2
+MESSAGE_BULK_REJECTED = 'Bulk request rejected by Elasticsearch, retrying'
+INDEX_QUEUE_KEY = 'company-search-index-queue'
+CASE_STUDIES_QUEUE_KEY = 'company-search-case-studies-queue'
+INDEX_QUEUE_FLUSH_KEY = 'company-search-index-queue-flush'
+SEARCH_GENERATION_KEY = 'company-search-generation'
+# fields needed to render a listing of companies
+LEAN_SOURCE_FIELDS = [
+    'date_of_creation',
+    'employees',
+    'has_single_sector',
+    'logo',
+    'name',
+    'number',
+    'pk',
+    'sectors',
+    'sectors_label',
+    'slug',
+    'summary',
+    'website',
+]
+LEAN_HIGHLIGHT_FIELDS = ['description', 'keywords', 'summary']
+FACET_FIELDS = ['employees', 'sectors']
+MESSAGE_INVALID_CURSOR = 'Invalid cursor'
+
+logger = logging.getLogger(__name__)
+
+
 class FormattedDate(field.Date):
     def __init__(self, date_format, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -22,7 +70,7 @@ class FormattedDate(field.Date):
 class CompanyDocType(DocType):
     date_of_creation = FormattedDate(date_format='%Y-%m-%d')
     description = field.Text()
-    employees = field.Text()
+    employees = field.Keyword()
     facebook_url = field.Text()
     pk = field.Integer()
     keywords = field.Text()
@@ -32,7 +80,7 @@ class CompanyDocType(DocType):
     modified = FormattedDate(date_format='%Y-%m-%dT%H:%M:%S.%fZ')
     name = field.Text()
     number = field.Text()
-    sectors = field.Text(multi=True)
+    sectors = field.Keyword(multi=True)
     sectors_label = field.Text(multi=True)
     slug = field.Text()
     summary = field.Text()
@@ -80,8 +128,14 @@ def company_model_to_doc_type(company):
         website=company.website,
         has_single_sector=len(company.sectors) == 1,
     )
-    for case_study in company.supplier_case_studies.all():
-        company_doc_type.supplier_case_studies.append({
+    for case_study in company_model_to_case_studies_data(company):
+        company_doc_type.supplier_case_studies.append(case_study)
+    return company_doc_type
+
+
+def company_model_to_case_studies_data(company):
+    return [
+        {
             'description': case_study.description,
             'image_one_caption': case_study.image_one_caption,
             'image_three_caption': case_study.image_three_caption,
@@ -97,5 +151,330 @@ def company_model_to_doc_type(company):
             'testimonial_name': case_study.testimonial_name,
             'title': case_study.title,
             'website': case_study.website,
-        })
-    return company_doc_type
+        }
+        for case_study in company.supplier_case_studies.all()
+    ]
+
+
+def company_model_to_index_action(company, index=None):
+    doc = company_model_to_doc_type(company)
+    return {
+        '_index': index or CompanyDocType._doc_type.index,
+        '_type': CompanyDocType._doc_type.name,
+        '_id': doc.meta.id,
+        '_source': doc.to_dict(),
+    }
+
+
+def company_model_to_case_studies_update_action(company):
+    """
+    Partially updates the company's document with its case studies. If the
+    document is missing the whole company is indexed instead.
+
+    """
+
+    action = company_model_to_index_action(company)
+    action['_op_type'] = 'update'
+    action['upsert'] = action.pop('_source')
+    action['doc'] = {
+        'supplier_case_studies': company_model_to_case_studies_data(company)
+    }
+    return action
+
+
+def company_pk_to_delete_action(pk, index=None):
+    return {
+        '_op_type': 'delete',
+        '_index': index or CompanyDocType._doc_type.index,
+        '_type': CompanyDocType._doc_type.name,
+        '_id': pk,
+    }
+
+
+def send_bulk_actions(
+    client, actions, max_retries=BULK_MAX_RETRIES,
+    initial_backoff=BULK_INITIAL_BACKOFF
+):
+    """Sends `actions` in a single Elasticsearch bulk request.
+
+    Actions rejected because the cluster is overloaded (HTTP 429) are
+    retried with exponential backoff, other failures are raised. Deleting a
+    document that does not exist is not a failure.
+
+    Returns:
+        int -- number of successful actions
+
+    Raises:
+        elasticsearch.helpers.BulkIndexError: Actions failed or were still
+            rejected after `max_retries` retries.
+        elasticsearch.TransportError: The bulk request itself failed.
+
+    """
+
+    succeeded = 0
+    for attempt in range(max_retries + 1):
+        if attempt:
+            logger.warning(MESSAGE_BULK_REJECTED)
+            time.sleep(initial_backoff * 2 ** (attempt - 1))
+        try:
+            success, errors = bulk(
+                client, actions, chunk_size=len(actions), raise_on_error=False
+            )
+        except TransportError as error:
+            if error.status_code == 429 and attempt < max_retries:
+                continue
+            raise
+        succeeded += success
+        rejected_ids = set()
+        failed = []
+        for error in errors:
+            op_type, item = list(error.items())[0]
+            if item['status'] == 429:
+                rejected_ids.add(str(item['_id']))
+            elif not (op_type == 'delete' and item['status'] == 404):
+                failed.append(error)
+        if failed:
+            raise BulkIndexError(
+                '{} document(s) failed to index.'.format(len(failed)), failed
+            )
+        actions = [
+            action for action in actions if str(action['_id']) in rejected_ids
+        ]
+        if not actions:
+            return succeeded
+    raise BulkIndexError(
+        '{} document(s) rejected.'.format(len(actions)), actions
+    )
+
+
+def bulk_index_companies(
+    companies, index=None, chunk_size=BULK_CHUNK_SIZE,
+    thread_count=BULK_THREAD_COUNT, max_retries=BULK_MAX_RETRIES
+):
+    """Indexes `companies` through the Elasticsearch bulk API.
+
+    Companies are read from the database `chunk_size` at a time along with
+    their case studies, and each chunk is sent as one bulk request. Up to
+    `thread_count` requests are in flight at once.
+
+    Arguments:
+        companies {QuerySet} -- Companies to index
+        index {str} -- Index to write to, defaults to the doc type's index
+
+    Returns:
+        int -- number of companies indexed
+
+    """
+
+    client = connections.get_connection()
+    queryset = companies.prefetch_related('supplier_case_studies')
+    indexed = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        for chunk in iterate_queryset_in_chunks(queryset, chunk_size):
+            actions = [
+                company_model_to_index_action(company, index=index)
+                for company in chunk
+            ]
+            pending.append(executor.submit(
+                send_bulk_actions, client, actions, max_retries
+            ))
+            if len(pending) >= thread_count:
+                indexed += pending.popleft().result()
+        for future in pending:
+            indexed += future.result()
+    return indexed
+
+
+def bulk_send(actions, chunk_size=BULK_CHUNK_SIZE):
+    client = connections.get_connection()
+    succeeded = 0
+    for start in range(0, len(actions), chunk_size):
+        succeeded += send_bulk_actions(
+            client, actions[start:start + chunk_size]
+        )
+    return succeeded
+
+
+def create_company_index(name):
+    index = Index(name)
+    index.doc_type(CompanyDocType)
+    index.analyzer(analyzer('english'))
+    index.create()
+    return index
+
+
+def get_company_index_generations():
+    """Returns names of the timestamped company indices, oldest first."""
+
+    client = connections.get_connection()
+    pattern = '{alias}-*'.format(alias=CompanyDocType._doc_type.index)
+    return sorted(client.indices.get(index=pattern))
+
+
+def swap_company_index_alias(index):
+    """Atomically points the company alias at `index`.
+
+    Older deployments wrote to a concrete index with the same name as the
+    alias. It is removed in the same request that adds the alias, as an
+    alias cannot share its name, and a write in between deleting it and
+    adding the alias would create it again.
+
+    """
+
+    client = connections.get_connection()
+    alias = CompanyDocType._doc_type.index
+    actions = []
+    if client.indices.exists_alias(name=alias):
+        for name in client.indices.get_alias(name=alias):
+            actions.append({'remove': {'index': name, 'alias': alias}})
+    elif client.indices.exists(index=alias):
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': index, 'alias': alias}})
+    client.indices.update_aliases(body={'actions': actions})
+
+
+def add_to_index_queue(pk, key=INDEX_QUEUE_KEY):
+    """Adds company `pk` to a set of companies waiting to be indexed.
+
+    Arguments:
+        pk {int} -- Company pk
+        key {str} -- INDEX_QUEUE_KEY to reindex or remove the whole document,
+                     CASE_STUDIES_QUEUE_KEY to update only its case studies
+
+    Returns:
+        bool -- True if no flush of the queues is scheduled yet
+
+    """
+
+    connection = get_redis_connection('default')
+    connection.sadd(key, pk)
+    # expires in case the scheduled flush is lost, so a later save can
+    # schedule another one
+    return bool(connection.set(
+        INDEX_QUEUE_FLUSH_KEY, 1, nx=True,
+        ex=settings.SEARCH_INDEX_QUEUE_WINDOW * 2,
+    ))
+
+
+def pop_index_queue():
+    """Empties the index queues.
+
+    Returns:
+        tuple -- company pks to reindex, company pks to update case studies of
+
+    """
+
+    connection = get_redis_connection('default')
+    connection.delete(INDEX_QUEUE_FLUSH_KEY)
+    pipeline = connection.pipeline()
+    pipeline.smembers(INDEX_QUEUE_KEY)
+    pipeline.smembers(CASE_STUDIES_QUEUE_KEY)
+    pipeline.delete(INDEX_QUEUE_KEY, CASE_STUDIES_QUEUE_KEY)
+    pks, case_study_pks, _ = pipeline.execute()
+    return (
+        sorted(int(pk) for pk in pks),
+        sorted(int(pk) for pk in case_study_pks),
+    )
+
+
+def get_search_generation():
+    # starts from the current time rather than zero so results cached before
+    # the counter was evicted are not mistaken for current ones
+    cache.add(SEARCH_GENERATION_KEY, int(time.time()), timeout=None)
+    return cache.get(SEARCH_GENERATION_KEY)
+
+
+def bump_search_generation():
+    """Invalidates cached search results after documents are written."""
+
+    get_search_generation()
+    cache.incr(SEARCH_GENERATION_KEY)
+
+
+def get_search_cache_key(**params):
+    params['term'] = ' '.join(params['term'].lower().split())
+    digest = hashlib.md5(
+        json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    return 'company-search:{generation}:{digest}'.format(
+        generation=get_search_generation(), digest=digest
+    )
+
+
+def get_search_filters(
+    sectors=None, employees=None, has_single_sector=None,
+    date_of_creation_from=None, date_of_creation_to=None
+):
+    """Returns filter clauses, which Elasticsearch caches and does not score.
+    """
+
+    filters = []
+    if sectors:
+        filters.append(Q('terms', sectors=sectors))
+    if employees:
+        filters.append(Q('terms', employees=employees))
+    if has_single_sector is not None:
+        filters.append(Q('term', has_single_sector=has_single_sector))
+    date_range = {}
+    if date_of_creation_from:
+        date_range['gte'] = date_of_creation_from.isoformat()
+    if date_of_creation_to:
+        date_range['lte'] = date_of_creation_to.isoformat()
+    if date_range:
+        filters.append(Q('range', date_of_creation=date_range))
+    return filters
+
+
+def encode_search_cursor(sort_values):
+    serialized = json.dumps(sort_values).encode('utf-8')
+    return base64.urlsafe_b64encode(serialized).decode('ascii')
+
+
+def decode_search_cursor(cursor):
+    """Returns the sort values of the hit that ended the previous page.
+
+    Raises:
+        ValueError: The cursor was not created by `encode_search_cursor`.
+
+    """
+
+    try:
+        serialized = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        sort_values = json.loads(serialized.decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError(MESSAGE_INVALID_CURSOR)
+    if not isinstance(sort_values, list):
+        raise ValueError(MESSAGE_INVALID_CURSOR)
+    return sort_values
+
+
+def format_lean_results(results, size):
+    """Trims an Elasticsearch response down to what listings need.
+
+    Returns:
+        dict -- The hits, facet counts and a cursor for requesting the next
+                page, which is None on the last page.
+
+    """
+
+    hits = results.get('hits', {})
+    raw_hits = hits.get('hits', [])
+    cursor = None
+    if raw_hits and len(raw_hits) == size:
+        cursor = encode_search_cursor(raw_hits[-1]['sort'])
+    return {
+        'aggregations': results.get('aggregations', {}),
+        'hits': {
+            'total': hits.get('total', 0),
+            'hits': [
+                {
+                    '_id': hit['_id'],
+                    '_source': hit.get('_source', {}),
+                    'highlight': hit.get('highlight', {}),
+                }
+                for hit in raw_hits
+            ],
+        },
+        'cursor': cursor,
+    }
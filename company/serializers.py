@@ -1,9 +1,14 @@
-from rest_framework import serializers
+from collections import OrderedDict, defaultdict
+
+from rest_framework import relations, serializers
 
 from directory_validators import company as shared_validators
+from directory_validators.constants import choices
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import FileField
 
-from company import models, validators
+from company import models, search, validators
 
 
 class AllowedFormatImageField(serializers.ImageField):
@@ -124,6 +129,16 @@ class CompanySerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('modified', 'is_published', 'slug')
 
+    # ValuesSerializer has no instance to call method fields with
+    values_method_fields = {
+        'has_valid_address': (
+            models.Company.REQUIRED_ADDRESS_FIELDS,
+            lambda row: all(
+                row[field] for field in models.Company.REQUIRED_ADDRESS_FIELDS
+            ),
+        ),
+    }
+
     def get_has_valid_address(self, obj):
         return obj.has_valid_address()
 
@@ -146,5 +161,132 @@ class VerifyCompanyWithCodeSerializer(serializers.Serializer):
 
 class CompanySearchSerializer(serializers.Serializer):
     term = serializers.CharField()
-    page = serializers.IntegerField()
-    size = serializers.IntegerField()
+    page = serializers.IntegerField(default=1, min_value=1)
+    size = serializers.IntegerField(min_value=1)
+    lean = serializers.BooleanField(default=False)
+    cursor = serializers.CharField(default=None)
+    sectors = serializers.MultipleChoiceField(
+        choices=choices.COMPANY_CLASSIFICATIONS, default=[]
+    )
+    employees = serializers.MultipleChoiceField(
+        choices=choices.EMPLOYEES, default=[]
+    )
+    has_single_sector = serializers.NullBooleanField(default=None)
+    date_of_creation_from = serializers.DateField(default=None)
+    date_of_creation_to = serializers.DateField(default=None)
+
+    def validate_sectors(self, value):
+        return sorted(value)
+
+    def validate_employees(self, value):
+        return sorted(value)
+
+    def validate_cursor(self, value):
+        if value is None:
+            return value
+        try:
+            return search.decode_search_cursor(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+
+class ValuesSerializer:
+    """Serializes values() rows to the output of a model serializer.
+
+    The model serializer's fields are bound once and their to_representation
+    is reused for each row, so the output is identical without instantiating
+    a model instance or a field tree per row. Nested many serializers are
+    loaded with one query per page. Method fields are read from the model
+    serializer's `values_method_fields`, mapping the field name to the
+    columns it needs and a function of the row.
+
+    """
+
+    def __init__(self, serializer_class, context=None):
+        serializer = serializer_class(context=context)
+        method_fields = getattr(serializer, 'values_method_fields', {})
+        self.model = serializer.Meta.model
+        self.pk_column = self.model._meta.pk.name
+        self.columns = [self.pk_column]
+        self.nested = []
+        self.getters = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in method_fields:
+                columns, function = method_fields[name]
+                self.add_columns(*columns)
+                self.getters.append((name, function))
+            elif isinstance(field, serializers.ListSerializer):
+                self.add_nested(name, field)
+            else:
+                column = '__'.join(field.source_attrs)
+                self.add_columns(column)
+                self.getters.append(
+                    (name, self.get_column_getter(column, field))
+                )
+
+    def add_columns(self, *columns):
+        for column in columns:
+            if column not in self.columns:
+                self.columns.append(column)
+
+    def add_nested(self, name, field):
+        relation = self.model._meta.get_field(field.source)
+        nested = ValuesSerializer(type(field.child), context=field.context)
+        nested.add_columns(relation.field.name)
+        self.nested.append((name, nested, relation.field.name))
+        self.getters.append(
+            (name, lambda row, name=name: row[name])
+        )
+
+    def get_column_getter(self, column, field):
+        try:
+            model_field = self.model._meta.get_field(column)
+        except FieldDoesNotExist:
+            model_field = None
+
+        if isinstance(model_field, FileField):
+            def to_representation(value):
+                return field.to_representation(
+                    model_field.attr_class(None, model_field, value)
+                )
+        elif isinstance(field, relations.RelatedField):
+            def to_representation(value):
+                return field.to_representation(relations.PKOnlyObject(value))
+        else:
+            to_representation = field.to_representation
+
+        def getter(row):
+            value = row[column]
+            if value is None:
+                return None
+            return to_representation(value)
+        return getter
+
+    def get_values(self, queryset, *extra_columns):
+        columns = self.columns + [
+            column for column in extra_columns if column not in self.columns
+        ]
+        # prefetching does not apply to values() rows
+        return queryset.prefetch_related(None).values(*columns)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        pks = [row[self.pk_column] for row in rows]
+        for name, nested, foreign_key in self.nested:
+            grouped = defaultdict(list)
+            nested_rows = nested.get_values(
+                nested.model.objects.filter(**{foreign_key + '__in': pks})
+            )
+            nested_rows = list(nested_rows)
+            for nested_row, data in zip(
+                nested_rows, nested.serialize(nested_rows)
+            ):
+                grouped[nested_row[foreign_key]].append(data)
+            for row in rows:
+                row[name] = grouped[row[self.pk_column]]
+        return [
+            OrderedDict((name, getter(row)) for name, getter in self.getters)
+            for row in rows
+        ]
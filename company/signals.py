@@ -1,8 +1,9 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 
 
-from .utils import send_verification_letter
+from company import helpers, models, tasks
 
 
 def send_first_verification_letter(sender, instance, *args, **kwargs):
@@ -12,7 +13,7 @@ def send_first_verification_letter(sender, instance, *args, **kwargs):
     if is_disabled or is_already_sent or has_invalid_address:
         return
 
-    send_verification_letter(company=instance)
+    tasks.enqueue_first_verification_letter(instance.pk)
 
 
 def publish_companies_that_meet_criteria(sender, instance, *args, **kwargs):
@@ -30,5 +31,73 @@ def store_date_published(sender, instance, *args, **kwargs):
 
 
 def save_to_elasticsearch(sender, instance, *args, **kwargs):
-    if instance.is_published:
-        instance.to_doc_type().save()
+    # companies that have been published before may have a document that
+    # needs removing now they are unpublished
+    if instance.is_published or instance.date_published:
+        tasks.enqueue_search_index(instance.pk)
+
+
+def delete_from_elasticsearch(sender, instance, *args, **kwargs):
+    if instance.date_published:
+        tasks.enqueue_search_index(instance.pk)
+
+
+def update_case_studies_in_elasticsearch(sender, instance, *args, **kwargs):
+    for company_id in get_companies_of_case_study(instance):
+        tasks.enqueue_search_index(company_id, case_studies_only=True)
+
+
+def store_previous_company_of_case_study(sender, instance, *args, **kwargs):
+    instance.previous_company_id = (
+        models.CompanyCaseStudy.objects
+        .filter(pk=instance.pk)
+        .values_list('company_id', flat=True)
+        .first()
+    )
+
+
+def get_companies_of_case_study(instance):
+    # the case study may have been moved from another company
+    previous_company_id = getattr(instance, 'previous_company_id', None)
+    return {instance.company_id, previous_company_id} - {None}
+
+
+def update_case_study_count(sender, instance, *args, **kwargs):
+    company_ids = get_companies_of_case_study(instance)
+    is_moved = len(company_ids) > 1
+    if kwargs.get('created') is False and not is_moved:
+        return
+    for company_id in company_ids:
+        count = models.CompanyCaseStudy.objects.filter(
+            company_id=company_id
+        ).count()
+        models.Company.objects.filter(pk=company_id).update(
+            case_study_count=count,
+            has_case_studies=count > 0,
+        )
+
+
+def invalidate_public_profile_cache(sender, instance, *args, **kwargs):
+    case_study_pks = models.CompanyCaseStudy.objects.filter(
+        company_id=instance.pk
+    ).values_list('pk', flat=True)
+    cache.delete_many(
+        [helpers.get_public_profile_cache_key(instance.number)] +
+        [helpers.get_public_case_study_cache_key(pk) for pk in case_study_pks]
+    )
+
+
+def touch_company_of_case_study(sender, instance, *args, **kwargs):
+    # the company's public profile embeds its case studies, so it is modified
+    # too. The cache is cleared explicitly as update() does not send signals.
+    companies = models.Company.objects.filter(
+        pk__in=get_companies_of_case_study(instance)
+    )
+    companies.update(modified=timezone.now())
+    cache.delete_many(
+        [helpers.get_public_case_study_cache_key(instance.pk)] +
+        [
+            helpers.get_public_profile_cache_key(number)
+            for number in companies.values_list('number', flat=True)
+        ]
+    )
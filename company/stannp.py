@@ -1,20 +1,33 @@
 from django.conf import settings
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 
 class StannpClient():
 
-    def __init__(self, api_key, test_mode=True):
+    def __init__(self, api_key, test_mode=True, timeout=None, pool_size=4):
         self.api_key = api_key
         # If test_mode is set to true then a sample PDF file will be produced
         # but the item will never be dispatched and no charge will be taken.
         self.test_mode = test_mode
+        self.timeout = timeout
+        # Connections are reused across letters. Only failures to connect are
+        # retried here: the request was never sent so it cannot double post.
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, read=0, backoff_factor=0.5),
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
 
     def post(self, url, data):
-        response = requests.post(
-            url, data=data, auth=(self.api_key, '')
+        response = self.session.post(
+            url, data=data, auth=(self.api_key, ''), timeout=self.timeout
         )
+        response.raise_for_status()
         return response.json()
 
     def validate_recipient(self, recipient):
@@ -60,5 +73,6 @@ class StannpClient():
 
 stannp_client = StannpClient(
     api_key=settings.STANNP_API_KEY,
-    test_mode=settings.STANNP_TEST_MODE
+    test_mode=settings.STANNP_TEST_MODE,
+    timeout=settings.STANNP_TIMEOUT,
 )
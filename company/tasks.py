@@ -0,0 +1,200 @@
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from elasticsearch import TransportError
+from elasticsearch.helpers import BulkIndexError
+import requests
+
+from api.celery import app
+from api.utils import SharedRateLimiter
+from company import models, search, utils
+from company.stannp import stannp_client
+
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_LETTER_KEY = 'verification-letter:{dispatch_id}:{pk}'
+# Must outlive every retry of a dispatch
+VERIFICATION_LETTER_KEY_TIMEOUT = 60 * 60 * 24 * 7
+VERIFICATION_LETTER_RETRY_BACKOFF = 60
+FIRST_VERIFICATION_LETTER_DISPATCH_ID = 'first'
+FIRST_VERIFICATION_LETTER_QUEUED_KEY = 'first-verification-letter-queued:{pk}'
+FIRST_VERIFICATION_LETTER_QUEUED_TIMEOUT = 60 * 10
+# Letters are throttled to Stannp's rate limit across every worker by
+# stannp_rate_limiter. This only stops the chunks picked up by one worker
+# from holding its slots while they wait for the limiter.
+VERIFICATION_LETTER_TASK_RATE_LIMIT = '{}/h'.format(max(
+    1,
+    3600 * settings.STANNP_REQUESTS_PER_SECOND //
+    settings.STANNP_LETTER_CHUNK_SIZE
+))
+stannp_rate_limiter = SharedRateLimiter(
+    name='stannp', rate=settings.STANNP_REQUESTS_PER_SECOND
+)
+
+
+def enqueue_search_index(pk, case_studies_only=False):
+    """
+    Queues the company's search document to be updated by the next flush of
+    the index queues. Changes to the same company before the flush result in
+    one operation.
+
+    Arguments:
+        pk {int} -- Company pk
+        case_studies_only {bool} -- Only the company's case studies changed
+
+    """
+
+    key = search.INDEX_QUEUE_KEY
+    if case_studies_only:
+        key = search.CASE_STUDIES_QUEUE_KEY
+    if search.add_to_index_queue(pk, key=key):
+        flush_search_index_queue.apply_async(
+            countdown=settings.SEARCH_INDEX_QUEUE_WINDOW
+        )
+
+
+def get_index_queue_actions(pks, case_study_pks):
+    companies = (
+        models.Company.objects
+        .filter(pk__in=set(pks) | set(case_study_pks))
+        .prefetch_related('supplier_case_studies')
+    )
+    companies_by_pk = {company.pk: company for company in companies}
+    actions = []
+    for pk in pks:
+        company = companies_by_pk.get(pk)
+        if company and company.is_published:
+            actions.append(search.company_model_to_index_action(company))
+        else:
+            # unpublished or deleted
+            actions.append(search.company_pk_to_delete_action(pk))
+    for pk in case_study_pks:
+        company = companies_by_pk.get(pk)
+        if pk not in pks and company and company.is_published:
+            actions.append(
+                search.company_model_to_case_studies_update_action(company)
+            )
+    return actions
+
+
+@app.task(bind=True, max_retries=3)
+def flush_search_index_queue(self, pks=None, case_study_pks=None):
+    if pks is None:
+        pks, case_study_pks = search.pop_index_queue()
+    actions = get_index_queue_actions(pks, case_study_pks or [])
+    if not actions:
+        return
+    try:
+        search.bulk_send(actions)
+    except (BulkIndexError, TransportError) as exc:
+        raise self.retry(
+            exc=exc,
+            kwargs={'pks': pks, 'case_study_pks': case_study_pks},
+            countdown=settings.SEARCH_INDEX_QUEUE_WINDOW,
+        )
+    search.bump_search_generation()
+
+
+def dispatch_verification_letters(pks, dispatch_id=None):
+    """
+    Queues verification letters to be sent to the companies, in chunks of
+    STANNP_LETTER_CHUNK_SIZE. A letter is posted at most once per
+    dispatch_id, so retried chunks do not resend letters.
+
+    Arguments:
+        pks {list} -- Company pks
+        dispatch_id {str} -- Identifies the dispatch. Random by default.
+
+    Returns:
+        str -- the dispatch_id
+
+    """
+
+    dispatch_id = dispatch_id or uuid.uuid4().hex
+    pks = list(pks)
+    size = settings.STANNP_LETTER_CHUNK_SIZE
+    for i in range(0, len(pks), size):
+        send_verification_letters.delay(
+            pks=pks[i:i + size], dispatch_id=dispatch_id
+        )
+    return dispatch_id
+
+
+def enqueue_first_verification_letter(pk):
+    """
+    Queues the company's first verification letter to be sent once the
+    current transaction commits. Saves before the letter is sent do not
+    queue it again, and the letter is sent at most once regardless.
+
+    Arguments:
+        pk {int} -- Company pk
+
+    """
+
+    def queue_letter():
+        # only once committed, so a rolled back save does not block the next
+        key = FIRST_VERIFICATION_LETTER_QUEUED_KEY.format(pk=pk)
+        if cache.add(key, True, FIRST_VERIFICATION_LETTER_QUEUED_TIMEOUT):
+            send_verification_letters.delay(
+                pks=[pk], dispatch_id=FIRST_VERIFICATION_LETTER_DISPATCH_ID
+            )
+
+    transaction.on_commit(queue_letter)
+
+
+@app.task(
+    bind=True,
+    max_retries=settings.STANNP_MAX_RETRIES,
+    rate_limit=VERIFICATION_LETTER_TASK_RATE_LIMIT,
+)
+def send_verification_letters(self, pks, dispatch_id):
+    companies = models.Company.objects.filter(
+        pk__in=pks, verified_with_code=False
+    ).order_by('pk')
+    sent = []
+    failed = []
+    error = None
+    for company in companies:
+        key = VERIFICATION_LETTER_KEY.format(
+            dispatch_id=dispatch_id, pk=company.pk
+        )
+        if not cache.add(key, True, VERIFICATION_LETTER_KEY_TIMEOUT):
+            continue
+        stannp_rate_limiter.consume()
+        try:
+            stannp_client.send_letter(
+                template=settings.STANNP_VERIFICATION_LETTER_TEMPLATE_ID,
+                recipient=utils.get_verification_letter_recipient(company),
+            )
+        except requests.HTTPError as exc:
+            cache.delete(key)
+            status_code = exc.response.status_code
+            if status_code == 429 or status_code >= 500:
+                failed.append(company.pk)
+                error = exc
+            else:
+                logger.exception('Stannp rejected letter to %s', company.pk)
+        except requests.ConnectionError as exc:
+            cache.delete(key)
+            failed.append(company.pk)
+            error = exc
+        except requests.Timeout:
+            # Stannp may have created the letter, so it is not retried
+            logger.exception('Timed out sending letter to %s', company.pk)
+        else:
+            sent.append(company.pk)
+    if sent:
+        utils.mark_verification_letters_sent(sent)
+    if failed:
+        raise self.retry(
+            exc=error,
+            kwargs={'pks': failed, 'dispatch_id': dispatch_id},
+            countdown=(
+                VERIFICATION_LETTER_RETRY_BACKOFF * 2 ** self.request.retries
+            ),
+        )
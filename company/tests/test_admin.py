@@ -202,7 +202,8 @@ class DownloadCaseStudyCSVTestCase(TestCase):
             id=case_study.id,
 
         )
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
 
         assert actual[0] == self.headers
         assert actual[1] == row_one
@@ -254,7 +255,8 @@ class DownloadCaseStudyCSVTestCase(TestCase):
             id=case_studies[0].id,
         )
 
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
 
         assert actual[0] == self.headers
         assert actual[1] == row_one
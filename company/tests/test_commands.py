@@ -1,11 +1,16 @@
-from datetime import date
-from unittest.mock import patch
+from datetime import date, datetime
+from unittest.mock import call, patch, Mock
 
+from freezegun import freeze_time
 import pytest
+import requests
 
+from django.core.cache import cache
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.timezone import utc
 
-from company import models
+from company import helpers, models, search
 from company.tests.factories import CompanyFactory
 
 
@@ -30,3 +35,186 @@ def test_retrieve_missing_company_details(mock_get_date_of_creation):
     assert models.Company.objects.get(
         number=companies[1].number
     ).date_of_creation == date(2010, 10, 10)
+
+
+@pytest.mark.django_db
+@patch('company.tasks.enqueue_search_index')
+@patch('company.helpers.get_date_of_creation')
+def test_retrieve_missing_company_details_touches_updated_companies(
+    mock_get_date_of_creation, mock_enqueue_search_index
+):
+    published = CompanyFactory(date_of_creation=None, is_published=True)
+    unpublished = CompanyFactory(date_of_creation=None, is_published=False)
+    profile_key = helpers.get_public_profile_cache_key(published.number)
+    cache.set(profile_key, 'profile')
+    mock_get_date_of_creation.return_value = date(2010, 10, 10)
+    mock_enqueue_search_index.reset_mock()
+
+    with freeze_time('2017-07-01 12:00:00'):
+        call_command('retrieve_missing_company_details')
+
+    published.refresh_from_db()
+    unpublished.refresh_from_db()
+    assert published.modified == datetime(2017, 7, 1, 12, tzinfo=utc)
+    assert unpublished.modified == datetime(2017, 7, 1, 12, tzinfo=utc)
+    assert cache.get(profile_key) is None
+    mock_enqueue_search_index.assert_called_once_with(published.pk)
+
+
+@pytest.mark.django_db
+@patch('company.helpers.get_companies_house_profile')
+def test_retrieve_missing_company_details_cached(
+    mock_get_companies_house_profile
+):
+    company = CompanyFactory(date_of_creation=None)
+    cache.set(
+        'companies-house-profile:' + company.number,
+        {'date_of_creation': '2010-10-10'}
+    )
+
+    call_command('retrieve_missing_company_details')
+
+    company.refresh_from_db()
+    assert company.date_of_creation == date(2010, 10, 10)
+    assert mock_get_companies_house_profile.called is False
+
+
+@pytest.mark.django_db
+@patch('company.helpers.get_date_of_creation')
+def test_retrieve_missing_company_details_error(mock_get_date_of_creation):
+    companies = CompanyFactory.create_batch(2, date_of_creation=None)
+    mock_get_date_of_creation.side_effect = [
+        requests.exceptions.HTTPError(), date(2010, 10, 10),
+    ]
+
+    call_command('retrieve_missing_company_details', workers=1)
+
+    companies[0].refresh_from_db()
+    companies[1].refresh_from_db()
+    assert companies[0].date_of_creation is None
+    assert companies[1].date_of_creation == date(2010, 10, 10)
+
+
+@pytest.mark.django_db
+@patch('company.helpers.get_date_of_creation')
+def test_retrieve_missing_company_details_resumes(mock_get_date_of_creation):
+    mock_get_date_of_creation.return_value = date(2010, 10, 10)
+    companies = CompanyFactory.create_batch(2, date_of_creation=None)
+    cache.set(
+        'retrieve-missing-company-details:checkpoint', companies[0].pk
+    )
+
+    call_command('retrieve_missing_company_details')
+
+    assert mock_get_date_of_creation.call_count == 1
+    assert mock_get_date_of_creation.call_args[0] == (companies[1].number,)
+    assert cache.get('retrieve-missing-company-details:checkpoint') is None
+
+
+@pytest.mark.django_db
+@patch('company.search.bulk_index_companies')
+def test_populate_elasticsearch(mock_bulk_index_companies):
+    mock_bulk_index_companies.return_value = 1
+    published = CompanyFactory(is_published=True)
+    CompanyFactory(is_published=False)
+
+    call_command(
+        'populate_elasticsearch', chunk_size=10, workers=2, max_retries=1
+    )
+
+    assert mock_bulk_index_companies.call_count == 1
+    companies = mock_bulk_index_companies.call_args[0][0]
+    assert list(companies) == [published]
+    assert mock_bulk_index_companies.call_args[1] == {
+        'chunk_size': 10,
+        'thread_count': 2,
+        'max_retries': 1,
+    }
+
+
+@pytest.mark.django_db
+@freeze_time('2017-07-01 12:00:00')
+@patch('company.management.commands.rebuild_elasticsearch_index.Index')
+@patch('company.search.get_company_index_generations')
+@patch('company.search.swap_company_index_alias')
+@patch('company.search.CompanyDocType.search')
+@patch('company.search.bulk_index_companies')
+@patch('company.search.create_company_index')
+def test_rebuild_elasticsearch_index(
+    mock_create_company_index, mock_bulk_index_companies, mock_search,
+    mock_swap_company_index_alias, mock_get_company_index_generations,
+    mock_index
+):
+    CompanyFactory.create_batch(2, is_published=True)
+    mock_search().count.return_value = 2
+    mock_get_company_index_generations.return_value = [
+        'company-1', 'company-2', 'company-20170701120000000000',
+    ]
+
+    call_command('rebuild_elasticsearch_index')
+
+    name = 'company-20170701120000000000'
+    mock_create_company_index.assert_called_once_with(name)
+    assert mock_bulk_index_companies.call_args[1] == {'index': name}
+    mock_swap_company_index_alias.assert_called_once_with(name)
+    mock_index.assert_called_once_with('company-1')
+    assert mock_index().delete.call_count == 1
+
+
+@pytest.mark.django_db
+@freeze_time('2017-07-01 12:00:00')
+@patch('company.management.commands.rebuild_elasticsearch_index.Index')
+@patch('company.search.get_company_index_generations', Mock(return_value=[]))
+@patch('company.search.swap_company_index_alias', Mock())
+@patch('company.search.bulk_send')
+@patch('company.search.bulk_index_companies')
+@patch('company.search.CompanyDocType.search')
+@patch('company.search.create_company_index')
+def test_rebuild_elasticsearch_index_removes_companies_changed_during_build(
+    mock_create_company_index, mock_search, mock_bulk_index_companies,
+    mock_bulk_send, mock_index
+):
+    unpublished, deleted, published = CompanyFactory.create_batch(
+        3, is_published=True
+    )
+    mock_search().count.return_value = 1
+
+    def change_companies(*args, **kwargs):
+        # companies change while the new index is being populated
+        mock_bulk_index_companies.side_effect = None
+        models.Company.objects.filter(pk=unpublished.pk).update(
+            is_published=False
+        )
+        models.Company.objects.filter(pk=deleted.pk).delete()
+
+    mock_bulk_index_companies.side_effect = change_companies
+
+    call_command('rebuild_elasticsearch_index')
+
+    name = 'company-20170701120000000000'
+    # the build, a catch up before the swap and another after it
+    assert mock_bulk_index_companies.call_count == 3
+    assert mock_bulk_send.call_args_list == [
+        call([
+            search.company_pk_to_delete_action(unpublished.pk, index=name),
+            search.company_pk_to_delete_action(deleted.pk, index=name),
+        ])
+    ] * 2
+
+
+@pytest.mark.django_db
+@patch('company.search.swap_company_index_alias')
+@patch('company.search.CompanyDocType.search')
+@patch('company.search.bulk_index_companies', Mock())
+@patch('company.search.create_company_index')
+def test_rebuild_elasticsearch_index_count_mismatch(
+    mock_create_company_index, mock_search, mock_swap_company_index_alias
+):
+    CompanyFactory.create_batch(2, is_published=True)
+    mock_search().count.return_value = 1
+
+    with pytest.raises(CommandError):
+        call_command('rebuild_elasticsearch_index')
+
+    assert mock_create_company_index().delete.call_count == 1
+    assert mock_swap_company_index_alias.called is False
@@ -95,6 +95,66 @@ def test_path_and_rename_logos_no_extension():
     assert actual.startswith('company_logos')
 
 
+@mock.patch.object(helpers, 'get_companies_house_profile')
+def test_get_cached_companies_house_profile(mock_get_companies_house_profile):
+    mock_get_companies_house_profile.return_value = profile_api_200()
+    helpers.companies_house_profile_cache_stats.clear()
+
+    for i in range(2):
+        profile = helpers.get_cached_companies_house_profile('01234567')
+    helpers.companies_house_profile_cache.clear()
+    helpers.get_cached_companies_house_profile('01234567')
+
+    assert profile == {'date_of_creation': '1987-12-31'}
+    assert mock_get_companies_house_profile.call_count == 1
+    assert helpers.companies_house_profile_cache_stats == {
+        'miss': 1, 'local_hit': 1, 'hit': 1
+    }
+
+
+@mock.patch.object(helpers, 'get_companies_house_profile')
+def test_get_cached_companies_house_profile_not_found(
+    mock_get_companies_house_profile
+):
+    response = Response()
+    response.status_code = http.client.NOT_FOUND
+    mock_get_companies_house_profile.return_value = response
+
+    for i in range(2):
+        profile = helpers.get_cached_companies_house_profile('01234567')
+
+    assert profile is None
+    assert mock_get_companies_house_profile.call_count == 1
+
+
+@mock.patch.object(helpers, 'get_companies_house_profile')
+def test_get_cached_companies_house_profile_error_not_cached(
+    mock_get_companies_house_profile
+):
+    mock_get_companies_house_profile.return_value = profile_api_400()
+
+    for i in range(2):
+        with pytest.raises(HTTPError):
+            helpers.get_cached_companies_house_profile('01234567')
+
+    assert mock_get_companies_house_profile.call_count == 2
+
+
+@mock.patch.object(helpers, 'get_companies_house_profile')
+def test_get_cached_companies_house_profile_rate_limiter(
+    mock_get_companies_house_profile
+):
+    mock_get_companies_house_profile.return_value = profile_api_200()
+    rate_limiter = Mock()
+
+    for i in range(2):
+        helpers.get_cached_companies_house_profile(
+            '01234567', rate_limiter=rate_limiter
+        )
+
+    assert rate_limiter.consume.call_count == 1
+
+
 @mock.patch.object(helpers, 'get_companies_house_profile')
 def test_get_date_of_creation_response_ok(mock_get_companies_house_profile):
     mock_get_companies_house_profile.return_value = profile_api_200()
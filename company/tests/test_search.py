@@ -1,9 +1,13 @@
 import datetime
+from unittest.mock import call, patch, Mock
 
+from elasticsearch import TransportError
+from elasticsearch.helpers import BulkIndexError
 from freezegun import freeze_time
 import pytest
 
 from company import search
+from company.models import Company
 from company.tests import factories
 
 
@@ -72,3 +76,267 @@ def test_company_doc_type_single_sector():
     doc = search.company_model_to_doc_type(company)
 
     assert doc.to_dict()['has_single_sector'] is True
+
+
+@pytest.mark.django_db
+def test_company_model_to_index_action():
+    company = factories.CompanyFactory()
+
+    action = search.company_model_to_index_action(company, index='test')
+
+    assert action == {
+        '_index': 'test',
+        '_type': 'company_doc_type',
+        '_id': company.pk,
+        '_source': search.company_model_to_doc_type(company).to_dict(),
+    }
+
+
+@patch('company.search.bulk')
+def test_send_bulk_actions(mock_bulk):
+    mock_bulk.return_value = (2, [])
+    actions = [{'_id': 1}, {'_id': 2}]
+
+    assert search.send_bulk_actions(Mock(), actions) == 2
+    assert mock_bulk.call_count == 1
+
+
+@patch('company.search.time.sleep', Mock())
+@patch('company.search.bulk')
+def test_send_bulk_actions_retries_rejected(mock_bulk):
+    mock_bulk.side_effect = [
+        (1, [{'index': {'_id': 2, 'status': 429}}]),
+        (1, []),
+    ]
+    client = Mock()
+    actions = [{'_id': 1}, {'_id': 2}]
+
+    assert search.send_bulk_actions(client, actions) == 2
+    assert mock_bulk.call_args_list[1] == call(
+        client, [{'_id': 2}], chunk_size=1, raise_on_error=False
+    )
+
+
+@patch('company.search.time.sleep', Mock())
+@patch('company.search.bulk')
+def test_send_bulk_actions_retries_rejected_request(mock_bulk):
+    mock_bulk.side_effect = [TransportError(429, 'rejected'), (1, [])]
+
+    assert search.send_bulk_actions(Mock(), [{'_id': 1}]) == 1
+    assert mock_bulk.call_count == 2
+
+
+@patch('company.search.time.sleep', Mock())
+@patch('company.search.bulk')
+def test_send_bulk_actions_gives_up(mock_bulk):
+    mock_bulk.return_value = (0, [{'index': {'_id': 1, 'status': 429}}])
+
+    with pytest.raises(BulkIndexError):
+        search.send_bulk_actions(Mock(), [{'_id': 1}], max_retries=2)
+
+    assert mock_bulk.call_count == 3
+
+
+@patch('company.search.bulk')
+def test_send_bulk_actions_raises_errors(mock_bulk):
+    mock_bulk.return_value = (0, [{'index': {'_id': 1, 'status': 400}}])
+
+    with pytest.raises(BulkIndexError):
+        search.send_bulk_actions(Mock(), [{'_id': 1}])
+
+    assert mock_bulk.call_count == 1
+
+
+@pytest.mark.django_db
+@patch('company.search.send_bulk_actions')
+def test_bulk_index_companies(mock_send_bulk_actions):
+    mock_send_bulk_actions.side_effect = lambda client, actions, retries: (
+        len(actions)
+    )
+    companies = factories.CompanyFactory.create_batch(5)
+    factories.CompanyCaseStudyFactory(company=companies[0])
+
+    indexed = search.bulk_index_companies(
+        Company.objects.all(), chunk_size=2, thread_count=2
+    )
+
+    assert indexed == 5
+    assert mock_send_bulk_actions.call_count == 3
+    sent_ids = [
+        action['_id']
+        for call_args in mock_send_bulk_actions.call_args_list
+        for action in call_args[0][1]
+    ]
+    assert sent_ids == sorted(company.pk for company in companies)
+
+
+@patch('company.search.connections.get_connection')
+def test_swap_company_index_alias(mock_get_connection):
+    client = mock_get_connection()
+    client.indices.exists_alias.return_value = True
+    client.indices.get_alias.return_value = {'company-1': {}}
+
+    search.swap_company_index_alias('company-2')
+
+    client.indices.update_aliases.assert_called_once_with(body={
+        'actions': [
+            {'remove': {'index': 'company-1', 'alias': 'company'}},
+            {'add': {'index': 'company-2', 'alias': 'company'}},
+        ]
+    })
+    assert client.indices.delete.called is False
+
+
+@patch('company.search.connections.get_connection')
+def test_swap_company_index_alias_replaces_concrete_index(
+    mock_get_connection
+):
+    client = mock_get_connection()
+    client.indices.exists_alias.return_value = False
+    client.indices.exists.return_value = True
+
+    search.swap_company_index_alias('company-2')
+
+    client.indices.update_aliases.assert_called_once_with(body={
+        'actions': [
+            {'remove_index': {'index': 'company'}},
+            {'add': {'index': 'company-2', 'alias': 'company'}},
+        ]
+    })
+    assert client.indices.delete.called is False
+
+
+def test_add_to_index_queue(mock_redis_connection, settings):
+    settings.SEARCH_INDEX_QUEUE_WINDOW = 3
+    connection = mock_redis_connection()
+    connection.set.return_value = True
+
+    assert search.add_to_index_queue(1) is True
+    connection.sadd.assert_called_once_with(search.INDEX_QUEUE_KEY, 1)
+    connection.set.assert_called_once_with(
+        search.INDEX_QUEUE_FLUSH_KEY, 1, nx=True, ex=6
+    )
+
+
+def test_add_to_index_queue_case_studies(mock_redis_connection):
+    connection = mock_redis_connection()
+
+    search.add_to_index_queue(1, key=search.CASE_STUDIES_QUEUE_KEY)
+
+    connection.sadd.assert_called_once_with(search.CASE_STUDIES_QUEUE_KEY, 1)
+
+
+def test_add_to_index_queue_flush_scheduled(mock_redis_connection):
+    mock_redis_connection().set.return_value = None
+
+    assert search.add_to_index_queue(1) is False
+
+
+def test_pop_index_queue(mock_redis_connection):
+    connection = mock_redis_connection()
+    connection.pipeline().execute.return_value = [{b'2', b'10'}, {b'3'}, 2]
+
+    assert search.pop_index_queue() == ([2, 10], [3])
+    connection.delete.assert_called_once_with(search.INDEX_QUEUE_FLUSH_KEY)
+
+
+@pytest.mark.django_db
+def test_company_model_to_case_studies_update_action():
+    company = factories.CompanyFactory()
+    case_study = factories.CompanyCaseStudyFactory(company=company)
+
+    action = search.company_model_to_case_studies_update_action(company)
+
+    assert action['_op_type'] == 'update'
+    assert action['_id'] == company.pk
+    assert action['doc'] == {
+        'supplier_case_studies': [
+            search.company_model_to_case_studies_data(company)[0]
+        ]
+    }
+    assert action['doc']['supplier_case_studies'][0]['pk'] == case_study.pk
+    assert action['upsert'] == (
+        search.company_model_to_doc_type(company).to_dict()
+    )
+
+
+@pytest.mark.django_db
+def test_company_model_to_case_studies_update_action_no_case_studies():
+    company = factories.CompanyFactory()
+
+    action = search.company_model_to_case_studies_update_action(company)
+
+    assert action['doc'] == {'supplier_case_studies': []}
+
+
+@patch('company.search.bulk')
+def test_send_bulk_actions_ignores_missing_deletes(mock_bulk):
+    mock_bulk.return_value = (0, [{'delete': {'_id': 1, 'status': 404}}])
+
+    assert search.send_bulk_actions(Mock(), [{'_id': 1}]) == 0
+
+
+@patch('company.search.send_bulk_actions')
+@patch('company.search.connections.get_connection')
+def test_bulk_send(mock_get_connection, mock_send_bulk_actions):
+    mock_send_bulk_actions.return_value = 2
+    actions = [{'_id': 1}, {'_id': 2}, {'_id': 3}]
+
+    assert search.bulk_send(actions, chunk_size=2) == 4
+    assert mock_send_bulk_actions.call_args_list == [
+        call(mock_get_connection(), actions[:2]),
+        call(mock_get_connection(), actions[2:]),
+    ]
+
+
+def test_bump_search_generation():
+    generation = search.get_search_generation()
+
+    search.bump_search_generation()
+
+    assert search.get_search_generation() == generation + 1
+
+
+def test_get_search_cache_key_normalises_term():
+    key = search.get_search_cache_key(term=' Bones  Tools', page=1, size=10)
+
+    assert key == search.get_search_cache_key(
+        term='bones tools', page=1, size=10
+    )
+    assert key != search.get_search_cache_key(
+        term='bones tools', page=2, size=10
+    )
+
+
+def test_get_search_cache_key_changes_with_generation():
+    key = search.get_search_cache_key(term='bones', page=1, size=10)
+
+    search.bump_search_generation()
+
+    assert key != search.get_search_cache_key(term='bones', page=1, size=10)
+
+
+def test_search_cursor_round_trip():
+    cursor = search.encode_search_cursor([1.5, 10])
+
+    assert search.decode_search_cursor(cursor) == [1.5, 10]
+
+
+@pytest.mark.parametrize('cursor', ['!!', 'e30=', 'bm90IGpzb24='])
+def test_decode_search_cursor_invalid(cursor):
+    with pytest.raises(ValueError):
+        search.decode_search_cursor(cursor)
+
+
+def test_format_lean_results_last_page():
+    results = {
+        'hits': {
+            'total': 1,
+            'hits': [{'_id': '1', '_source': {}, 'sort': [1.0, 1]}],
+        },
+    }
+
+    formatted = search.format_lean_results(results, size=2)
+
+    assert formatted['cursor'] is None
+    assert formatted['hits']['total'] == 1
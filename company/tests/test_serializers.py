@@ -8,10 +8,13 @@ from directory_validators import company as shared_validators
 from django.utils.timezone import UTC
 
 from directory_validators.constants import choices
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
 from company.tests import VALID_REQUEST_DATA
 from company import models, serializers, validators
-from company.tests.factories import CompanyFactory
+from company.tests.factories import CompanyFactory, CompanyCaseStudyFactory
 
 
 @pytest.fixture
@@ -199,6 +202,55 @@ def test_company_serializer_nested_case_study(
     assert case_studies[1] in serializer.data['supplier_case_studies']
 
 
+@pytest.mark.django_db
+def test_values_serializer_matches_company_serializer(
+    company, company_case_study_one, company_case_study_two
+):
+    CompanyFactory(
+        logo='logo.png', sectors=['AEROSPACE'], date_of_creation=None,
+        postal_full_name='Jim', address_line_1='1 Road', postal_code='N1',
+    )
+    CompanyCaseStudyFactory(image_one='image.png')
+    models.Company.objects.filter(pk=company.pk).update(modified=None)
+    context = {'request': Request(APIRequestFactory().get('/'))}
+    queryset = models.Company.objects.order_by('pk')
+
+    expected = serializers.CompanySerializer(
+        queryset.prefetch_related('supplier_case_studies'),
+        many=True,
+        context=context,
+    ).data
+    values_serializer = serializers.ValuesSerializer(
+        serializers.CompanySerializer, context=context
+    )
+    actual = values_serializer.serialize(
+        values_serializer.get_values(queryset)
+    )
+
+    renderer = JSONRenderer()
+    assert renderer.render(actual) == renderer.render(expected)
+
+
+@pytest.mark.django_db
+def test_values_serializer_matches_case_study_serializer(
+    company_case_study_one, company_case_study_two
+):
+    queryset = models.CompanyCaseStudy.objects.order_by('pk')
+
+    expected = serializers.CompanyCaseStudySerializer(
+        queryset, many=True
+    ).data
+    values_serializer = serializers.ValuesSerializer(
+        serializers.CompanyCaseStudySerializer
+    )
+    actual = values_serializer.serialize(
+        values_serializer.get_values(queryset)
+    )
+
+    renderer = JSONRenderer()
+    assert renderer.render(actual) == renderer.render(expected)
+
+
 def test_company_number_serializer_validators():
     serializer = serializers.CompanyNumberValidatorSerializer()
     field = serializer.get_fields()['number']
@@ -6,22 +6,33 @@ import pytest
 
 from django.utils import timezone
 
-from company.tests.factories import CompanyFactory
+from company import tasks
+from company.models import Company
+from company.tests.factories import CompanyFactory, CompanyCaseStudyFactory
 
 
 @pytest.mark.django_db
-def test_sends_verification_letter_post_save(settings):
+@mock.patch('api.utils.time.sleep', mock.Mock())
+@mock.patch('company.tasks.send_verification_letters.delay')
+@mock.patch('company.tasks.transaction.on_commit')
+def test_sends_verification_letter_post_save(
+    mock_on_commit, mock_delay, settings
+):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
+    mock_on_commit.side_effect = lambda func: func()
+    mock_delay.side_effect = tasks.send_verification_letters.run
 
-    with mock.patch('requests.post') as requests_mock:
+    with mock.patch('requests.Session.post') as requests_mock:
         company = CompanyFactory()
 
     company.refresh_from_db()
     assert company.verification_code
+    assert company.is_verification_letter_sent is True
 
     requests_mock.assert_called_once_with(
         'https://dash.stannp.com/api/v1/letters/create',
         auth=('debug', ''),
+        timeout=10,
         data={
             'test': True,
             'recipient[company_name]': company.name,
@@ -41,79 +52,98 @@ def test_sends_verification_letter_post_save(settings):
 
 
 @pytest.mark.django_db
-def test_does_not_send_verification_letter_on_update(settings):
+@mock.patch('company.tasks.send_verification_letters.delay')
+def test_sends_verification_letter_on_commit(mock_delay, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
 
-    with mock.patch('requests.post') as requests_mock:
-        company = CompanyFactory(name="Original name")
-        company.name = "Changed name"
+    with mock.patch('company.tasks.transaction.on_commit') as mock_on_commit:
+        company = CompanyFactory()
+
+    assert mock_delay.called is False
+    assert mock_on_commit.call_count == 1
+
+    mock_on_commit.call_args[0][0]()
+
+    mock_delay.assert_called_once_with(pks=[company.pk], dispatch_id='first')
+
+
+@pytest.mark.django_db
+@mock.patch('company.tasks.send_verification_letters.delay')
+@mock.patch('company.tasks.transaction.on_commit')
+def test_does_not_queue_verification_letter_twice(
+    mock_on_commit, mock_delay, settings
+):
+    settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
+    mock_on_commit.side_effect = lambda func: func()
+
+    company = CompanyFactory(name="Original name")
+    company.name = "Changed name"
+    company.save()
+
+    assert mock_delay.call_count == 1
+
+
+@pytest.mark.django_db
+@mock.patch('company.tasks.send_verification_letters.delay')
+def test_queues_verification_letter_after_rolled_back_save(
+    mock_delay, settings
+):
+    settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
+
+    # the transaction is rolled back, so the callback never runs
+    with mock.patch('company.tasks.transaction.on_commit'):
+        company = CompanyFactory()
+
+    with mock.patch('company.tasks.transaction.on_commit') as mock_on_commit:
         company.save()
+    mock_on_commit.call_args[0][0]()
 
-    requests_mock.assert_called_once_with(
-        'https://dash.stannp.com/api/v1/letters/create',
-        auth=('debug', ''),
-        data={
-            'test': True,
-            'recipient[company_name]': 'Original name',
-            'recipient[country]': company.country,
-            'recipient[date]': datetime.date.today().strftime('%d/%m/%Y'),
-            'recipient[address1]': company.address_line_1,
-            'recipient[full_name]': company.postal_full_name,
-            'recipient[city]': company.locality,
-            'recipient[company]': 'Original name',
-            'recipient[postcode]': company.postal_code,
-            'recipient[title]': company.postal_full_name,
-            'recipient[address2]': company.address_line_2,
-            'recipient[verification_code]': company.verification_code,
-            'template': 'debug'
-        },
-    )
+    mock_delay.assert_called_once_with(pks=[company.pk], dispatch_id='first')
 
 
 @pytest.mark.django_db
 def test_does_not_overwrite_verification_code_if_already_set(settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
 
-    with mock.patch('requests.post'):
-        company = CompanyFactory(verification_code='test')
+    company = CompanyFactory(verification_code='test')
 
     company.refresh_from_db()
     assert company.verification_code == 'test'
 
 
 @pytest.mark.django_db
-@mock.patch('company.signals.send_verification_letter')
-def test_does_not_send_if_letter_already_sent(mock_send_letter, settings):
+@mock.patch('company.tasks.enqueue_first_verification_letter')
+def test_does_not_send_if_letter_already_sent(mock_enqueue_letter, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
     CompanyFactory(
         is_verification_letter_sent=True,
         verification_code='test',
     )
 
-    mock_send_letter.assert_not_called()
+    mock_enqueue_letter.assert_not_called()
 
 
 @pytest.mark.django_db
 @freeze_time()
-@mock.patch('company.signals.send_verification_letter')
-def test_letter_sent(mock_send_letter, settings):
+@mock.patch('company.tasks.enqueue_first_verification_letter')
+def test_letter_sent(mock_enqueue_letter, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
     company = CompanyFactory(verification_code='test')
 
-    mock_send_letter.assert_called_with(company=company)
+    mock_enqueue_letter.assert_called_with(company.pk)
 
 
 @pytest.mark.django_db
-@mock.patch('company.signals.send_verification_letter')
+@mock.patch('company.tasks.enqueue_first_verification_letter')
 @mock.patch(
     'company.models.Company.has_valid_address',
     mock.Mock(return_value=False)
 )
-def test_unknown_address_not_send_letters(mock_send_letter, settings):
+def test_unknown_address_not_send_letters(mock_enqueue_letter, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
     CompanyFactory()
 
-    mock_send_letter.send_letter.assert_not_called()
+    mock_enqueue_letter.assert_not_called()
 
 
 @pytest.mark.django_db
@@ -261,14 +291,148 @@ def test_store_date_published_published_company_with_date():
 
 
 @pytest.mark.django_db
-def test_save_to_elasticsearch_published(mock_elasticsearch_company_save):
-    CompanyFactory(is_published=True)
+@mock.patch('company.tasks.enqueue_search_index')
+def test_save_to_elasticsearch_published(mock_enqueue_search_index):
+    company = CompanyFactory(is_published=True)
 
-    assert mock_elasticsearch_company_save.call_count == 1
+    mock_enqueue_search_index.assert_called_once_with(company.pk)
 
 
 @pytest.mark.django_db
-def test_save_to_elasticsearch_unpublished(mock_elasticsearch_company_save):
+@mock.patch('company.tasks.enqueue_search_index')
+def test_save_to_elasticsearch_unpublished(mock_enqueue_search_index):
     CompanyFactory(is_published=False)
 
-    assert mock_elasticsearch_company_save.call_count == 0
+    assert mock_enqueue_search_index.called is False
+
+
+@pytest.mark.django_db
+def test_save_to_elasticsearch_unpublished_previously_published():
+    company = CompanyFactory(is_published=True)
+
+    with mock.patch('company.tasks.enqueue_search_index') as mock_enqueue:
+        company.is_published = False
+        company.save()
+
+    mock_enqueue.assert_called_once_with(company.pk)
+
+
+@pytest.mark.django_db
+def test_delete_from_elasticsearch():
+    company = CompanyFactory(is_published=True)
+    pk = company.pk
+
+    with mock.patch('company.tasks.enqueue_search_index') as mock_enqueue:
+        company.delete()
+
+    assert mock.call(pk) in mock_enqueue.call_args_list
+
+
+@pytest.mark.django_db
+def test_update_case_studies_in_elasticsearch_save():
+    company = CompanyFactory(is_published=True)
+
+    with mock.patch('company.tasks.enqueue_search_index') as mock_enqueue:
+        CompanyCaseStudyFactory(company=company)
+
+    mock_enqueue.assert_called_once_with(company.pk, case_studies_only=True)
+
+
+@pytest.mark.django_db
+def test_update_case_studies_in_elasticsearch_moved_to_another_company():
+    company_one = CompanyFactory(is_published=True)
+    company_two = CompanyFactory(is_published=True)
+    case_study = CompanyCaseStudyFactory(company=company_one)
+
+    with mock.patch('company.tasks.enqueue_search_index') as mock_enqueue:
+        case_study.company = company_two
+        case_study.save()
+
+    assert mock_enqueue.call_count == 2
+    mock_enqueue.assert_any_call(company_one.pk, case_studies_only=True)
+    mock_enqueue.assert_any_call(company_two.pk, case_studies_only=True)
+
+
+@pytest.mark.django_db
+def test_update_case_studies_in_elasticsearch_delete():
+    case_study = CompanyCaseStudyFactory()
+
+    with mock.patch('company.tasks.enqueue_search_index') as mock_enqueue:
+        case_study.delete()
+
+    mock_enqueue.assert_called_once_with(
+        case_study.company_id, case_studies_only=True
+    )
+
+
+@pytest.mark.django_db
+def test_save_to_elasticsearch_does_not_write_to_elasticsearch(
+    mock_elasticsearch_company_save
+):
+    CompanyFactory(is_published=True)
+
+    assert mock_elasticsearch_company_save.called is False
+
+
+@pytest.mark.django_db
+def test_update_case_study_count_create():
+    company = CompanyFactory()
+    CompanyCaseStudyFactory.create_batch(2, company=company)
+
+    company.refresh_from_db()
+    assert company.case_study_count == 2
+    assert company.has_case_studies is True
+
+
+@pytest.mark.django_db
+def test_update_case_study_count_delete():
+    company = CompanyFactory()
+    case_study = CompanyCaseStudyFactory(company=company)
+
+    case_study.delete()
+
+    company.refresh_from_db()
+    assert company.case_study_count == 0
+    assert company.has_case_studies is False
+
+
+@pytest.mark.django_db
+def test_update_case_study_count_not_overwritten_by_stale_company():
+    company = CompanyFactory()
+    stale_company = Company.objects.get(pk=company.pk)
+    CompanyCaseStudyFactory(company=company)
+
+    stale_company.name = 'New name'
+    stale_company.save()
+
+    company.refresh_from_db()
+    assert company.name == 'New name'
+    assert company.case_study_count == 1
+    assert company.has_case_studies is True
+
+
+@pytest.mark.django_db
+def test_update_case_study_count_moved_to_another_company():
+    company_one = CompanyFactory()
+    company_two = CompanyFactory()
+    case_study = CompanyCaseStudyFactory(company=company_one)
+
+    case_study.company = company_two
+    case_study.save()
+
+    company_one.refresh_from_db()
+    company_two.refresh_from_db()
+    assert company_one.case_study_count == 0
+    assert company_one.has_case_studies is False
+    assert company_two.case_study_count == 1
+    assert company_two.has_case_studies is True
+
+
+@pytest.mark.django_db
+def test_touch_company_of_case_study():
+    company = CompanyFactory()
+    modified = Company.objects.get(pk=company.pk).modified
+
+    CompanyCaseStudyFactory(company=company)
+
+    assert Company.objects.get(pk=company.pk).modified > modified
@@ -4,7 +4,7 @@ from company.stannp import stannp_client
 
 
 def test_post():
-    with mock.patch('requests.post') as mock_requests:
+    with mock.patch('requests.Session.post') as mock_requests:
         stannp_client.post(
             url='https://dash.stannp.com/api/v1/letters/create',
             data='whatever'
@@ -12,22 +12,22 @@ def test_post():
 
     mock_requests.assert_called_once_with(
         'https://dash.stannp.com/api/v1/letters/create',
-        auth=('debug', ''), data='whatever'
+        auth=('debug', ''), data='whatever', timeout=10
     )
 
 
 def test_validate_recipient():
-    with mock.patch('requests.post') as mock_requests:
+    with mock.patch('requests.Session.post') as mock_requests:
         stannp_client.validate_recipient(recipient='whatever')
 
     mock_requests.assert_called_once_with(
         'https://dash.stannp.com/api/v1/recipients/validate',
-        auth=('debug', ''), data='whatever'
+        auth=('debug', ''), data='whatever', timeout=10
     )
 
 
 def test_send_letter():
-    with mock.patch('requests.post') as mock_requests:
+    with mock.patch('requests.Session.post') as mock_requests:
         stannp_client.send_letter(
             template='whatever',
             recipient={
@@ -47,6 +47,7 @@ def test_send_letter():
     mock_requests.assert_called_once_with(
         'https://dash.stannp.com/api/v1/letters/create',
         auth=('debug', ''),
+        timeout=10,
         data={
             'recipient[address2]': 'test_address_line_2',
             'recipient[test_field_name1]': 'test_value1',
@@ -0,0 +1,221 @@
+from unittest.mock import Mock, patch
+
+from elasticsearch.helpers import BulkIndexError
+from freezegun import freeze_time
+import pytest
+import requests
+
+from django.utils import timezone
+
+from company import models, search, tasks, utils
+from company.tests.factories import CompanyFactory, CompanyCaseStudyFactory
+
+
+@patch('company.search.add_to_index_queue')
+def test_enqueue_search_index_schedules_flush(
+    mock_add_to_index_queue, mock_flush_search_index_queue_apply_async,
+    settings
+):
+    settings.SEARCH_INDEX_QUEUE_WINDOW = 3
+    mock_add_to_index_queue.return_value = True
+
+    tasks.enqueue_search_index(1)
+
+    mock_add_to_index_queue.assert_called_once_with(
+        1, key=search.INDEX_QUEUE_KEY
+    )
+    mock_flush_search_index_queue_apply_async.assert_called_once_with(
+        countdown=3
+    )
+
+
+@patch('company.search.add_to_index_queue')
+def test_enqueue_search_index_flush_already_scheduled(
+    mock_add_to_index_queue, mock_flush_search_index_queue_apply_async
+):
+    mock_add_to_index_queue.return_value = False
+
+    tasks.enqueue_search_index(1)
+
+    assert mock_flush_search_index_queue_apply_async.called is False
+
+
+@patch('company.search.add_to_index_queue')
+def test_enqueue_search_index_case_studies_only(mock_add_to_index_queue):
+    tasks.enqueue_search_index(1, case_studies_only=True)
+
+    mock_add_to_index_queue.assert_called_once_with(
+        1, key=search.CASE_STUDIES_QUEUE_KEY
+    )
+
+
+@pytest.mark.django_db
+def test_get_index_queue_actions():
+    published = CompanyFactory(is_published=True)
+    unpublished = CompanyFactory(is_published=False)
+    with_case_study = CompanyFactory(is_published=True)
+    CompanyCaseStudyFactory(company=with_case_study)
+    unpublished_with_case_study = CompanyFactory(is_published=False)
+    deleted_pk = CompanyFactory(is_published=True).pk
+    models.Company.objects.filter(pk=deleted_pk).delete()
+
+    actions = tasks.get_index_queue_actions(
+        pks=[published.pk, unpublished.pk, deleted_pk],
+        case_study_pks=[
+            published.pk,
+            with_case_study.pk,
+            unpublished_with_case_study.pk,
+        ],
+    )
+
+    assert actions == [
+        search.company_model_to_index_action(published),
+        search.company_pk_to_delete_action(unpublished.pk),
+        search.company_pk_to_delete_action(deleted_pk),
+        search.company_model_to_case_studies_update_action(with_case_study),
+    ]
+
+
+@pytest.mark.django_db
+@patch('company.search.bulk_send')
+@patch('company.search.pop_index_queue')
+def test_flush_search_index_queue(mock_pop_index_queue, mock_bulk_send):
+    company = CompanyFactory(is_published=True)
+    mock_pop_index_queue.return_value = ([company.pk], [])
+
+    tasks.flush_search_index_queue.run()
+
+    mock_bulk_send.assert_called_once_with(
+        [search.company_model_to_index_action(company)]
+    )
+
+
+@patch('company.search.bulk_send')
+@patch('company.search.pop_index_queue')
+def test_flush_search_index_queue_empty(mock_pop_index_queue, mock_bulk_send):
+    mock_pop_index_queue.return_value = ([], [])
+
+    tasks.flush_search_index_queue.run()
+
+    assert mock_bulk_send.called is False
+
+
+@pytest.mark.django_db
+@patch('company.tasks.flush_search_index_queue.retry')
+@patch('company.search.bulk_send')
+def test_flush_search_index_queue_retries(mock_bulk_send, mock_retry):
+    mock_bulk_send.side_effect = error = BulkIndexError('', [])
+    mock_retry.side_effect = Exception
+
+    with pytest.raises(Exception):
+        tasks.flush_search_index_queue.run(pks=[1, 2], case_study_pks=[3])
+
+    assert mock_retry.call_args[1]['exc'] == error
+    assert mock_retry.call_args[1]['kwargs'] == {
+        'pks': [1, 2], 'case_study_pks': [3]
+    }
+
+
+@patch('company.tasks.send_verification_letters.delay')
+def test_dispatch_verification_letters_chunks(mock_delay, settings):
+    settings.STANNP_LETTER_CHUNK_SIZE = 2
+
+    dispatch_id = tasks.dispatch_verification_letters(
+        [1, 2, 3], dispatch_id='123'
+    )
+
+    assert dispatch_id == '123'
+    assert mock_delay.call_count == 2
+    mock_delay.assert_any_call(pks=[1, 2], dispatch_id='123')
+    mock_delay.assert_any_call(pks=[3], dispatch_id='123')
+
+
+@pytest.mark.django_db
+@freeze_time()
+@patch('api.utils.time.sleep', Mock())
+@patch('company.tasks.stannp_client')
+def test_send_verification_letters(mock_stannp_client):
+    company_one = CompanyFactory(verification_code='1')
+    company_two = CompanyFactory(verification_code='2')
+    verified = CompanyFactory(verification_code='3', verified_with_code=True)
+
+    tasks.send_verification_letters.run(
+        pks=[company_one.pk, company_two.pk, verified.pk], dispatch_id='123'
+    )
+
+    assert mock_stannp_client.send_letter.call_count == 2
+    for company in (company_one, company_two):
+        mock_stannp_client.send_letter.assert_any_call(
+            recipient=utils.get_verification_letter_recipient(company),
+            template='debug'
+        )
+    sent = models.Company.objects.filter(is_verification_letter_sent=True)
+    assert set(sent.values_list('pk', flat=True)) == {
+        company_one.pk, company_two.pk
+    }
+    assert sent.first().date_verification_letter_sent == timezone.now()
+
+
+@pytest.mark.django_db
+@patch('api.utils.time.sleep', Mock())
+@patch('company.tasks.stannp_client')
+def test_send_verification_letters_idempotent(mock_stannp_client):
+    company = CompanyFactory(verification_code='1')
+
+    tasks.send_verification_letters.run(pks=[company.pk], dispatch_id='123')
+    tasks.send_verification_letters.run(pks=[company.pk], dispatch_id='123')
+
+    assert mock_stannp_client.send_letter.call_count == 1
+
+    tasks.send_verification_letters.run(pks=[company.pk], dispatch_id='456')
+
+    assert mock_stannp_client.send_letter.call_count == 2
+
+
+@pytest.mark.django_db
+@patch('api.utils.time.sleep', Mock())
+@patch('company.tasks.send_verification_letters.retry')
+@patch('company.tasks.stannp_client')
+def test_send_verification_letters_retries_failed(
+    mock_stannp_client, mock_retry
+):
+    company_one = CompanyFactory(verification_code='1')
+    company_two = CompanyFactory(verification_code='2')
+    error = requests.ConnectionError()
+    mock_stannp_client.send_letter.side_effect = [None, error]
+    mock_retry.side_effect = Exception
+
+    with pytest.raises(Exception):
+        tasks.send_verification_letters.run(
+            pks=[company_one.pk, company_two.pk], dispatch_id='123'
+        )
+
+    failed_pk = max(company_one.pk, company_two.pk)
+    sent_pk = min(company_one.pk, company_two.pk)
+    assert mock_retry.call_args[1]['exc'] == error
+    assert mock_retry.call_args[1]['kwargs'] == {
+        'pks': [failed_pk], 'dispatch_id': '123'
+    }
+    assert models.Company.objects.get(
+        pk=sent_pk
+    ).is_verification_letter_sent is True
+    assert models.Company.objects.get(
+        pk=failed_pk
+    ).is_verification_letter_sent is False
+
+
+@pytest.mark.django_db
+@patch('api.utils.time.sleep', Mock())
+@patch('company.tasks.send_verification_letters.retry')
+@patch('company.tasks.stannp_client')
+def test_send_verification_letters_does_not_retry_read_timeout(
+    mock_stannp_client, mock_retry
+):
+    company = CompanyFactory(verification_code='1')
+    mock_stannp_client.send_letter.side_effect = requests.ReadTimeout()
+
+    tasks.send_verification_letters.run(pks=[company.pk], dispatch_id='123')
+    tasks.send_verification_letters.run(pks=[company.pk], dispatch_id='123')
+
+    assert mock_stannp_client.send_letter.call_count == 1
+    assert mock_retry.called is False
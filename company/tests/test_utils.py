@@ -1,39 +1,54 @@
 import datetime
-from unittest import mock
 
 import pytest
+from django.core.cache import cache
 from django.utils import timezone
 from freezegun import freeze_time
 
-from company.tests.factories import CompanyFactory
-from company.utils import send_verification_letter
+from company import helpers
+from company.tests.factories import CompanyFactory, CompanyCaseStudyFactory
+from company.utils import (
+    get_verification_letter_recipient, mark_verification_letters_sent
+)
 
 
 @pytest.mark.django_db
 @freeze_time()
-@mock.patch('company.utils.stannp_client')
-def test_send_letter(mock_stannp_client):
+def test_get_verification_letter_recipient():
     company = CompanyFactory(verification_code='test')
-    send_verification_letter(company)
-    mock_stannp_client.send_letter.assert_called_with(
-        recipient={
-            'postal_full_name': company.postal_full_name,
-            'address_line_1': company.address_line_1,
-            'address_line_2': company.address_line_2,
-            'locality': company.locality,
-            'country': company.country,
-            'postal_code': company.postal_code,
-            'po_box': company.po_box,
-            'custom_fields': [
-                ('full_name', company.postal_full_name),
-                ('company_name', company.name),
-                ('verification_code', company.verification_code),
-                ('date', datetime.date.today().strftime('%d/%m/%Y')),
-                ('company', company.name)
-            ]
-        },
-        template='debug'
-    )
-    company.refresh_from_db()
-    assert company.is_verification_letter_sent
-    assert company.date_verification_letter_sent == timezone.now()
+
+    assert get_verification_letter_recipient(company) == {
+        'postal_full_name': company.postal_full_name,
+        'address_line_1': company.address_line_1,
+        'address_line_2': company.address_line_2,
+        'locality': company.locality,
+        'country': company.country,
+        'postal_code': company.postal_code,
+        'po_box': company.po_box,
+        'custom_fields': [
+            ('full_name', company.postal_full_name),
+            ('company_name', company.name),
+            ('verification_code', 'test'),
+            ('date', datetime.date.today().strftime('%d/%m/%Y')),
+            ('company', company.name)
+        ]
+    }
+
+
+@pytest.mark.django_db
+@freeze_time()
+def test_mark_verification_letters_sent():
+    company = CompanyFactory()
+    case_study = CompanyCaseStudyFactory(company=company)
+    profile_key = helpers.get_public_profile_cache_key(company.number)
+    case_study_key = helpers.get_public_case_study_cache_key(case_study.pk)
+    cache.set_many({profile_key: 'profile', case_study_key: 'case study'})
+
+    with freeze_time(timezone.now() + datetime.timedelta(minutes=1)):
+        assert mark_verification_letters_sent([company.pk]) == 1
+
+        company.refresh_from_db()
+        assert company.is_verification_letter_sent is True
+        assert company.date_verification_letter_sent == timezone.now()
+        assert company.modified == timezone.now()
+    assert cache.get_many([profile_key, case_study_key]) == {}
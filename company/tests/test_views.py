@@ -5,7 +5,9 @@ from unittest.mock import patch, Mock
 from unittest import TestCase
 
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 
 from directory_validators.constants import choices
 from elasticsearch_dsl.connections import connections
@@ -15,6 +17,7 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from PIL import Image, ImageDraw
 
+from company import filters, pagination, search
 from company.models import Company, CompanyCaseStudy
 from company.tests import (
     MockInvalidSerializer,
@@ -22,6 +25,10 @@ from company.tests import (
     VALID_REQUEST_DATA,
 )
 from company.tests.factories import CompanyFactory, CompanyCaseStudyFactory
+from company.views import (
+    CompanyPublicProfileViewSet, CompanySearchAPIView
+)
+from api.utils import estimate_queryset_count
 from user.models import User as Supplier
 
 
@@ -721,6 +728,96 @@ def test_company_profile_public_404_private_profile(
     assert response.status_code == http.client.NOT_FOUND
 
 
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_retrieve_cached(public_profile, api_client):
+    url = reverse(
+        'company-public-profile-detail',
+        kwargs={'companies_house_number': public_profile.number}
+    )
+    api_client.get(url)
+    # update() bypasses the signals that invalidate the cache
+    Company.objects.filter(pk=public_profile.pk).update(name='Renamed')
+
+    assert api_client.get(url).json()['name'] == public_profile.name
+
+    public_profile.name = 'Renamed again'
+    public_profile.save()
+
+    assert api_client.get(url).json()['name'] == 'Renamed again'
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_retrieve_conditional(
+    public_profile, api_client
+):
+    url = reverse(
+        'company-public-profile-detail',
+        kwargs={'companies_house_number': public_profile.number}
+    )
+    response = api_client.get(url)
+    etag = response['ETag']
+    last_modified = response['Last-Modified']
+
+    assert etag
+    assert api_client.get(
+        url, HTTP_IF_NONE_MATCH=etag
+    ).status_code == http.client.NOT_MODIFIED
+    assert api_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=last_modified
+    ).status_code == http.client.NOT_MODIFIED
+
+    public_profile.save()
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == http.client.OK
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_retrieve_case_study_change(
+    public_profile, api_client
+):
+    url = reverse(
+        'company-public-profile-detail',
+        kwargs={'companies_house_number': public_profile.number}
+    )
+    etag = api_client.get(url)['ETag']
+
+    CompanyCaseStudyFactory(company=public_profile)
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == http.client.OK
+    assert len(response.json()['supplier_case_studies']) == 1
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_public_company_case_study_get_cached(
+    supplier_case_study, api_client
+):
+    url = reverse(
+        'public-case-study-detail', kwargs={'pk': supplier_case_study.pk}
+    )
+    response = api_client.get(url)
+    CompanyCaseStudy.objects.filter(pk=supplier_case_study.pk).update(
+        title='Renamed'
+    )
+
+    assert api_client.get(url).json()['title'] == supplier_case_study.title
+    assert api_client.get(
+        url, HTTP_IF_NONE_MATCH=response['ETag']
+    ).status_code == http.client.NOT_MODIFIED
+
+    supplier_case_study.company.name = 'Renamed company'
+    supplier_case_study.company.save()
+
+    response = api_client.get(url)
+    assert response.json()['company']['name'] == 'Renamed company'
+
+
 @pytest.mark.django_db
 @patch('api.signature.SignatureCheckPermission.has_permission', Mock)
 def test_company_profile_public_list_profiles(
@@ -801,12 +898,210 @@ def test_company_profile_public_list_profiles_empty_filter(
     assert public_profile_cars.pk in parsed_ids
 
 
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_list_cursor_pagination(
+    private_profile, public_profile, public_profile_software,
+    public_profile_with_case_study, public_profile_with_case_studies,
+    public_profile_cars, api_client
+):
+    url = reverse('company-public-profile-list')
+    data = {'pagination': 'cursor', 'page_size': 2}
+
+    actual_sorted_ids = []
+    response = api_client.get(url, data)
+    while True:
+        assert response.status_code == http.client.OK
+        parsed = response.json()
+        assert 'count' not in parsed
+        actual_sorted_ids += [int(item['id']) for item in parsed['results']]
+        if parsed['next'] is None:
+            break
+        response = api_client.get(parsed['next'])
+
+    assert actual_sorted_ids == [
+        public_profile_with_case_studies.id,
+        public_profile_with_case_study.id,
+        public_profile_cars.id,
+        public_profile_software.id,
+        public_profile.id,
+    ]
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_list_invalid_cursor(api_client):
+    url = reverse('company-public-profile-list')
+    data = {'pagination': 'cursor', 'cursor': 'not-a-cursor'}
+
+    response = api_client.get(url, data)
+
+    assert response.status_code == http.client.NOT_FOUND
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+@patch('company.pagination.estimate_queryset_count', Mock(return_value=40))
+def test_company_profile_public_list_estimated_count(
+    public_profile, api_client
+):
+    url = reverse('company-public-profile-list')
+
+    response = api_client.get(url, {'count': 'estimate', 'page': 2})
+
+    assert response.status_code == http.client.OK
+    parsed = response.json()
+    assert parsed['count'] == 40
+    assert parsed['results'] == []
+    assert parsed['next'] is not None
+
+
+@pytest.mark.django_db
+def test_estimate_queryset_count(public_profile, public_profile_software):
+    count = estimate_queryset_count(Company.objects.all())
+
+    assert isinstance(count, int)
+    assert count > 0
+
+
+def count_queries(api_client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(url)
+    assert response.status_code == http.client.OK
+    return len(context.captured_queries)
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_retrieve_query_count(supplier, company, api_client):
+    url = reverse('company', kwargs={'sso_id': supplier.sso_id})
+    CompanyCaseStudyFactory(company=company)
+
+    assert count_queries(api_client, url) == 2
+
+    CompanyCaseStudyFactory.create_batch(3, company=company)
+
+    assert count_queries(api_client, url) == 2
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_retrieve_query_count(
+    public_profile, api_client
+):
+    url = reverse(
+        'company-public-profile-detail',
+        kwargs={'companies_house_number': public_profile.number}
+    )
+    CompanyCaseStudyFactory(company=public_profile)
+
+    assert count_queries(api_client, url) == 2
+
+    # creating case studies clears the cached profile
+    CompanyCaseStudyFactory.create_batch(3, company=public_profile)
+
+    assert count_queries(api_client, url) == 2
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_profile_public_list_query_count(
+    public_profile, public_profile_software, api_client
+):
+    url = reverse('company-public-profile-list')
+    CompanyCaseStudyFactory(company=public_profile)
+
+    # count, companies, case studies
+    assert count_queries(api_client, url) == 3
+
+    CompanyCaseStudyFactory.create_batch(3, company=public_profile_software)
+    CompanyFactory.create_batch(3, is_published=True)
+
+    assert count_queries(api_client, url) == 3
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_public_case_study_query_count(supplier_case_study, api_client):
+    url = reverse(
+        'public-case-study-detail', kwargs={'pk': supplier_case_study.pk}
+    )
+
+    assert count_queries(api_client, url) == 1
+
+
+@pytest.mark.django_db
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_case_study_query_count(
+    supplier_case_study, supplier, api_client
+):
+    url = reverse(
+        'company-case-study-detail',
+        kwargs={'sso_id': supplier.sso_id, 'pk': supplier_case_study.pk}
+    )
+
+    # company of the supplier, case study with its company
+    assert count_queries(api_client, url) == 2
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        # the test tables are tiny, so make the planner prefer any index
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+@pytest.mark.django_db
+def test_company_profile_public_list_uses_index(
+    public_profile, public_profile_with_case_study
+):
+    queryset = CompanyPublicProfileViewSet.queryset.all()[:10]
+
+    plan = explain(queryset)
+
+    assert 'company_company_public_listing' in plan
+    assert 'Sort' not in plan
+
+
+@pytest.mark.django_db
+def test_company_profile_public_list_cursor_uses_index(
+    public_profile, public_profile_with_case_study
+):
+    paginator = pagination.CompanyPublicProfileCursor()
+    cursor = paginator.encode_cursor(public_profile_with_case_study)
+    position = paginator.decode_cursor(Mock(query_params={'cursor': cursor}))
+    queryset = paginator.seek_queryset(
+        CompanyPublicProfileViewSet.queryset.all(), position
+    )[:10]
+
+    plan = explain(queryset)
+
+    assert 'company_company_public_listing' in plan
+    assert 'Sort' not in plan
+
+
+@pytest.mark.django_db
+def test_company_profile_public_list_sectors_filter_uses_index(
+    public_profile_software, public_profile_cars
+):
+    queryset = filters.CompanyPublicProfileFilter(
+        {'sectors': 'AUTOMOTIVE'},
+        queryset=Company.objects.all(),
+    ).qs
+
+    plan = explain(queryset)
+
+    assert 'company_company_sectors_gin' in plan
+
+
 @pytest.mark.django_db
 @patch('api.signature.SignatureCheckPermission.has_permission', Mock)
 def test_verify_company_with_code(api_client, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
 
-    with patch('requests.post'):
+    with patch('requests.Session.post'):
         company = Company.objects.create(**{
             'number': '11234567',
             'name': 'Test Company',
@@ -846,7 +1141,7 @@ def test_verify_company_with_code(api_client, settings):
 def test_verify_company_with_code_invalid_code(api_client, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
 
-    with patch('requests.post'):
+    with patch('requests.Session.post'):
         company = Company.objects.create(**{
             'number': '11234567',
             'name': 'Test Company',
@@ -886,7 +1181,7 @@ def test_verify_company_with_code_invalid_code(api_client, settings):
 def test_verify_company_with_code_invalid_user(api_client, settings):
     settings.FEATURE_VERIFICATION_LETTERS_ENABLED = True
 
-    with patch('requests.post'):
+    with patch('requests.Session.post'):
         company = Company.objects.create(**{
             'number': '11234567',
             'name': 'Test Company',
@@ -936,7 +1231,9 @@ def test_company_search(mock_get_search_results, api_client):
     assert response.status_code == 200
     assert response.json() == expected_value
     mock_get_search_results.assert_called_once_with(
-        term='bones', page=1, size=10,
+        term='bones', page=1, size=10, lean=False, cursor=None,
+        sectors=[], employees=[], has_single_sector=None,
+        date_of_creation_from=None, date_of_creation_to=None,
     )
 
 
@@ -979,7 +1276,185 @@ def test_company_paginate_first_page(api_client):
                             ],
                         }
                     },
+                    'aggs': {
+                        'employees': {'terms': {'field': 'employees'}},
+                        'sectors': {'terms': {'field': 'sectors'}},
+                    },
                 },
                 doc_type=['company_doc_type'],
                 index=['company']
             )
+
+
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_search_filters(api_client):
+    es = connections.get_connection('default')
+    with patch.object(es, 'search', return_value={}) as mock_search:
+        data = {
+            'term': 'bones',
+            'size': 5,
+            'sectors': ['AEROSPACE', 'AIRPORTS'],
+            'employees': '1-10',
+            'has_single_sector': True,
+            'date_of_creation_from': '2000-01-01',
+            'date_of_creation_to': '2010-12-31',
+        }
+        response = api_client.get(reverse('company-search'), data=data)
+
+    assert response.status_code == 200
+    query = mock_search.call_args[1]['body']['query']['function_score']
+    assert query['query'] == {
+        'bool': {
+            'must': [{'match': {'_all': 'bones'}}],
+            'filter': [
+                {'terms': {'sectors': ['AEROSPACE', 'AIRPORTS']}},
+                {'terms': {'employees': ['1-10']}},
+                {'term': {'has_single_sector': True}},
+                {
+                    'range': {
+                        'date_of_creation': {
+                            'gte': '2000-01-01',
+                            'lte': '2010-12-31',
+                        }
+                    }
+                },
+            ],
+        }
+    }
+
+
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_search_invalid_filter(api_client):
+    data = {'term': 'bones', 'size': 5, 'sectors': 'NOT_A_SECTOR'}
+    response = api_client.get(reverse('company-search'), data=data)
+
+    assert response.status_code == 400
+    assert 'sectors' in response.json()
+
+
+def test_company_search_results_cached_per_filter(settings):
+    es = connections.get_connection('default')
+    with patch.object(es, 'search', return_value={}) as mock_search:
+        CompanySearchAPIView.get_search_results(
+            term='bones', page=1, size=5, sectors=['AEROSPACE']
+        )
+        CompanySearchAPIView.get_search_results(
+            term='bones', page=1, size=5, sectors=['AEROSPACE']
+        )
+        CompanySearchAPIView.get_search_results(
+            term='bones', page=1, size=5, sectors=['AIRPORTS']
+        )
+
+    assert mock_search.call_count == 2
+
+
+def test_company_search_results_cached(settings):
+    settings.SEARCH_CACHE_MAX_PAGE = 1
+    es = connections.get_connection('default')
+    with patch.object(es, 'search', return_value={}) as mock_search:
+        CompanySearchAPIView.get_search_results(term='bones', page=1, size=5)
+        CompanySearchAPIView.get_search_results(term='Bones', page=1, size=5)
+
+        assert mock_search.call_count == 1
+
+        search.bump_search_generation()
+        CompanySearchAPIView.get_search_results(term='bones', page=1, size=5)
+
+        assert mock_search.call_count == 2
+
+
+def test_company_search_results_deep_pages_not_cached(settings):
+    settings.SEARCH_CACHE_MAX_PAGE = 1
+    es = connections.get_connection('default')
+    with patch.object(es, 'search', return_value={}) as mock_search:
+        CompanySearchAPIView.get_search_results(term='bones', page=2, size=5)
+        CompanySearchAPIView.get_search_results(term='bones', page=2, size=5)
+
+    assert mock_search.call_count == 2
+
+
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_search_lean(api_client):
+    es = connections.get_connection('default')
+    es_response = {
+        'hits': {
+            'total': 3,
+            'hits': [
+                {
+                    '_id': '1',
+                    '_score': 2.0,
+                    '_source': {'name': 'Bones'},
+                    'highlight': {'description': ['<em>bones</em>']},
+                    'sort': [2.0, 1],
+                },
+                {
+                    '_id': '2',
+                    '_score': 1.0,
+                    '_source': {'name': 'Bones and more'},
+                    'sort': [1.0, 2],
+                },
+            ],
+        },
+    }
+    with patch.object(es, 'search', return_value=es_response) as mock_search:
+        data = {'term': 'bones', 'size': 2, 'lean': True}
+        response = api_client.get(reverse('company-search'), data=data)
+
+    assert response.status_code == 200
+    cursor = search.encode_search_cursor([1.0, 2])
+    assert response.json() == {
+        'aggregations': {},
+        'hits': {
+            'total': 3,
+            'hits': [
+                {
+                    '_id': '1',
+                    '_source': {'name': 'Bones'},
+                    'highlight': {'description': ['<em>bones</em>']},
+                },
+                {
+                    '_id': '2',
+                    '_source': {'name': 'Bones and more'},
+                    'highlight': {},
+                },
+            ],
+        },
+        'cursor': cursor,
+    }
+    body = mock_search.call_args[1]['body']
+    assert body['sort'] == [{'_score': {'order': 'desc'}}, 'pk']
+    assert body['_source'] == {'includes': search.LEAN_SOURCE_FIELDS}
+    assert sorted(body['highlight']['fields']) == sorted(
+        search.LEAN_HIGHLIGHT_FIELDS
+    )
+    assert body['from'] == 0
+    assert body['size'] == 2
+
+
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_search_cursor(api_client):
+    es = connections.get_connection('default')
+    cursor = search.encode_search_cursor([1.0, 2])
+    with patch.object(es, 'search', return_value={}) as mock_search:
+        data = {'term': 'bones', 'size': 2, 'cursor': cursor}
+        response = api_client.get(reverse('company-search'), data=data)
+
+    assert response.status_code == 200
+    assert response.json() == {
+        'aggregations': {},
+        'hits': {'total': 0, 'hits': []},
+        'cursor': None,
+    }
+    body = mock_search.call_args[1]['body']
+    assert body['search_after'] == [1.0, 2]
+    assert body['from'] == 0
+    assert body['size'] == 2
+
+
+@patch('api.signature.SignatureCheckPermission.has_permission', Mock)
+def test_company_search_invalid_cursor(api_client):
+    data = {'term': 'bones', 'size': 2, 'cursor': 'not-a-cursor'}
+    response = api_client.get(reverse('company-search'), data=data)
+
+    assert response.status_code == 400
+    assert response.json() == {'cursor': [search.MESSAGE_INVALID_CURSOR]}
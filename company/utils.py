@@ -1,13 +1,13 @@
 import datetime
 
-from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 
-from company.stannp import stannp_client
+from company import helpers, models
 
 
-def send_verification_letter(company):
-    recipient = {
+def get_verification_letter_recipient(company):
+    return {
         'postal_full_name': company.postal_full_name,
         'address_line_1': company.address_line_1,
         'address_line_2': company.address_line_2,
@@ -24,11 +24,36 @@ def send_verification_letter(company):
         ]
     }
 
-    stannp_client.send_letter(
-        template=settings.STANNP_VERIFICATION_LETTER_TEMPLATE_ID,
-        recipient=recipient
+
+def clear_public_profile_cache(pks):
+    """
+    Clears the cached public profiles, and case studies, of the companies.
+    Needed after changing them with update(), which does not send the
+    signals that clear the cache on save.
+
+    """
+
+    numbers = models.Company.objects.filter(pk__in=pks).values_list(
+        'number', flat=True
     )
+    case_study_pks = models.CompanyCaseStudy.objects.filter(
+        company_id__in=pks
+    ).values_list('pk', flat=True)
+    cache.delete_many(
+        [helpers.get_public_profile_cache_key(number) for number in numbers] +
+        [helpers.get_public_case_study_cache_key(pk) for pk in case_study_pks]
+    )
+
 
-    company.is_verification_letter_sent = True
-    company.date_verification_letter_sent = timezone.now()
-    company.save()
+def mark_verification_letters_sent(pks):
+    # update() rather than save() to avoid firing the post_save handlers,
+    # none of which care about these fields. The public profile shows them,
+    # so it is modified and its cache cleared.
+    now = timezone.now()
+    updated = models.Company.objects.filter(pk__in=pks).update(
+        is_verification_letter_sent=True,
+        date_verification_letter_sent=now,
+        modified=now,
+    )
+    clear_public_profile_cache(pks)
+    return updated
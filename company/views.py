@@ -1,14 +1,87 @@
+import hashlib
+
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 from rest_framework import generics, viewsets, views, status
 
-from django.db.models import Case, Count, When, Value, BooleanField
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import (
+    http_date, parse_etags, parse_http_date_safe, quote_etag
+)
 
-from company import filters, models, pagination, search, serializers
+from api.utils import EagerLoadingMixin
+from company import filters, helpers, models, pagination, search, serializers
 
 from elasticsearch_dsl.query import Q, SF
 
 
+def get_etag(cache_key, modified):
+    if modified is None:
+        return None
+    value = '{key}:{modified}'.format(
+        key=cache_key, modified=modified.isoformat()
+    )
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def is_not_modified(request, etag, modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in parse_etags(
+            if_none_match
+        )
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE')
+    )
+    return (
+        if_modified_since is not None and
+        int(modified.timestamp()) <= if_modified_since
+    )
+
+
+class CachedRetrieveMixin:
+    """Serves retrieve from a cache of the serialized object.
+
+    The cache entry is deleted by signals when the company changes. Responses
+    carry an ETag and Last-Modified derived from the company's modified date
+    so clients can make conditional requests.
+
+    """
+
+    def get_retrieve_cache_key(self):
+        raise NotImplementedError()
+
+    def get_last_modified(self, instance):
+        raise NotImplementedError()
+
+    def get_cached_retrieve(self):
+        cache_key = self.get_retrieve_cache_key()
+        cached = cache.get(cache_key)
+        if cached is None:
+            instance = self.get_object()
+            cached = {
+                'data': self.get_serializer(instance).data,
+                'modified': self.get_last_modified(instance),
+            }
+            cache.set(
+                cache_key, cached, settings.PUBLIC_PROFILE_CACHE_TIMEOUT
+            )
+        return get_etag(cache_key, cached['modified']), cached
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, cached = self.get_cached_retrieve()
+        modified = cached['modified']
+        if etag is not None and is_not_modified(request, etag, modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(cached['data'])
+        if etag is not None:
+            response['ETag'] = quote_etag(etag)
+            response['Last-Modified'] = http_date(modified.timestamp())
+        return response
+
+
 class CompanyNumberValidatorAPIView(generics.GenericAPIView):
 
     serializer_class = serializers.CompanyNumberValidatorSerializer
@@ -19,37 +92,67 @@ class CompanyNumberValidatorAPIView(generics.GenericAPIView):
         return Response()
 
 
-class CompanyRetrieveUpdateAPIView(generics.RetrieveUpdateAPIView):
+class CompanyRetrieveUpdateAPIView(
+    EagerLoadingMixin, generics.RetrieveUpdateAPIView
+):
 
     serializer_class = serializers.CompanySerializer
+    queryset = models.Company.objects.all()
 
     def get_object(self):
         return generics.get_object_or_404(
-            models.Company, suppliers__sso_id=self.kwargs['sso_id']
+            self.get_queryset(), suppliers__sso_id=self.kwargs['sso_id']
         )
 
 
-class CompanyPublicProfileViewSet(viewsets.ModelViewSet):
+class CompanyPublicProfileViewSet(
+    CachedRetrieveMixin, EagerLoadingMixin, viewsets.ModelViewSet
+):
     serializer_class = serializers.CompanySerializer
     queryset = (
         models.Company.objects
         .filter(is_published=True)
-        .annotate(supplier_case_studies_count=Count('supplier_case_studies'))
-        .annotate(
-            has_case_studies=Case(
-               When(supplier_case_studies_count=0, then=Value(False)),
-               default=Value(True),
-               output_field=BooleanField())
-        )
         .order_by('-has_case_studies', '-modified')
     )
     pagination_class = pagination.CompanyPublicProfile
+    cursor_pagination_class = pagination.CompanyPublicProfileCursor
     filter_class = filters.CompanyPublicProfileFilter
     lookup_url_kwarg = 'companies_house_number'
     lookup_field = 'number'
 
+    @property
+    def paginator(self):
+        # clients opt in to keyset pagination with ?pagination=cursor
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        # pages are serialized from values() rows rather than model instances
+        values_serializer = serializers.ValuesSerializer(
+            self.get_serializer_class(), context=self.get_serializer_context()
+        )
+        queryset = values_serializer.get_values(
+            self.filter_queryset(self.get_queryset()),
+            # read by the cursor paginator
+            'has_case_studies', 'modified', 'pk',
+        )
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(values_serializer.serialize(page))
+
+    def get_retrieve_cache_key(self):
+        return helpers.get_public_profile_cache_key(
+            self.kwargs[self.lookup_url_kwarg]
+        )
+
+    def get_last_modified(self, instance):
+        return instance.modified
+
 
-class CompanyCaseStudyViewSet(viewsets.ModelViewSet):
+class CompanyCaseStudyViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
 
     read_serializer_class = serializers.CompanyCaseStudyWithCompanySerializer
     write_serializer_class = serializers.CompanyCaseStudySerializer
@@ -77,16 +180,26 @@ class CompanyCaseStudyViewSet(viewsets.ModelViewSet):
         return super().get_serializer(*args, **kwargs)
 
     def get_queryset(self):
-        return self.queryset.filter(company=self.company)
+        return super().get_queryset().filter(company=self.company)
 
 
-class PublicCaseStudyViewSet(viewsets.ReadOnlyModelViewSet):
+class PublicCaseStudyViewSet(
+    CachedRetrieveMixin, EagerLoadingMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = models.CompanyCaseStudy.objects.filter(
         company__is_published=True
     )
     lookup_field = 'pk'
     serializer_class = serializers.CompanyCaseStudyWithCompanySerializer
 
+    def get_retrieve_cache_key(self):
+        return helpers.get_public_case_study_cache_key(
+            self.kwargs[self.lookup_field]
+        )
+
+    def get_last_modified(self, instance):
+        return instance.company.modified
+
 
 class VerifyCompanyWithCodeAPIView(views.APIView):
 
@@ -130,40 +243,82 @@ class CompanySearchAPIView(views.APIView):
     def get(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.GET)
         serializer.is_valid(raise_exception=True)
-        search_results = self.get_search_results(
-            term=serializer.data['term'],
-            page=serializer.data['page'],
-            size=serializer.data['size'],
-        )
+        search_results = self.get_search_results(**serializer.validated_data)
         return Response(
             data=search_results,
             status=status.HTTP_200_OK,
         )
 
     @staticmethod
-    def get_search_results(term, page, size):
+    def get_search_results(
+        term, page, size, lean=False, cursor=None, **filters
+    ):
         """Search companies by term
 
-        Wildcard search of companies by provided term. The position of
-        companies that have only one sector is increased.
+        Wildcard search of companies by provided term, optionally filtered.
+        The position of companies that have only one sector is increased.
+        Counts of matching companies per sector and employees band are
+        returned as aggregations. Results are cached until a company document
+        is next written.
+
+        In lean mode only the fields needed for listings are returned, with
+        highlighted snippets of the matching text and a cursor for the next
+        page. Passing that cursor back pages with `search_after` rather than
+        offsets, so deep pages cost the same as the first.
 
         Arguments:
             term {str} -- Search term to match on
             page {int} -- Page number to query
             size {int} -- Number of results per page
+            lean {bool} -- Return trimmed results
+            cursor {list} -- Sort values from a lean response, implies lean
+            filters -- See `search.get_search_filters`
 
         Returns:
             dict -- Companies that match the term
 
         """
 
-        start = (page - 1) * size
-        end = start + size
+        lean = lean or cursor is not None
+        cache_key = search.get_search_cache_key(
+            term=term, page=page, size=size, lean=lean, cursor=cursor,
+            **filters
+        )
+        results = cache.get(cache_key)
+        if results is not None:
+            return results
+
+        match = Q('match', _all=term)
+        filter_clauses = search.get_search_filters(**filters)
+        if filter_clauses:
+            match = Q('bool', must=match, filter=filter_clauses)
         query = search.CompanyDocType.search().query(
             'function_score',
-            query=Q('match', _all=term),
+            query=match,
             functions=[
                 SF('field_value_factor', field='has_single_sector')
             ]
         )
-        return query[start:end].execute().to_dict()
+        for facet_field in search.FACET_FIELDS:
+            query.aggs.bucket(facet_field, 'terms', field=facet_field)
+        if lean:
+            query = (
+                query
+                .sort('-_score', 'pk')
+                .extra(_source={'includes': search.LEAN_SOURCE_FIELDS})
+                .highlight(*search.LEAN_HIGHLIGHT_FIELDS)
+                .highlight_options(require_field_match=False)
+            )
+        if cursor is not None:
+            query = query.extra(search_after=cursor)[:size]
+        else:
+            start = (page - 1) * size
+            end = start + size
+            query = query[start:end]
+        results = query.execute().to_dict()
+        if lean:
+            results = search.format_lean_results(results, size=size)
+        # only the first pages are popular enough to be worth caching
+        if cursor is None and page <= settings.SEARCH_CACHE_MAX_PAGE:
+            cache.set(cache_key, results, settings.SEARCH_CACHE_TIMEOUT)
+        return results
@@ -6,6 +6,7 @@ import logging
 import pytest
 import requests_mock
 
+from django.core.cache import cache
 from django.db import connection
 from django.db.migrations.executor import MigrationExecutor
 
@@ -87,3 +88,28 @@ def mock_elasticsearch_company_save():
     stub = patch('company.search.CompanyDocType.save')
     yield stub.start()
     stub.stop()
+
+
+@pytest.fixture(autouse=True)
+def mock_redis_connection():
+    stub = patch('company.search.get_redis_connection')
+    yield stub.start()
+    stub.stop()
+
+
+@pytest.fixture(autouse=True)
+def mock_flush_search_index_queue_apply_async():
+    stub = patch('company.tasks.flush_search_index_queue.apply_async')
+    yield stub.start()
+    stub.stop()
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    cache.clear()
+    helpers.companies_house_profile_cache.clear()
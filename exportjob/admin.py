@@ -0,0 +1,37 @@
+from django.contrib import admin
+from django.utils.html import format_html
+
+from exportjob.models import ExportJob
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'export', 'status', 'progress', 'requested_by', 'created',
+        'download_link',
+    )
+    list_filter = ('export', 'status')
+    readonly_fields = (
+        'export', 'object_ids', 'compress', 'status', 'total_rows',
+        'rows_written', 'error', 'requested_by', 'created', 'modified',
+        'download_link',
+    )
+    exclude = ('file',)
+
+    def has_add_permission(self, request):
+        # jobs are started from the actions of the exported model's admin
+        return False
+
+    def progress(self, obj):
+        return '{written} / {total}'.format(
+            written=obj.rows_written,
+            total='?' if obj.total_rows is None else obj.total_rows,
+        )
+
+    def download_link(self, obj):
+        if obj.status != ExportJob.STATUS_COMPLETED or not obj.file:
+            return ''
+        return format_html('<a href="{}">Download</a>', obj.file.url)
+
+    download_link.short_description = 'File'
@@ -0,0 +1,21 @@
+from collections import namedtuple
+
+from supplier import exports as supplier_exports
+from user.models import User as Supplier
+
+
+Export = namedtuple(
+    'Export', ['label', 'filename', 'model', 'get_fieldnames', 'get_queryset']
+)
+
+EXPORTS = {
+    'suppliers': Export(
+        label='Suppliers with company details',
+        filename='find-a-buyer_suppliers',
+        model=Supplier,
+        get_fieldnames=supplier_exports.get_csv_fieldnames,
+        get_queryset=supplier_exports.get_csv_queryset,
+    ),
+}
+
+EXPORT_CHOICES = sorted((key, export.label) for key, export in EXPORTS.items())
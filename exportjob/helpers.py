@@ -0,0 +1,38 @@
+from django.contrib import messages
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.utils.html import format_html
+
+from exportjob import models, tasks
+
+
+def start_export_job(request, export, queryset, compress):
+    """Creates an export job for an admin action and runs it in celery.
+
+    When every object is selected and the changelist is unfiltered, the ids
+    are not stored so the whole table is exported.
+
+    """
+
+    select_across = request.POST.get('select_across') == '1'
+    if select_across and not request.GET:
+        object_ids = None
+    else:
+        object_ids = list(queryset.values_list('pk', flat=True))
+    job = models.ExportJob.objects.create(
+        export=export,
+        object_ids=object_ids,
+        compress=compress,
+        requested_by=request.user,
+    )
+    transaction.on_commit(lambda: tasks.run_export_job.delay(job.pk))
+    messages.success(
+        request,
+        format_html(
+            'Export started, the file will be linked from <a href="{}">{}</a>'
+            ' when it is ready.',
+            reverse('admin:exportjob_exportjob_change', args=(job.pk,)),
+            job,
+        )
+    )
+    return job
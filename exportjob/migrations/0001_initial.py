@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-07-03 11:20
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import exportjob.storage
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, null=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, null=True, verbose_name='modified')),
+                ('export', models.CharField(choices=[('suppliers', 'Suppliers with company details')], max_length=50)),
+                ('object_ids', django.contrib.postgres.fields.jsonb.JSONField(blank=True, help_text='Primary keys of the objects to export, or all if empty.', null=True)),
+                ('compress', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True)),
+                ('rows_written', models.PositiveIntegerField(default=0)),
+                ('file', models.FileField(blank=True, default='', storage=exportjob.storage.ExportStorage(), upload_to='exports/')),
+                ('error', models.TextField(blank=True, default='')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+
+from api.model_utils import TimeStampedModel
+from exportjob.exports import EXPORT_CHOICES
+from exportjob.storage import ExportStorage
+
+
+class ExportJob(TimeStampedModel):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    export = models.CharField(max_length=50, choices=EXPORT_CHOICES)
+    object_ids = JSONField(
+        null=True,
+        blank=True,
+        help_text='Primary keys of the objects to export, or all if empty.',
+    )
+    compress = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    file = models.FileField(
+        upload_to='exports/',
+        storage=ExportStorage(),
+        blank=True,
+        default='',
+    )
+    error = models.TextField(blank=True, default='')
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+
+    def __str__(self):
+        return '{export} ({status})'.format(
+            export=self.get_export_display(),
+            status=self.get_status_display(),
+        )
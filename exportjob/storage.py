@@ -0,0 +1,21 @@
+from django.core.files.storage import get_storage_class
+from django.utils.deconstruct import deconstructible
+
+
+DefaultStorage = get_storage_class()
+
+
+@deconstructible
+class ExportStorage(DefaultStorage):
+    """The default storage, made private if it is S3.
+
+    Exports contain personal details, so unlike logos and case study images
+    they must not be public-read. S3 URLs are signed instead.
+
+    """
+
+    def __init__(self):
+        if hasattr(DefaultStorage, 'default_acl'):
+            super().__init__(acl='private', querystring_auth=True)
+        else:
+            super().__init__()
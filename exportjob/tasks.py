@@ -0,0 +1,94 @@
+import csv
+import gzip
+import io
+import logging
+import tempfile
+
+from django.core.files import File
+from django.utils import timezone
+
+from api.celery import app
+from api.utils import iterate_queryset_server_side
+from exportjob import exports, models
+
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 1000
+
+
+def get_export_filename(job):
+    filename = '{name}_{timestamp}.csv'.format(
+        name=exports.EXPORTS[job.export].filename,
+        timestamp=timezone.now().strftime('%Y%m%d%H%M%S'),
+    )
+    if job.compress:
+        filename += '.gz'
+    return filename
+
+
+def write_csv(job, rows, fieldnames, binary_file):
+    """Writes the rows to the file, recording progress on the job.
+
+    Returns:
+        int -- The number of rows written.
+
+    """
+
+    if job.compress:
+        binary_file = gzip.GzipFile(fileobj=binary_file, mode='wb')
+    text_file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+    writer = csv.DictWriter(text_file, fieldnames=fieldnames)
+    writer.writeheader()
+    rows_written = 0
+    for row in rows:
+        writer.writerow(row)
+        rows_written += 1
+        if rows_written % PROGRESS_INTERVAL == 0:
+            models.ExportJob.objects.filter(pk=job.pk).update(
+                rows_written=rows_written
+            )
+    text_file.flush()
+    # leave the underlying file open for the caller to upload
+    text_file.detach()
+    if job.compress:
+        # writes the gzip trailer, but does not close the wrapped file
+        binary_file.close()
+    return rows_written
+
+
+@app.task
+def run_export_job(pk):
+    job = models.ExportJob.objects.get(pk=pk)
+    export = exports.EXPORTS[job.export]
+    queryset = export.model.objects.all()
+    if job.object_ids is not None:
+        queryset = queryset.filter(pk__in=job.object_ids)
+    job.status = models.ExportJob.STATUS_RUNNING
+    job.total_rows = queryset.count()
+    job.save()
+
+    fieldnames = export.get_fieldnames()
+    rows = iterate_queryset_server_side(
+        export.get_queryset(queryset, fieldnames)
+    )
+    try:
+        # spooled to disk so the storage backend can upload it in chunks
+        with tempfile.TemporaryFile() as temp_file:
+            job.rows_written = write_csv(job, rows, fieldnames, temp_file)
+            temp_file.seek(0)
+            job.file.save(
+                get_export_filename(job), File(temp_file), save=False
+            )
+    except Exception as error:
+        logger.exception('Export job %s failed', pk)
+        models.ExportJob.objects.filter(pk=pk).update(
+            status=models.ExportJob.STATUS_FAILED,
+            error=str(error),
+        )
+        raise
+    models.ExportJob.objects.filter(pk=pk).update(
+        status=models.ExportJob.STATUS_COMPLETED,
+        rows_written=job.rows_written,
+        file=job.file.name,
+    )
@@ -0,0 +1,100 @@
+import gzip
+import io
+from unittest.mock import patch
+
+import pytest
+
+from company.tests.factories import CompanyFactory
+from exportjob import tasks
+from exportjob.models import ExportJob
+from supplier.tests.factories import SupplierFactory
+
+
+class CapturingSave:
+
+    def __init__(self):
+        self.content = None
+
+    def __call__(self, storage, name, content, max_length=None):
+        self.content = content.read()
+        return name
+
+
+@pytest.fixture
+def mock_save():
+    save = CapturingSave()
+    with patch('django.core.files.storage.Storage.save', save):
+        yield save
+
+
+@pytest.fixture
+def suppliers():
+    return [
+        SupplierFactory(company=CompanyFactory(name=name))
+        for name in ('Alpha', 'Bravo', 'Charlie')
+    ]
+
+
+@pytest.mark.django_db
+def test_run_export_job_selected(suppliers, mock_save):
+    job = ExportJob.objects.create(
+        export='suppliers', object_ids=[suppliers[0].pk, suppliers[2].pk]
+    )
+
+    tasks.run_export_job(job.pk)
+
+    job.refresh_from_db()
+    lines = mock_save.content.decode('utf-8').split('\r\n')
+    assert job.status == ExportJob.STATUS_COMPLETED
+    assert job.total_rows == 2
+    assert job.rows_written == 2
+    assert job.file.name.endswith('.csv')
+    assert lines[0].startswith('company__address_line_1,')
+    assert len(lines) == 4
+    assert 'Alpha' in mock_save.content.decode('utf-8')
+    assert 'Bravo' not in mock_save.content.decode('utf-8')
+
+
+@pytest.mark.django_db
+def test_run_export_job_all_compressed(suppliers, mock_save):
+    job = ExportJob.objects.create(export='suppliers', compress=True)
+
+    tasks.run_export_job(job.pk)
+
+    job.refresh_from_db()
+    content = gzip.decompress(mock_save.content).decode('utf-8')
+    assert job.status == ExportJob.STATUS_COMPLETED
+    assert job.rows_written == 3
+    assert job.file.name.endswith('.csv.gz')
+    assert len(content.split('\r\n')) == 5
+
+
+@pytest.mark.django_db
+@patch.object(tasks, 'PROGRESS_INTERVAL', 2)
+def test_write_csv_records_progress():
+    job = ExportJob.objects.create(export='suppliers')
+    rows = [{'name': str(i)} for i in range(5)]
+    binary_file = io.BytesIO()
+
+    rows_written = tasks.write_csv(job, rows, ['name'], binary_file)
+
+    job.refresh_from_db()
+    assert rows_written == 5
+    assert job.rows_written == 4
+    assert binary_file.getvalue() == b'name\r\n0\r\n1\r\n2\r\n3\r\n4\r\n'
+
+
+@pytest.mark.django_db
+def test_run_export_job_failed(suppliers):
+    job = ExportJob.objects.create(export='suppliers')
+
+    with patch(
+        'django.core.files.storage.Storage.save',
+        side_effect=IOError('Disk full')
+    ):
+        with pytest.raises(IOError):
+            tasks.run_export_job(job.pk)
+
+    job.refresh_from_db()
+    assert job.status == ExportJob.STATUS_FAILED
+    assert job.error == 'Disk full'
@@ -1,9 +1,9 @@
 import datetime
 
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from api.utils import generate_csv
-from notifications import models
+from notifications import models, tasks
 
 
 @admin.register(models.SupplierEmailNotification)
@@ -71,3 +71,46 @@ class AnonymousEmailNotificationAdmin(admin.ModelAdmin):
     download_csv.short_description = (
         "Download CSV report for selected notifications"
     )
+
+
+class CampaignChunkInline(admin.TabularInline):
+    model = models.CampaignChunk
+    fields = (
+        'index', 'status', 'sent', 'failed', 'render_seconds', 'send_seconds',
+        'date_started', 'date_finished',
+    )
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(models.CampaignRun)
+class CampaignRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'campaign', 'date', 'status', 'recipients', 'sent', 'failed',
+        'recipients_per_second', 'render_seconds', 'send_seconds',
+    )
+    list_filter = ('campaign', 'status')
+    readonly_fields = (
+        'campaign', 'date', 'status', 'recipients', 'sent', 'failed',
+        'render_seconds', 'send_seconds', 'date_started', 'date_finished',
+    )
+    date_hierarchy = 'date'
+    inlines = [CampaignChunkInline]
+
+    actions = ['resume']
+
+    def resume(self, request, queryset):
+        runs = queryset.exclude(status=models.CampaignRun.FINISHED)
+        for run in runs:
+            tasks.dispatch_campaign_run(run)
+        messages.success(
+            request, 'Resumed {} campaign runs'.format(len(runs))
+        )
+
+    resume.short_description = (
+        "Resume sending the chunks of the selected runs that are not done"
+    )
@@ -1,15 +1,138 @@
 import abc
-from collections import namedtuple
-
-from django.core.mail import EmailMultiAlternatives
+from collections import Counter, defaultdict, namedtuple
+from functools import lru_cache
+from itertools import islice
+import logging
+import smtplib
+import socket
+import time
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.test.signals import setting_changed
 
 from notifications import constants, helpers, models
 
 
+logger = logging.getLogger(__name__)
+
 Recipient = namedtuple('Recipient', ['email', 'name'])
 
+# Messages rendered, and their records written, at a time by send_all
+SEND_ALL_CHUNK_SIZE = 100
+
+# Context shared by every recipient of a notification class
+shared_context_cache = {}
+
+
+@lru_cache(maxsize=None)
+def get_compiled_template(template_name):
+    # parsed once per process, rendering only substitutes the context
+    return get_template(template_name)
+
+
+@lru_cache(maxsize=256)
+def render_fragment(template_name, context_items):
+    # many recipients of a campaign are sent the same fragment
+    return get_compiled_template(template_name).render(dict(context_items))
+
+
+@receiver(setting_changed)
+def clear_rendering_caches(**kwargs):
+    get_compiled_template.cache_clear()
+    render_fragment.cache_clear()
+    shared_context_cache.clear()
+
+
+def send_all(
+    notifications, chunk_size=SEND_ALL_CHUNK_SIZE, stats=None, on_chunk=None
+):
+    """
+    Sends the notifications over a single connection to the email backend,
+    and records the ones delivered with one bulk_create per model per chunk.
+    A message that fails is logged and not recorded, and sending continues
+    with the next.
+
+    Arguments:
+        stats {collections.Counter} -- incremented with the 'sent' and
+            'failed' messages, and the 'render_seconds' and 'send_seconds'
+            spent on them
+        on_chunk {callable} -- called after each chunk is recorded
+
+    Returns:
+        int -- the number of notifications delivered
+
+    """
+
+    if stats is None:
+        stats = Counter()
+    notifications = iter(notifications)
+    delivered = 0
+    with get_connection() as connection:
+        while True:
+            chunk = list(islice(notifications, chunk_size))
+            if not chunk:
+                return delivered
+            records = defaultdict(list)
+            try:
+                for notification in chunk:
+                    if send_one(notification, connection, records, stats):
+                        delivered += 1
+            finally:
+                # messages already delivered are recorded even if the chunk
+                # is interrupted, so they are not sent again
+                for model, model_records in records.items():
+                    model.objects.bulk_create(model_records)
+            if on_chunk:
+                on_chunk()
+
+
+def send_one(notification, connection, records, stats):
+    """
+    Renders and sends the notification, and adds its record to `records` if
+    it was delivered. After an SMTP or socket error the connection is
+    reopened, so the following messages still share one connection.
+
+    Returns:
+        bool -- True if the notification was delivered
+
+    """
+
+    started = time.monotonic()
+    sent = 0
+    try:
+        message = notification.get_message()
+    except Exception:
+        logger.exception('Failed rendering %s', notification.recipient.email)
+        message = None
+    rendered = time.monotonic()
+    if message is not None:
+        try:
+            sent = connection.send_messages([message])
+        except (smtplib.SMTPException, socket.error):
+            logger.exception(
+                'Failed sending %s', notification.recipient.email
+            )
+            # the connection may be unusable. Left closed, the backend would
+            # open and close a new one for every following message
+            connection.close()
+            connection.open()
+        except Exception:
+            logger.exception(
+                'Failed sending %s', notification.recipient.email
+            )
+    stats['render_seconds'] += rendered - started
+    stats['send_seconds'] += time.monotonic() - rendered
+    if not sent:
+        stats['failed'] += 1
+        return False
+    record = notification.get_record()
+    records[type(record)].append(record)
+    stats['sent'] += 1
+    return True
+
 
 class NotificationBase(abc.ABC):
     category = abc.abstractproperty()
@@ -19,20 +142,26 @@ class NotificationBase(abc.ABC):
     subject = abc.abstractproperty()
     text_template = abc.abstractproperty()
     unsubscribe_url = abc.abstractproperty()
-    zendesk_url = settings.ZENDESK_URL
+
+    @classmethod
+    def get_shared_context_data(cls):
+        return {'zendesk_url': settings.ZENDESK_URL}
 
     def get_context_data(self, **kwargs):
+        cls = type(self)
+        if cls not in shared_context_cache:
+            shared_context_cache[cls] = cls.get_shared_context_data()
         return {
+            **shared_context_cache[cls],
             'full_name': self.recipient.name,
-            'zendesk_url': self.zendesk_url,
             'unsubscribe_url': self.unsubscribe_url,
             **kwargs
         }
 
-    def send(self):
+    def get_message(self):
         context = self.get_context_data()
-        text_body = render_to_string(self.text_template, context)
-        html_body = render_to_string(self.html_template, context)
+        text_body = get_compiled_template(self.text_template).render(context)
+        html_body = get_compiled_template(self.html_template).render(context)
         message = EmailMultiAlternatives(
             subject=self.subject,
             body=text_body,
@@ -40,7 +169,10 @@ class NotificationBase(abc.ABC):
             from_email=self.from_email,
         )
         message.attach_alternative(html_body, "text/html")
-        message.send()
+        return message
+
+    def send(self):
+        self.get_message().send()
         self.record_sent()
 
     @abc.abstractmethod
@@ -61,11 +193,16 @@ class SupplierNotificationBase(NotificationBase):
             email=self.supplier.company_email
         )
 
-    def record_sent(self):
-        return models.SupplierEmailNotification.objects.create(
+    def get_record(self):
+        return models.SupplierEmailNotification(
             supplier=self.supplier, category=self.category,
         )
 
+    def record_sent(self):
+        record = self.get_record()
+        record.save()
+        return record
+
 
 class AnonymousSubscriberNotificationBase(NotificationBase):
     from_email = settings.FAS_FROM_EMAIL
@@ -80,11 +217,16 @@ class AnonymousSubscriberNotificationBase(NotificationBase):
             email=self.subscriber['email']
         )
 
-    def record_sent(self):
-        return models.AnonymousEmailNotification.objects.create(
+    def get_record(self):
+        return models.AnonymousEmailNotification(
             email=self.recipient.email, category=self.category,
         )
 
+    def record_sent(self):
+        record = self.get_record()
+        record.save()
+        return record
+
 
 class NoCaseStudiesNotification(SupplierNotificationBase):
     html_template = 'no_case_studies_email.html'
@@ -93,11 +235,13 @@ class NoCaseStudiesNotification(SupplierNotificationBase):
     text_template = 'no_case_studies_email.txt'
     unsubscribe_url = settings.FAB_NOTIFICATIONS_UNSUBSCRIBE_URL
 
-    def get_context_data(self):
-        return super().get_context_data(
-            case_study_url=settings.NO_CASE_STUDIES_URL,
-            utm_params=settings.NO_CASE_STUDIES_UTM,
-        )
+    @classmethod
+    def get_shared_context_data(cls):
+        return {
+            **super().get_shared_context_data(),
+            'case_study_url': settings.NO_CASE_STUDIES_URL,
+            'utm_params': settings.NO_CASE_STUDIES_UTM,
+        }
 
 
 class HasNotLoggedInRecentlyNotification(SupplierNotificationBase):
@@ -107,11 +251,13 @@ class HasNotLoggedInRecentlyNotification(SupplierNotificationBase):
     text_template = 'hasnt_logged_in_email.txt'
     unsubscribe_url = settings.FAB_NOTIFICATIONS_UNSUBSCRIBE_URL
 
-    def get_context_data(self):
-        return super().get_context_data(
-            login_url=settings.HASNT_LOGGED_IN_URL,
-            utm_params=settings.HASNT_LOGGED_IN_UTM,
-        )
+    @classmethod
+    def get_shared_context_data(cls):
+        return {
+            **super().get_shared_context_data(),
+            'login_url': settings.HASNT_LOGGED_IN_URL,
+            'utm_params': settings.HASNT_LOGGED_IN_UTM,
+        }
 
 
 class VerificationWaitingNotification(SupplierNotificationBase):
@@ -121,10 +267,12 @@ class VerificationWaitingNotification(SupplierNotificationBase):
     text_template = 'verification_code_not_given_email.txt'
     unsubscribe_url = settings.FAB_NOTIFICATIONS_UNSUBSCRIBE_URL
 
-    def get_context_data(self):
-        return super().get_context_data(
-            verification_url=settings.VERIFICATION_CODE_URL,
-        )
+    @classmethod
+    def get_shared_context_data(cls):
+        return {
+            **super().get_shared_context_data(),
+            'verification_url': settings.VERIFICATION_CODE_URL,
+        }
 
 
 class VerificationStillWaitingNotification(SupplierNotificationBase):
@@ -134,10 +282,12 @@ class VerificationStillWaitingNotification(SupplierNotificationBase):
     text_template = 'verification_code_not_given_2nd_email.txt'
     unsubscribe_url = settings.FAB_NOTIFICATIONS_UNSUBSCRIBE_URL
 
-    def get_context_data(self):
-        return super().get_context_data(
-            verification_url=settings.VERIFICATION_CODE_URL,
-        )
+    @classmethod
+    def get_shared_context_data(cls):
+        return {
+            **super().get_shared_context_data(),
+            'verification_url': settings.VERIFICATION_CODE_URL,
+        }
 
 
 class NewCompaniesInSectorNotification(AnonymousSubscriberNotificationBase):
@@ -145,6 +295,8 @@ class NewCompaniesInSectorNotification(AnonymousSubscriberNotificationBase):
     category = constants.NEW_COMPANIES_IN_SECTOR
     subject = settings.NEW_COMPANIES_IN_SECTOR_SUBJECT
     text_template = 'new_companies_in_sector_email.txt'
+    companies_html_template = 'new_companies_in_sector_companies.html'
+    companies_text_template = 'new_companies_in_sector_companies.txt'
 
     def __init__(self, subscriber, companies):
         self.companies = companies
@@ -154,11 +306,30 @@ class NewCompaniesInSectorNotification(AnonymousSubscriberNotificationBase):
     def unsubscribe_url(self):
         return helpers.get_anonymous_unsubscribe_url(self.recipient.email)
 
+    @classmethod
+    def get_shared_context_data(cls):
+        return {
+            **super().get_shared_context_data(),
+            'company_list_url': settings.FAS_COMPANY_LIST_URL,
+            'utm_params': settings.NEW_COMPANIES_IN_SECTOR_UTM,
+        }
+
     def get_context_data(self):
+        # sorted, so the same set of companies always shows the same five,
+        # and renders the fragment from the same cache key
+        companies = tuple(sorted(self.companies))[:5]  # show only 5: ED-1228
+        fragment_context = (
+            ('companies', companies),
+            ('utm_params', settings.NEW_COMPANIES_IN_SECTOR_UTM),
+        )
         return super().get_context_data(
-            company_list_url=settings.FAS_COMPANY_LIST_URL,
-            utm_params=settings.NEW_COMPANIES_IN_SECTOR_UTM,
-            companies=list(self.companies)[:5],  # show only 5: ED-1228
+            companies=companies,
+            companies_html=render_fragment(
+                self.companies_html_template, fragment_context
+            ),
+            companies_text=render_fragment(
+                self.companies_text_template, fragment_context
+            ),
         )
 
 
@@ -1,53 +1,127 @@
 import urllib
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import defaultdict, namedtuple
+from datetime import timedelta
 
+from django.contrib.postgres.aggregates import ArrayAgg
 from django.core.signing import Signer
 from django.conf import settings
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
 
+from api.utils import iterate_queryset_server_side
 from buyer.models import Buyer
 from company.models import Company
 from notifications.models import (
     AnonymousUnsubscribe,
     AnonymousEmailNotification,
+    SupplierEmailNotification,
 )
 from notifications import constants
 
 
+# The fields of a company shown in the new companies in sector email
+NewCompany = namedtuple(
+    'NewCompany', ['number', 'name', 'summary', 'description']
+)
+
+
+def get_day_range(days_ago):
+    """
+    Returns the half open range [start, end) of the UTC day `days_ago` days
+    before today. Unlike __year/__month/__day lookups, range predicates can
+    be served by an index on the column.
+
+    """
+
+    start = (timezone.now() - timedelta(days=days_ago)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return start, start + timedelta(days=1)
+
+
+def get_time_windows(start, end, size):
+    """
+    Splits the inclusive range [start, end] into consecutive inclusive
+    windows of `size`.
+
+    Returns:
+        list -- (window_start, window_end) tuples
+
+    """
+
+    windows = []
+    while start <= end:
+        window_end = min(start + size - timedelta(microseconds=1), end)
+        windows.append((start, window_end))
+        start = window_end + timedelta(microseconds=1)
+    return windows
+
+
+def exclude_suppliers_notified(queryset, category):
+    """
+    Excludes suppliers that were sent a notification of `category`. NOT
+    EXISTS lets Postgres anti-join on the (supplier, category) index rather
+    than hashing every notification of the category.
+
+    """
+
+    sql = (
+        'NOT EXISTS (SELECT 1 FROM {notification} WHERE '
+        '{notification}.supplier_id = {supplier}.id AND '
+        '{notification}.category = %s)'
+    ).format(
+        notification=SupplierEmailNotification._meta.db_table,
+        supplier=queryset.model._meta.db_table,
+    )
+    return queryset.extra(where=[sql], params=[category])
+
+
 def group_new_companies_by_industry():
     """
     Groups new companies (companies that published within past 7 days) by the
     industries they have selected. If a company has multiple industries then
-    the company will appear multiple times.
+    the company will appear multiple times. The industries are unnested in
+    the database, and only the columns the email shows are read.
 
     :returns: a dictionary
         {
-            'AEROSPACE': [<Company 1>, <Company 2>],
-            'AIRPORTS': [<Company 1>],
+            'AEROSPACE': [<NewCompany 1>, <NewCompany 2>],
+            'AIRPORTS': [<NewCompany 1>],
         }
 
     """
 
     days = settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS
-    date_published = datetime.utcnow() - timedelta(days=days)
-    companies_from_date_published = Company.objects.filter(
-        date_published__gte=date_published,
-    )
+    # date_published is a date, compared with a timestamp the boundary day
+    # would become midnight and be left out
+    date_published = (timezone.now() - timedelta(days=days)).date()
+    sql = (
+        'SELECT industry, number, name, summary, description '
+        'FROM {company}, jsonb_array_elements_text({company}.sectors) '
+        'AS industry '
+        'WHERE date_published >= %s '
+        "AND jsonb_typeof({company}.sectors) = 'array'"
+    ).format(company=Company._meta.db_table)
     companies_by_industry = defaultdict(list)
-    for company in companies_from_date_published:
-        for industry in company.sectors:
-            companies_by_industry[industry].append(company)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [date_published])
+        for industry, *fields in cursor:
+            companies_by_industry[industry].append(NewCompany(*fields))
     return companies_by_industry
 
 
-def get_new_companies_anonymous_subscribers():
+def get_new_companies_anonymous_subscribers(emails=None):
     """
     An email can subscribe to multiple industries. This removes duplicate
     email addresses and groups industries. Excludes subscribers that have
     already received "new companies in industry" email within configured
-    time period.
+    time period. Grouping and exclusion happen in the database, and the rows
+    are streamed from a server-side cursor.
 
-    :returns list:
+    :param emails: only consider the buyers with these emails
+
+    :returns iterator:
         [
             {
                 'name': 'Jim Example',
@@ -58,27 +132,35 @@ def get_new_companies_anonymous_subscribers():
 
     """
 
-    unsubscribers = AnonymousUnsubscribe.objects.all()
-    delta = timedelta(days=settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS)
-    notifications_sent_recently = AnonymousEmailNotification.objects.filter(
-        category=constants.NEW_COMPANIES_IN_SECTOR,
-        date_sent__date__gte=datetime.utcnow() - delta
+    sent_since, _ = get_day_range(
+        settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS
     )
-    exclude_emails = (
-        list(unsubscribers.values_list('email', flat=True)) +
-        list(notifications_sent_recently.values_list('email', flat=True))
+    buyer = Buyer._meta.db_table
+    unsubscribed = (
+        'NOT EXISTS (SELECT 1 FROM {unsubscribe} '
+        'WHERE {unsubscribe}.email = {buyer}.email)'
+    ).format(unsubscribe=AnonymousUnsubscribe._meta.db_table, buyer=buyer)
+    sent_recently = (
+        'NOT EXISTS (SELECT 1 FROM {notification} '
+        'WHERE {notification}.email = {buyer}.email '
+        'AND {notification}.category = %s '
+        'AND {notification}.date_sent >= %s)'
+    ).format(
+        notification=AnonymousEmailNotification._meta.db_table, buyer=buyer
+    )
+    buyers = Buyer.objects.all()
+    if emails is not None:
+        buyers = buyers.filter(email__in=emails)
+    return iterate_queryset_server_side(
+        buyers
+        .extra(
+            where=[unsubscribed, sent_recently],
+            params=[constants.NEW_COMPANIES_IN_SECTOR, sent_since],
+        )
+        .values('email')
+        .annotate(name=Min('name'), industries=ArrayAgg('sector'))
+        .order_by()
     )
-
-    subscribers = {}
-    for buyer in Buyer.objects.exclude(email__in=exclude_emails):
-        if buyer.email not in subscribers:
-            subscribers[buyer.email] = {
-                'name': buyer.name,
-                'email': buyer.email,
-                'industries': [],
-            }
-        subscribers[buyer.email]['industries'].append(buyer.sector)
-    return list(subscribers.values())
 
 
 def get_anonymous_unsubscribe_url(email):
@@ -0,0 +1,63 @@
+from uuid import uuid4
+
+from django_redis import get_redis_connection
+
+
+# Only the holder of the token may extend or release the lease
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Lease:
+    """
+    Lock in Redis that expires `timeout` seconds after it was last acquired
+    or renewed, so work held by a dead worker can be taken over without
+    waiting for a fixed TTL. The token can be handed to another process,
+    which then holds the lease.
+
+    """
+
+    def __init__(self, name, timeout, token=None):
+        self.name = name
+        self.timeout = timeout
+        self.token = token or uuid4().hex
+
+    @property
+    def connection(self):
+        return get_redis_connection('default')
+
+    def acquire(self):
+        return bool(self.connection.set(
+            self.name, self.token, nx=True, px=int(self.timeout * 1000)
+        ))
+
+    def is_held(self):
+        return bool(self.connection.exists(self.name))
+
+    def renew(self):
+        return bool(self.connection.eval(
+            RENEW_SCRIPT, 1, self.name, self.token, int(self.timeout * 1000)
+        ))
+
+    def renew_or_raise(self):
+        if not self.renew():
+            raise LeaseLost(self.name)
+
+    def release(self):
+        return bool(
+            self.connection.eval(RELEASE_SCRIPT, 1, self.name, self.token)
+        )
@@ -0,0 +1,88 @@
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+
+def get_last_logins(start, end, users):
+    """
+    Returns the users of the stub that last logged in between `start` and
+    `end`. Users 1 to `users` log in evenly spread across every day.
+
+    """
+
+    day_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds_per_user = 60 * 60 * 24 / users
+    elapsed = (start - day_start).total_seconds()
+    first = max(int(elapsed // seconds_per_user), 0)
+    last_logins = []
+    for index in range(first, users):
+        last_login = day_start + timedelta(seconds=index * seconds_per_user)
+        if last_login > end:
+            break
+        if last_login >= start:
+            last_logins.append({
+                'id': index + 1,
+                'last_login': last_login.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            })
+    return last_logins
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local stub of the SSO last login API, for benchmarking the '
+        'hasnt logged in notification. Point SSO_API_CLIENT_BASE_URL at it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8004,
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=100000,
+            help='Number of users logging in each day',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Seconds taken by each response',
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        latency = options['latency']
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+                start = parse_datetime(params['start'][0])
+                end = parse_datetime(params['end'][0])
+                time.sleep(latency)
+                body = json.dumps(get_last_logins(start, end, users))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+
+        server = ThreadingHTTPServer(('', options['port']), Handler)
+        self.stdout.write(
+            'Stub SSO server running on port {}'.format(options['port'])
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
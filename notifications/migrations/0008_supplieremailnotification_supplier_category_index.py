@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-07-04 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0007_auto_20170314_1712'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='supplieremailnotification',
+            index_together=set([('supplier', 'category')]),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-07-06 14:31
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_supplieremailnotification_supplier_category_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('recipients', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=20)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('render_seconds', models.FloatField(default=0)),
+                ('send_seconds', models.FloatField(default=0)),
+                ('date_started', models.DateTimeField(blank=True, null=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('index',),
+            },
+        ),
+        migrations.CreateModel(
+            name='CampaignRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campaign', models.CharField(choices=[('no_case_studies', 'Case studies not created'), ('hasnt_logged_in', 'Not logged in after first 30 days'), ('verification_code_not_given', 'Verification code not supplied'), ('verification_code_2nd_email', 'Verification code not supplied - 2nd email'), ('new_companies_in_sector', 'New companies in sector')], max_length=255)),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('finished', 'Finished')], default='running', max_length=20)),
+                ('recipients', models.PositiveIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('render_seconds', models.FloatField(default=0)),
+                ('send_seconds', models.FloatField(default=0)),
+                ('date_started', models.DateTimeField(auto_now_add=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('-date', 'campaign'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='campaignrun',
+            unique_together=set([('campaign', 'date')]),
+        ),
+        migrations.AddField(
+            model_name='campaignchunk',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='notifications.CampaignRun'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='campaignchunk',
+            unique_together=set([('run', 'index')]),
+        ),
+    ]
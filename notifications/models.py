@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import JSONField
 from django.db import models
 
 from notifications import constants
@@ -9,6 +10,9 @@ class SupplierEmailNotification(models.Model):
         max_length=255, choices=constants.SUPPLIER_NOTIFICATION_CATEGORIES)
     date_sent = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        index_together = [('supplier', 'category')]
+
     def __str__(self):
         return '{email}: {category}'.format(
             email=self.supplier.company_email,
@@ -38,3 +42,85 @@ class AnonymousUnsubscribe(models.Model):
     """
 
     email = models.EmailField(unique=True)
+
+
+class CampaignRun(models.Model):
+    """
+    A day's run of a notification category, sent in chunks by the workers.
+    A run that stopped part way resumes with the chunks that are not done.
+
+    """
+
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    STATUSES = (
+        (RUNNING, 'Running'),
+        (FINISHED, 'Finished'),
+    )
+
+    campaign = models.CharField(
+        max_length=255,
+        choices=(
+            constants.SUPPLIER_NOTIFICATION_CATEGORIES +
+            constants.BUYER_NOTIFICATION_CATEGORIES
+        ),
+    )
+    date = models.DateField()
+    status = models.CharField(
+        max_length=20, choices=STATUSES, default=RUNNING
+    )
+    recipients = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    render_seconds = models.FloatField(default=0)
+    send_seconds = models.FloatField(default=0)
+    date_started = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('campaign', 'date')
+        ordering = ('-date', 'campaign')
+
+    def __str__(self):
+        return '{campaign} {date}'.format(
+            campaign=self.campaign, date=self.date
+        )
+
+    @property
+    def recipients_per_second(self):
+        if not self.date_finished:
+            return None
+        seconds = (self.date_finished - self.date_started).total_seconds()
+        return round(self.sent / seconds, 2) if seconds else None
+
+
+class CampaignChunk(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+    )
+
+    run = models.ForeignKey(CampaignRun, related_name='chunks')
+    index = models.PositiveIntegerField()
+    # supplier pks, or buyer emails for new companies in sector
+    recipients = JSONField()
+    status = models.CharField(
+        max_length=20, choices=STATUSES, default=PENDING
+    )
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    render_seconds = models.FloatField(default=0)
+    send_seconds = models.FloatField(default=0)
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('run', 'index')
+        ordering = ('index',)
+
+    def __str__(self):
+        return '{run} #{index}'.format(run=self.run, index=self.index)
@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
+from itertools import islice
 
 from django.conf import settings
+from django.db.models import Q
 
 from directory_sso_api_client.client import DirectorySSOAPIClient
 
@@ -8,30 +11,80 @@ from notifications import constants, email, helpers
 from user.models import User as Supplier
 
 
+SUPPLIER_NOTIFICATION_CLASSES = {
+    notification_class.category: notification_class
+    for notification_class in (
+        email.NoCaseStudiesNotification,
+        email.HasNotLoggedInRecentlyNotification,
+        email.VerificationWaitingNotification,
+        email.VerificationStillWaitingNotification,
+    )
+}
+
 sso_api_client = DirectorySSOAPIClient(
     base_url=settings.SSO_API_CLIENT_BASE_URL,
     api_key=settings.SSO_SIGNATURE_SECRET,
 )
 
 
-def no_case_studies():
-    now = datetime.utcnow()
-    days_ago = now - timedelta(days=settings.NO_CASE_STUDIES_DAYS)
+def get_no_case_studies_suppliers():
+    start, end = helpers.get_day_range(settings.NO_CASE_STUDIES_DAYS)
     suppliers = Supplier.objects.filter(
-        company__supplier_case_studies__isnull=True,
-        date_joined__year=days_ago.year,
-        date_joined__month=days_ago.month,
-        date_joined__day=days_ago.day,
+        Q(company__isnull=True) | Q(company__has_case_studies=False),
+        date_joined__gte=start,
+        date_joined__lt=end,
         unsubscribed=False,
-    ).exclude(
-        supplieremailnotification__category=constants.NO_CASE_STUDIES,
     )
-    for supplier in suppliers:
-        notification = email.NoCaseStudiesNotification(supplier)
-        notification.send()
+    suppliers = helpers.exclude_suppliers_notified(
+        suppliers, constants.NO_CASE_STUDIES
+    )
+    return suppliers.select_related('company')
 
 
-def hasnt_logged_in():
+def no_case_studies():
+    email.send_all(
+        email.NoCaseStudiesNotification(supplier)
+        for supplier in get_no_case_studies_suppliers()
+    )
+
+
+def get_last_login_sso_ids(start, end):
+    response = sso_api_client.user.get_last_login(start=start, end=end)
+    return [sso_user['id'] for sso_user in response.json()]
+
+
+def iterate_last_login_sso_ids(start, end):
+    """
+    Yields the sso ids of the users who last logged in between `start` and
+    `end`, requested from SSO a window at a time so no single response holds
+    the whole day. The next window is fetched while the current one is
+    consumed.
+
+    """
+
+    windows = helpers.get_time_windows(
+        start, end, timedelta(minutes=settings.HASNT_LOGGED_IN_WINDOW_MINUTES)
+    )
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = None
+        for window_start, window_end in windows:
+            future = executor.submit(
+                get_last_login_sso_ids, window_start, window_end
+            )
+            if pending:
+                yield from pending.result()
+            pending = future
+        if pending:
+            yield from pending.result()
+
+
+def iterate_hasnt_logged_in_supplier_batches():
+    """
+    Yields querysets of the suppliers to notify, each matching a bounded
+    batch of sso ids, so the IN clause does not grow with the user base.
+
+    """
+
     now = datetime.utcnow()
     days_ago = now - timedelta(days=settings.HASNT_LOGGED_IN_DAYS)
     start_datetime = days_ago.replace(
@@ -41,69 +94,133 @@ def hasnt_logged_in():
         hour=23, minute=59, second=59, microsecond=999999
     )
 
-    login_data = sso_api_client.user.get_last_login(
-        start=start_datetime, end=end_datetime
-    ).json()
+    sso_ids = iterate_last_login_sso_ids(start_datetime, end_datetime)
+    while True:
+        batch = list(islice(sso_ids, settings.HASNT_LOGGED_IN_BATCH_SIZE))
+        if not batch:
+            return
+        yield helpers.exclude_suppliers_notified(
+            Supplier.objects.filter(sso_id__in=batch),
+            constants.HASNT_LOGGED_IN,
+        )
 
-    sso_ids = [sso_user['id'] for sso_user in login_data]
-    suppliers = Supplier.objects.filter(
-        sso_id__in=sso_ids
-    ).exclude(
-        supplieremailnotification__category=constants.HASNT_LOGGED_IN,
-    )
 
-    for supplier in suppliers:
-        notification = email.HasNotLoggedInRecentlyNotification(supplier)
-        notification.send()
+def get_hasnt_logged_in_suppliers():
+    for suppliers in iterate_hasnt_logged_in_supplier_batches():
+        yield from suppliers.select_related('company')
 
 
-def verification_code_not_given():
-    # first one
-    now = datetime.utcnow()
-    days_ago = now - timedelta(days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS)
-    suppliers = Supplier.objects.filter(
-        company__verified_with_code=False,
-        company__date_verification_letter_sent__year=days_ago.year,
-        company__date_verification_letter_sent__month=days_ago.month,
-        company__date_verification_letter_sent__day=days_ago.day,
-        unsubscribed=False,
-    ).exclude(
-        supplieremailnotification__category=constants.
-        VERIFICATION_CODE_NOT_GIVEN,
+def hasnt_logged_in():
+    email.send_all(
+        email.HasNotLoggedInRecentlyNotification(supplier)
+        for supplier in get_hasnt_logged_in_suppliers()
     )
-    for supplier in suppliers:
-        notification = email.VerificationWaitingNotification(supplier)
-        notification.send()
 
-    days_ago = datetime.utcnow() - timedelta(
-        days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS_2ND_EMAIL)
+
+def get_verification_code_not_given_suppliers(days, category):
+    start, end = helpers.get_day_range(days)
     suppliers = Supplier.objects.filter(
         company__verified_with_code=False,
-        company__date_verification_letter_sent__year=days_ago.year,
-        company__date_verification_letter_sent__month=days_ago.month,
-        company__date_verification_letter_sent__day=days_ago.day,
+        company__date_verification_letter_sent__gte=start,
+        company__date_verification_letter_sent__lt=end,
         unsubscribed=False,
-    ).exclude(
-        supplieremailnotification__category=constants.
-        VERIFICATION_CODE_2ND_EMAIL,
     )
-    for supplier in suppliers:
-        notification = email.VerificationStillWaitingNotification(supplier)
-        notification.send()
+    suppliers = helpers.exclude_suppliers_notified(suppliers, category)
+    return suppliers.select_related('company')
 
 
-def new_companies_in_sector():
+def verification_code_not_given():
+    suppliers = get_verification_code_not_given_suppliers(
+        days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS,
+        category=constants.VERIFICATION_CODE_NOT_GIVEN,
+    )
+    email.send_all(
+        email.VerificationWaitingNotification(supplier)
+        for supplier in suppliers
+    )
+
+    suppliers = get_verification_code_not_given_suppliers(
+        days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS_2ND_EMAIL,
+        category=constants.VERIFICATION_CODE_2ND_EMAIL,
+    )
+    email.send_all(
+        email.VerificationStillWaitingNotification(supplier)
+        for supplier in suppliers
+    )
+
+
+def get_new_companies_in_sector_notifications(emails=None):
     companies_grouped_by_industry = helpers.group_new_companies_by_industry()
+    subscribers = helpers.get_new_companies_anonymous_subscribers(
+        emails=emails
+    )
 
-    for subscriber in helpers.get_new_companies_anonymous_subscribers():
+    for subscriber in subscribers:
         companies = set()
         for industry in subscriber['industries']:
             companies.update(companies_grouped_by_industry[industry])
         if companies:
-            notification = email.NewCompaniesInSectorNotification(
+            yield email.NewCompaniesInSectorNotification(
                 subscriber=subscriber, companies=companies
             )
-            notification.send()
+
+
+def new_companies_in_sector():
+    email.send_all(get_new_companies_in_sector_notifications())
+
+
+def send_supplier_notifications(category, pks, **kwargs):
+    """
+    Sends the notification of `category` to the suppliers that have not been
+    sent it yet, so sending to the same suppliers again is harmless. Keyword
+    arguments are passed to email.send_all.
+
+    Returns:
+        int -- the number of notifications delivered
+
+    """
+
+    notification_class = SUPPLIER_NOTIFICATION_CLASSES[category]
+    suppliers = helpers.exclude_suppliers_notified(
+        Supplier.objects.filter(pk__in=pks), category
+    )
+    return email.send_all(
+        (
+            notification_class(supplier)
+            for supplier in suppliers.select_related('company')
+        ),
+        **kwargs
+    )
+
+
+def send_new_companies_in_sector(emails, **kwargs):
+    """
+    Sends the new companies in sector notification to the subscribers of
+    `emails` that have not been sent it recently. Keyword arguments are
+    passed to email.send_all.
+
+    Returns:
+        int -- the number of notifications delivered
+
+    """
+
+    return email.send_all(
+        get_new_companies_in_sector_notifications(emails=emails), **kwargs
+    )
+
+
+def send_campaign(campaign, recipients, **kwargs):
+    """
+    Sends the notification of the `campaign` category to the recipients: the
+    emails of buyers for new companies in sector, otherwise supplier pks.
+
+    """
+
+    if campaign == constants.NEW_COMPANIES_IN_SECTOR:
+        return send_new_companies_in_sector(emails=recipients, **kwargs)
+    return send_supplier_notifications(
+        category=campaign, pks=recipients, **kwargs
+    )
 
 
 def supplier_unsubscribed(supplier):
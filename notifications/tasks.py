@@ -1,39 +1,231 @@
-from django.core.cache import cache
+from collections import Counter
+import logging
+
+from celery import chord, group
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
 
 from api.celery import app
-from notifications import notifications
+from notifications import constants, helpers, models, notifications
+from notifications.leases import Lease, LeaseLost
+
+
+logger = logging.getLogger(__name__)
+
+RUN_LEASE_KEY = 'notifications-campaign-run:{pk}'
+CHUNK_LEASE_KEY = 'notifications-campaign-chunk:{pk}'
+CHUNK_STATS = ('sent', 'failed', 'render_seconds', 'send_seconds')
+
+
+def get_chunks(items):
+    size = settings.NOTIFICATIONS_CHUNK_SIZE
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def start_campaign(campaign, get_recipients):
+    """
+    Creates today's run of the campaign, split into chunks of recipients, and
+    dispatches it. If today's run already exists, its unfinished chunks are
+    dispatched instead, so calling this again resumes a run that stopped.
+
+    Arguments:
+        campaign {str} -- notification category
+        get_recipients {callable} -- returns the recipients of the campaign
+
+    """
 
+    date = timezone.now().date()
+    run = models.CampaignRun.objects.filter(
+        campaign=campaign, date=date
+    ).first()
+    if run is None:
+        # fetched before the transaction, as it can take many requests to
+        # other services
+        recipients = list(get_recipients())
+        with transaction.atomic():
+            run, created = models.CampaignRun.objects.get_or_create(
+                campaign=campaign, date=date,
+            )
+            if created:
+                models.CampaignChunk.objects.bulk_create(
+                    models.CampaignChunk(
+                        run=run, index=index, recipients=chunk
+                    )
+                    for index, chunk in enumerate(get_chunks(recipients))
+                )
+                run.recipients = len(recipients)
+                run.save(update_fields=['recipients'])
+    return dispatch_campaign_run(run)
 
-def lock_acquired(lock_name):
-    """ Returns False if the lock was already set in the last 20 hours
 
-    Multiple celery beat schedulers are running at the same time, which
-    results in duplicated scheduled tasks. Cache-lock mechanism is used to
-    assure that only one task gets executed. Lock expires after 20 hours
+def dispatch_campaign_run(run):
+    """
+    Sends the chunks of the run that are not done, and not held by a live
+    worker, to the workers in parallel. Each task takes the lease of its
+    chunk when it starts, so a chunk queued twice is only sent by one.
 
     """
-    return cache.add(lock_name, 'acquired', 72000)
+
+    if run.status == models.CampaignRun.FINISHED:
+        return None
+    lease = Lease(
+        RUN_LEASE_KEY.format(pk=run.pk),
+        timeout=settings.NOTIFICATIONS_LEASE_TIMEOUT,
+    )
+    if not lease.acquire():
+        return None
+    try:
+        signatures = []
+        for chunk in run.chunks.exclude(status=models.CampaignChunk.DONE):
+            chunk_lease = Lease(
+                CHUNK_LEASE_KEY.format(pk=chunk.pk),
+                timeout=settings.NOTIFICATIONS_LEASE_TIMEOUT,
+            )
+            if not chunk_lease.is_held():
+                signatures.append(send_campaign_chunk.s(chunk_pk=chunk.pk))
+        if not signatures:
+            if not run.chunks.exclude(
+                status=models.CampaignChunk.DONE
+            ).exists():
+                return finish_campaign_run([], run_pk=run.pk)
+            return None
+        callback = finish_campaign_run.s(run_pk=run.pk)
+        return chord(group(signatures))(callback)
+    finally:
+        lease.release()
+
+
+@app.task(acks_late=True)
+def send_campaign_chunk(chunk_pk):
+    # acks_late redelivers the chunk if the worker dies. Recipients that were
+    # already notified are skipped when a chunk is sent again.
+    lease = Lease(
+        CHUNK_LEASE_KEY.format(pk=chunk_pk),
+        timeout=settings.NOTIFICATIONS_LEASE_TIMEOUT,
+    )
+    # taken when the task starts rather than when it is queued, so it cannot
+    # expire while the task waits for a worker. Held by another worker
+    # sending the chunk.
+    if not lease.acquire():
+        return None
+    chunk = models.CampaignChunk.objects.select_related('run').get(
+        pk=chunk_pk
+    )
+    if chunk.status == chunk.DONE:
+        lease.release()
+        return None
+
+    chunk.status = chunk.RUNNING
+    chunk.date_started = chunk.date_started or timezone.now()
+    chunk.save(update_fields=['status', 'date_started'])
+    stats = Counter({name: getattr(chunk, name) for name in CHUNK_STATS})
+
+    def heartbeat():
+        lease.renew_or_raise()
+        models.CampaignChunk.objects.filter(pk=chunk.pk).update(**stats)
+
+    try:
+        notifications.send_campaign(
+            campaign=chunk.run.campaign,
+            recipients=chunk.recipients,
+            stats=stats,
+            on_chunk=heartbeat,
+        )
+    except LeaseLost:
+        logger.warning('Lease of %s lost, stopped sending', chunk)
+        return None
+    except Exception:
+        # not raised, so the chord still calls finish_campaign_run. The chunk
+        # is sent again when the run is resumed.
+        logger.exception('Failed sending %s', chunk)
+        models.CampaignChunk.objects.filter(pk=chunk.pk).update(
+            status=chunk.PENDING, **stats
+        )
+        lease.release()
+        return None
+    models.CampaignChunk.objects.filter(pk=chunk.pk).update(
+        status=chunk.DONE, date_finished=timezone.now(), **stats
+    )
+    lease.release()
+    return stats['sent']
+
+
+@app.task
+def finish_campaign_run(results, run_pk):
+    run = models.CampaignRun.objects.get(pk=run_pk)
+    totals = run.chunks.aggregate(*[Sum(name) for name in CHUNK_STATS])
+    for name in CHUNK_STATS:
+        setattr(run, name, totals[name + '__sum'] or 0)
+    if not run.chunks.exclude(status=models.CampaignChunk.DONE).exists():
+        run.status = run.FINISHED
+        run.date_finished = timezone.now()
+    run.save()
+    logger.info(
+        '%s: %s sent, %s failed, %s recipients/sec, %.1fs rendering, '
+        '%.1fs sending',
+        run, run.sent, run.failed, run.recipients_per_second,
+        run.render_seconds, run.send_seconds,
+    )
+    return run.sent
+
+
+def get_supplier_pks(suppliers):
+    return list(suppliers.order_by('pk').values_list('pk', flat=True))
 
 
 @app.task
 def no_case_studies():
-    if lock_acquired('no_case_studies'):
-        notifications.no_case_studies()
+    start_campaign(
+        campaign=constants.NO_CASE_STUDIES,
+        get_recipients=lambda: get_supplier_pks(
+            notifications.get_no_case_studies_suppliers()
+        ),
+    )
 
 
 @app.task
 def hasnt_logged_in():
-    if lock_acquired('hasnt_logged_in'):
-        notifications.hasnt_logged_in()
+    start_campaign(
+        campaign=constants.HASNT_LOGGED_IN,
+        get_recipients=lambda: [
+            pk
+            for suppliers in
+            notifications.iterate_hasnt_logged_in_supplier_batches()
+            for pk in get_supplier_pks(suppliers)
+        ],
+    )
 
 
 @app.task
 def verification_code_not_given():
-    if lock_acquired('verification_code_not_given'):
-        notifications.verification_code_not_given()
+    start_campaign(
+        campaign=constants.VERIFICATION_CODE_NOT_GIVEN,
+        get_recipients=lambda: get_supplier_pks(
+            notifications.get_verification_code_not_given_suppliers(
+                days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS,
+                category=constants.VERIFICATION_CODE_NOT_GIVEN,
+            )
+        ),
+    )
+    start_campaign(
+        campaign=constants.VERIFICATION_CODE_2ND_EMAIL,
+        get_recipients=lambda: get_supplier_pks(
+            notifications.get_verification_code_not_given_suppliers(
+                days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS_2ND_EMAIL,
+                category=constants.VERIFICATION_CODE_2ND_EMAIL,
+            )
+        ),
+    )
 
 
 @app.task
 def new_companies_in_sector():
-    if lock_acquired('new_companies_in_sector'):
-        notifications.new_companies_in_sector()
+    start_campaign(
+        campaign=constants.NEW_COMPANIES_IN_SECTOR,
+        get_recipients=lambda: sorted(
+            subscriber['email'] for subscriber in
+            helpers.get_new_companies_anonymous_subscribers()
+        ),
+    )
@@ -1,13 +1,17 @@
 from collections import OrderedDict
 from unittest import TestCase
+from unittest.mock import patch
 
 from django.test import Client
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 import pytest
 
+from notifications import constants
 from notifications.models import (
+    CampaignRun,
     SupplierEmailNotification,
     AnonymousEmailNotification
 )
@@ -49,7 +53,8 @@ class DownloadCSVTestCase(TestCase):
             ('id', str(supplier_email_notification.id)),
             ('supplier', str(supplier_email_notification.supplier.id)),
         ])
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
 
         assert actual[0] == ','.join(expected_data.keys())
         assert actual[1] == ','.join(expected_data.values())
@@ -91,7 +96,8 @@ class DownloadCSVTestCase(TestCase):
             follow=True
         )
 
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
         assert actual[0] == ','.join(
             supplier_email_notification_one_expected_data.keys()
         )
@@ -127,7 +133,8 @@ class DownloadCSVTestCase(TestCase):
             ('email', str(anonymous_email_notification.email)),
             ('id', str(anonymous_email_notification.id)),
         ])
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
 
         assert actual[0] == ','.join(expected_data.keys())
         assert actual[1] == ','.join(expected_data.values())
@@ -169,7 +176,8 @@ class DownloadCSVTestCase(TestCase):
             follow=True
         )
 
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
         assert actual[0] == ','.join(
             anonymous_email_notification_one_expected_data.keys()
         )
@@ -182,3 +190,38 @@ class DownloadCSVTestCase(TestCase):
         assert actual[3] == ','.join(
             anonymous_email_notification_three_expected_data.values()
         )
+
+
+@pytest.mark.django_db
+class CampaignRunAdminTestCase(TestCase):
+
+    def setUp(self):
+        superuser = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='test'
+        )
+        self.client = Client()
+        self.client.force_login(superuser)
+
+    @patch('notifications.tasks.dispatch_campaign_run')
+    def test_resume(self, mock_dispatch_campaign_run):
+        running = CampaignRun.objects.create(
+            campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+        )
+        finished = CampaignRun.objects.create(
+            campaign=constants.HASNT_LOGGED_IN,
+            date=timezone.now().date(),
+            status=CampaignRun.FINISHED,
+        )
+
+        data = {
+            'action': 'resume',
+            '_selected_action': [running.pk, finished.pk],
+        }
+        response = self.client.post(
+            reverse('admin:notifications_campaignrun_changelist'),
+            data,
+            follow=True
+        )
+
+        assert response.status_code == 200
+        mock_dispatch_campaign_run.assert_called_once_with(running)
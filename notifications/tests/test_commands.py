@@ -1,3 +1,4 @@
+from datetime import datetime
 from unittest.mock import patch
 
 import pytest
@@ -5,6 +6,8 @@ import pytest
 from django.core.management import call_command
 from django.core.management.base import CommandError
 
+from notifications.management.commands import run_stub_sso_server
+
 
 @patch('notifications.notifications.no_case_studies')
 @patch('notifications.notifications.hasnt_logged_in')
@@ -44,3 +47,16 @@ def test_notify_command_handles_incorrect_type_param():
 def test_notify_command_requires_type_param():
     with pytest.raises(CommandError):
         call_command('send_notifications')
+
+
+def test_stub_sso_server_last_logins():
+    last_logins = run_stub_sso_server.get_last_logins(
+        start=datetime(2017, 1, 1, 1, 0),
+        end=datetime(2017, 1, 1, 1, 59, 59, 999999),
+        users=48,
+    )
+
+    assert last_logins == [
+        {'id': 3, 'last_login': '2017-01-01T01:00:00Z'},
+        {'id': 4, 'last_login': '2017-01-01T01:30:00Z'},
+    ]
@@ -1,12 +1,55 @@
+from collections import Counter
+import smtplib
+from unittest.mock import Mock, patch
+
 import pytest
+from django.core import mail
+from django.core.mail.backends import locmem
 
-from notifications import email
+from notifications import constants, email, helpers
+from notifications.models import SupplierEmailNotification
+from supplier.tests.factories import SupplierFactory
 
 
 class NotificationMissingProperties(email.NotificationBase):
     pass
 
 
+class ConnectionCountingEmailBackend(locmem.EmailBackend):
+    """
+    Opens and closes connections like the SMTP backend, counting them, and
+    fails sending to FAILING_EMAIL.
+
+    """
+
+    FAILING_EMAIL = 'fail@example.com'
+    connections_opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_open = False
+
+    def open(self):
+        if self.is_open:
+            return False
+        self.is_open = True
+        ConnectionCountingEmailBackend.connections_opened += 1
+        return True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        new_connection_opened = self.open()
+        try:
+            if messages[0].to == [self.FAILING_EMAIL]:
+                raise smtplib.SMTPServerDisconnected()
+            return super().send_messages(messages)
+        finally:
+            if new_connection_opened:
+                self.close()
+
+
 def test_notification_base_rejects_if_required_properties_missing():
     with pytest.raises(TypeError) as exc_info:
         NotificationMissingProperties()
@@ -25,3 +68,226 @@ def test_new_companies_in_sector_limit_companies():
     )
     context = notification.get_context_data()
     assert len(context['companies']) == 5
+
+
+@pytest.mark.django_db
+@patch('notifications.email.get_connection')
+def test_send_all_uses_one_connection(mock_get_connection):
+    connection = mock_get_connection.return_value.__enter__.return_value
+    connection.send_messages.return_value = 1
+    suppliers = SupplierFactory.create_batch(3)
+
+    delivered = email.send_all(
+        (email.NoCaseStudiesNotification(supplier) for supplier in suppliers),
+        chunk_size=2,
+    )
+
+    assert delivered == 3
+    assert mock_get_connection.call_count == 1
+    assert connection.send_messages.call_count == 3
+    assert SupplierEmailNotification.objects.filter(
+        category=constants.NO_CASE_STUDIES
+    ).count() == 3
+
+
+@pytest.mark.django_db
+@patch('notifications.email.get_connection')
+def test_send_all_records_only_delivered(mock_get_connection):
+    connection = mock_get_connection.return_value.__enter__.return_value
+    connection.send_messages.side_effect = [
+        1, smtplib.SMTPServerDisconnected, 0
+    ]
+    suppliers = SupplierFactory.create_batch(3)
+
+    delivered = email.send_all(
+        email.NoCaseStudiesNotification(supplier) for supplier in suppliers
+    )
+
+    assert delivered == 1
+    # reopened straight after the failure, before the next message
+    assert [name for name, _, _ in connection.method_calls] == [
+        'send_messages', 'send_messages', 'close', 'open', 'send_messages'
+    ]
+    records = SupplierEmailNotification.objects.all()
+    assert [record.supplier for record in records] == [suppliers[0]]
+
+
+@pytest.mark.django_db
+@patch('notifications.email.get_connection')
+def test_send_all_message_error_keeps_connection(mock_get_connection):
+    connection = mock_get_connection.return_value.__enter__.return_value
+    connection.send_messages.side_effect = [ValueError, 1]
+    suppliers = SupplierFactory.create_batch(2)
+
+    delivered = email.send_all(
+        email.NoCaseStudiesNotification(supplier) for supplier in suppliers
+    )
+
+    assert delivered == 1
+    assert connection.close.called is False
+    assert connection.open.called is False
+
+
+@pytest.mark.django_db
+def test_send_all_one_connection_after_failure(settings):
+    settings.EMAIL_BACKEND = (
+        'notifications.tests.test_email.ConnectionCountingEmailBackend'
+    )
+    ConnectionCountingEmailBackend.connections_opened = 0
+    suppliers = [
+        SupplierFactory(),
+        SupplierFactory(
+            company_email=ConnectionCountingEmailBackend.FAILING_EMAIL
+        ),
+        SupplierFactory(),
+        SupplierFactory(),
+    ]
+    mail.outbox = []  # reset after emails sent by signals
+
+    delivered = email.send_all(
+        email.NoCaseStudiesNotification(supplier) for supplier in suppliers
+    )
+
+    assert delivered == 3
+    assert len(mail.outbox) == 3
+    # the first connection, and the one reopened after the failure
+    assert ConnectionCountingEmailBackend.connections_opened == 2
+
+
+@pytest.mark.django_db
+@patch('notifications.email.get_connection')
+def test_send_all_stats_and_on_chunk(mock_get_connection):
+    connection = mock_get_connection.return_value.__enter__.return_value
+    connection.send_messages.side_effect = [1, 0, 1]
+    suppliers = SupplierFactory.create_batch(3)
+    stats = Counter(sent=5)
+    on_chunk = Mock()
+
+    email.send_all(
+        (email.NoCaseStudiesNotification(supplier) for supplier in suppliers),
+        chunk_size=2,
+        stats=stats,
+        on_chunk=on_chunk,
+    )
+
+    assert stats['sent'] == 7
+    assert stats['failed'] == 1
+    assert stats['render_seconds'] >= 0
+    assert stats['send_seconds'] >= 0
+    assert on_chunk.call_count == 2
+
+
+@patch('notifications.email.get_template', wraps=email.get_template)
+def test_get_message_compiles_templates_once(mock_get_template):
+    email.clear_rendering_caches()
+    subscribers = [
+        {'email': 'jim@example.com', 'name': 'Jim'},
+        {'email': 'bob@example.com', 'name': 'Bob'},
+    ]
+
+    for subscriber in subscribers:
+        email.AnonymousSubscriberUbsubscribed(subscriber).get_message()
+
+    assert mock_get_template.call_count == 2
+
+
+def test_new_companies_in_sector_memoizes_company_list():
+    email.clear_rendering_caches()
+    companies = [
+        helpers.NewCompany(
+            number='01234567', name='Acme', summary='Rockets',
+            description='',
+        )
+    ]
+    subscribers = [
+        {'email': 'jim@example.com', 'name': 'Jim'},
+        {'email': 'bob@example.com', 'name': 'Bob'},
+    ]
+
+    messages = [
+        email.NewCompaniesInSectorNotification(
+            subscriber=subscriber, companies=companies
+        ).get_message()
+        for subscriber in subscribers
+    ]
+
+    # text and html fragments rendered once, and reused for the second
+    assert email.render_fragment.cache_info().misses == 2
+    assert email.render_fragment.cache_info().hits == 2
+    for message in messages:
+        assert 'Acme' in message.body
+        assert 'Rockets' in message.alternatives[0][0]
+
+
+def test_shared_context_follows_settings(settings):
+    notification = email.VerificationWaitingNotification(
+        SupplierFactory.build()
+    )
+
+    settings.VERIFICATION_CODE_URL = 'http://great.gov.uk/verify-one'
+    context_one = notification.get_context_data()
+    settings.VERIFICATION_CODE_URL = 'http://great.gov.uk/verify-two'
+    context_two = notification.get_context_data()
+
+    assert context_one['verification_url'] == 'http://great.gov.uk/verify-one'
+    assert context_two['verification_url'] == 'http://great.gov.uk/verify-two'
+
+
+@pytest.mark.django_db
+@patch('notifications.email.get_connection')
+def test_send_all_rendering_failure_records_delivered(mock_get_connection):
+    connection = mock_get_connection.return_value.__enter__.return_value
+    connection.send_messages.return_value = 1
+    suppliers = SupplierFactory.create_batch(3)
+    notifications = [
+        email.NoCaseStudiesNotification(supplier) for supplier in suppliers
+    ]
+    notifications[1].get_message = Mock(side_effect=Exception)
+
+    delivered = email.send_all(notifications)
+
+    assert delivered == 2
+    assert connection.send_messages.call_count == 2
+    assert connection.close.called is False
+    records = SupplierEmailNotification.objects.all()
+    assert {record.supplier for record in records} == {
+        suppliers[0], suppliers[2]
+    }
+
+
+@pytest.mark.django_db
+@patch('notifications.email.get_connection')
+def test_send_all_interrupted_records_delivered(mock_get_connection):
+    connection = mock_get_connection.return_value.__enter__.return_value
+    connection.send_messages.side_effect = [1, KeyboardInterrupt]
+    suppliers = SupplierFactory.create_batch(2)
+
+    with pytest.raises(KeyboardInterrupt):
+        email.send_all(
+            email.NoCaseStudiesNotification(supplier) for supplier in suppliers
+        )
+
+    records = SupplierEmailNotification.objects.all()
+    assert [record.supplier for record in records] == [suppliers[0]]
+
+
+def test_new_companies_in_sector_same_companies_same_selection():
+    companies = [
+        helpers.NewCompany(
+            number='0000000{}'.format(i), name=str(i), summary='',
+            description='',
+        )
+        for i in range(7)
+    ]
+    subscriber = {'email': 'jim@example.com', 'name': 'Jim'}
+
+    contexts = [
+        email.NewCompaniesInSectorNotification(
+            subscriber=subscriber, companies=ordering
+        ).get_context_data()
+        for ordering in (companies, list(reversed(companies)))
+    ]
+
+    assert contexts[0]['companies'] == tuple(companies[:5])
+    assert contexts[1]['companies'] == tuple(companies[:5])
+    assert contexts[0]['companies_html'] == contexts[1]['companies_html']
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+import pytest
+
+from notifications.leases import Lease, LeaseLost
+
+
+@pytest.fixture
+def connection():
+    with patch('notifications.leases.get_redis_connection') as mock:
+        yield mock.return_value
+
+
+def test_lease_acquire(connection):
+    lease = Lease('key', timeout=30, token='abc')
+
+    assert lease.acquire() is True
+    connection.set.assert_called_once_with(
+        'key', 'abc', nx=True, px=30000
+    )
+
+
+def test_lease_acquire_held(connection):
+    connection.set.return_value = None
+
+    assert Lease('key', timeout=30).acquire() is False
+
+
+def test_lease_renew_or_raise(connection):
+    connection.eval.return_value = 0
+
+    with pytest.raises(LeaseLost):
+        Lease('key', timeout=30).renew_or_raise()
+
+
+def test_lease_release(connection):
+    connection.eval.return_value = 1
+    lease = Lease('key', timeout=30, token='abc')
+
+    assert lease.release() is True
+    assert connection.eval.call_args[0][1:] == (1, 'key', 'abc')
+
+
+def test_lease_is_held(connection):
+    connection.exists.return_value = 0
+
+    assert Lease('key', timeout=30).is_held() is False
+    connection.exists.assert_called_once_with('key')
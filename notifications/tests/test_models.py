@@ -1,3 +1,6 @@
+from datetime import datetime
+
+from notifications.models import CampaignRun
 from notifications.tests.factories import (
     SupplierEmailNotificationFactory, AnonymousEmailNotificationFactory)
 
@@ -16,3 +19,17 @@ def test_anonymous_email_notification_str_method():
         category='new_companies_in_sector'
     )
     assert str(instance) == 'test@example.com: new_companies_in_sector'
+
+
+def test_campaign_run_recipients_per_second():
+    instance = CampaignRun(
+        sent=100,
+        date_started=datetime(2017, 3, 1, 9, 0, 0),
+        date_finished=datetime(2017, 3, 1, 9, 0, 40),
+    )
+
+    assert instance.recipients_per_second == 2.5
+
+
+def test_campaign_run_recipients_per_second_not_finished():
+    assert CampaignRun(sent=100).recipients_per_second is None
@@ -1,16 +1,17 @@
-from datetime import timedelta, datetime
-from unittest.mock import patch, MagicMock, PropertyMock
+from datetime import date, timedelta, datetime
+from unittest.mock import call, patch, MagicMock, PropertyMock
 
 import pytest
 
 from freezegun import freeze_time
 
 from django.core import mail
+from django.db import connection
 from django.utils import timezone
 
 from buyer.tests.factories import BuyerFactory
 from company.tests.factories import CompanyFactory, CompanyCaseStudyFactory
-from notifications import constants, email, notifications
+from notifications import constants, email, helpers, notifications
 from notifications.models import (
     AnonymousEmailNotification,
     SupplierEmailNotification,
@@ -27,6 +28,18 @@ LAST_LOGIN_API_METHOD = (
     'directory_sso_api_client.user.UserAPIClient.get_last_login')
 
 
+def mock_last_login_api(sso_users):
+    # returns only the users that logged in within the window requested
+    def get_last_login(start, end):
+        return MagicMock(json=MagicMock(return_value=[
+            sso_user for sso_user in sso_users
+            if start <= datetime.strptime(
+                sso_user['last_login'], '%Y-%m-%dT%H:%M:%SZ'
+            ) <= end
+        ]))
+    return MagicMock(side_effect=get_last_login)
+
+
 @pytest.mark.django_db
 def test_doesnt_send_case_study_email_when_user_has_case_studies():
     eight_days_ago = timezone.now() - timedelta(days=8)
@@ -65,6 +78,20 @@ def test_sends_case_study_email_only_when_registered_8_days_ago(settings):
     assert instance.date_sent == timezone.now()
 
 
+@freeze_time()
+@pytest.mark.django_db
+def test_sends_case_study_email_to_supplier_without_company():
+    eight_days_ago = timezone.now() - timedelta(days=8)
+    supplier = SupplierFactory(date_joined=eight_days_ago, company=None)
+    mail.outbox = []  # reset after emails sent by signals
+
+    notifications.no_case_studies()
+
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == [supplier.company_email]
+    assert SupplierEmailNotification.objects.get().supplier == supplier
+
+
 @freeze_time()
 @pytest.mark.django_db
 @patch('notifications.email.NoCaseStudiesNotification.zendesk_url',
@@ -159,20 +186,19 @@ def test_doesnt_send_case_study_email_if_case_study_email_already_sent(
 def test_if_case_study_email_send_fails_previous_info_still_written_to_db():
     eight_days_ago = timezone.now() - timedelta(days=8)
     suppliers = SupplierFactory.create_batch(3, date_joined=eight_days_ago)
-    send_method = 'django.core.mail.EmailMultiAlternatives.send'
+    send_method = (
+        'django.core.mail.backends.locmem.EmailBackend.send_messages'
+    )
 
-    def mocked_send(self):
-        # This will be the last email that will be sent to
-        if self.to == [suppliers[0].company_email]:
+    def mocked_send(self, messages):
+        if messages[0].to == [suppliers[0].company_email]:
             raise Exception
+        return len(messages)
 
     with patch(send_method, mocked_send):
-        try:
-            notifications.no_case_studies()
-        except:
-            pass
+        notifications.no_case_studies()
 
-    # should have created the two objects before the email exception
+    # only the delivered messages are recorded
     assert SupplierEmailNotification.objects.all().count() == 2
 
 
@@ -508,20 +534,19 @@ def test_if_ver_code_email_send_fails_previous_info_still_written_to_db_8():
     suppliers = SupplierFactory.create_batch(
         3, company__verified_with_code=False,
         company__date_verification_letter_sent=eight_days_ago)
-    send_method = 'django.core.mail.EmailMultiAlternatives.send'
+    send_method = (
+        'django.core.mail.backends.locmem.EmailBackend.send_messages'
+    )
 
-    def mocked_send(self):
-        # This will be the last email that will be sent to
-        if self.to == [suppliers[0].company_email]:
+    def mocked_send(self, messages):
+        if messages[0].to == [suppliers[0].company_email]:
             raise Exception
+        return len(messages)
 
     with patch(send_method, mocked_send):
-        try:
-            notifications.verification_code_not_given()
-        except:
-            pass
+        notifications.verification_code_not_given()
 
-    # should have created the two objects before the email exception
+    # only the delivered messages are recorded
     assert SupplierEmailNotification.objects.all().count() == 2
 
 
@@ -535,20 +560,19 @@ def test_if_ver_code_email_send_fails_previous_info_still_written_to_db_16():
         SupplierEmailNotificationFactory(
             supplier=supplier, category='verification_code_not_given',
             date_sent=(timezone.now() - timedelta(days=8)))
-    send_method = 'django.core.mail.EmailMultiAlternatives.send'
+    send_method = (
+        'django.core.mail.backends.locmem.EmailBackend.send_messages'
+    )
 
-    def mocked_send(self):
-        # This will be the last email that will be sent to
-        if self.to == [suppliers[0].company_email]:
+    def mocked_send(self, messages):
+        if messages[0].to == [suppliers[0].company_email]:
             raise Exception
+        return len(messages)
 
     with patch(send_method, mocked_send):
-        try:
-            notifications.verification_code_not_given()
-        except:
-            pass
+        notifications.verification_code_not_given()
 
-    # 2 created (before email exception on 3rd) + 3 in set up
+    # 2 delivered + 3 in set up
     assert SupplierEmailNotification.objects.all().count() == 5
 
 
@@ -605,18 +629,19 @@ def test_sends_log_in_email_when_not_logged_in_for_30_days():
     mocked_json = [
         {'id': suppliers[1].sso_id, 'last_login': '2017-01-01T21:04:39Z'},
     ]
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=mocked_json)
-        )
-    )
+    mocked_api = mock_last_login_api(mocked_json)
     mail.outbox = []  # reset after emails sent by signals
 
     with patch(LAST_LOGIN_API_METHOD, mocked_api):
         notifications.hasnt_logged_in()
 
-    mocked_api.assert_called_once_with(
+    assert mocked_api.call_count == 24
+    assert mocked_api.call_args_list[0] == call(
         start=datetime(2017, 1, 1, 0, 0, 0, 0),
+        end=datetime(2017, 1, 1, 0, 59, 59, 999999)
+    )
+    assert mocked_api.call_args_list[-1] == call(
+        start=datetime(2017, 1, 1, 23, 0, 0, 0),
         end=datetime(2017, 1, 1, 23, 59, 59, 999999)
     )
     assert len(mail.outbox) == 1
@@ -643,11 +668,7 @@ def test_log_in_email_has_expected_vars_in_template(settings):
     mocked_json = [
         {'id': supplier.sso_id, 'last_login': '2017-01-01T21:04:39Z'},
     ]
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=mocked_json)
-        )
-    )
+    mocked_api = mock_last_login_api(mocked_json)
     mail.outbox = []  # reset after emails sent by signals
 
     with patch(LAST_LOGIN_API_METHOD, mocked_api):
@@ -665,11 +686,7 @@ def test_log_in_email_has_expected_vars_in_template(settings):
 @freeze_time('2016-12-09 12:30:00')
 @pytest.mark.django_db
 def test_doesnt_send_log_in_email_when_api_returns_no_users():
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=[])
-        )
-    )
+    mocked_api = mock_last_login_api([])
     mail.outbox = []  # reset after emails sent by signals
 
     with patch(LAST_LOGIN_API_METHOD, mocked_api):
@@ -688,18 +705,18 @@ def test_log_in_email_uses_settings_for_no_of_days_and_subject(settings):
     mocked_json = [
         {'id': supplier.sso_id, 'last_login': '2017-03-31T01:54:15Z'},
     ]
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=mocked_json)
-        )
-    )
+    mocked_api = mock_last_login_api(mocked_json)
     mail.outbox = []  # reset after emails sent by signals
 
     with patch(LAST_LOGIN_API_METHOD, mocked_api):
         notifications.hasnt_logged_in()
 
-    mocked_api.assert_called_once_with(
+    assert mocked_api.call_args_list[0] == call(
         start=datetime(2017, 3, 31, 0, 0, 0, 0),
+        end=datetime(2017, 3, 31, 0, 59, 59, 999999),
+    )
+    assert mocked_api.call_args_list[-1] == call(
+        start=datetime(2017, 3, 31, 23, 0, 0, 0),
         end=datetime(2017, 3, 31, 23, 59, 59, 999999),
     )
     assert len(mail.outbox) == 1
@@ -718,11 +735,7 @@ def test_doesnt_send_log_in_email_if_log_in_email_already_sent():
         {'id': suppliers[0].sso_id, 'last_login': '2017-03-02T02:14:15Z'},
         {'id': suppliers[1].sso_id, 'last_login': '2017-03-02T13:18:15Z'},
     ]
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=mocked_json)
-        )
-    )
+    mocked_api = mock_last_login_api(mocked_json)
     mail.outbox = []  # reset after emails sent by signals
 
     with patch(LAST_LOGIN_API_METHOD, mocked_api):
@@ -743,26 +756,21 @@ def test_if_log_in_email_send_fails_previous_info_still_written_to_db():
         {'id': suppliers[1].sso_id, 'last_login': '2017-03-02T13:18:15Z'},
         {'id': suppliers[2].sso_id, 'last_login': '2017-03-02T15:43:15Z'},
     ]
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=mocked_json)
-        )
+    mocked_api = mock_last_login_api(mocked_json)
+    send_method = (
+        'django.core.mail.backends.locmem.EmailBackend.send_messages'
     )
-    send_method = 'django.core.mail.EmailMultiAlternatives.send'
 
-    def mocked_send(self):
-        # This will be the last email that will be sent to
-        if self.to == [suppliers[2].company_email]:
+    def mocked_send(self, messages):
+        if messages[0].to == [suppliers[2].company_email]:
             raise Exception
+        return len(messages)
 
     with patch(send_method, mocked_send):
-        try:
-            with patch(LAST_LOGIN_API_METHOD, mocked_api):
-                notifications.hasnt_logged_in()
-        except:
-            pass
+        with patch(LAST_LOGIN_API_METHOD, mocked_api):
+            notifications.hasnt_logged_in()
 
-    # should have created the two objects before the email exception
+    # only the delivered messages are recorded
     assert SupplierEmailNotification.objects.all().count() == 2
 
 
@@ -775,11 +783,7 @@ def test_sends_log_in_email_to_expected_users(settings):
         {'id': suppliers[1].sso_id, 'last_login': '2017-03-02T13:18:15Z'},
         {'id': suppliers[2].sso_id, 'last_login': '2017-03-02T15:43:15Z'},
     ]
-    mocked_api = MagicMock(
-        return_value=MagicMock(
-            json=MagicMock(return_value=mocked_json)
-        )
-    )
+    mocked_api = mock_last_login_api(mocked_json)
     SupplierEmailNotificationFactory(
         supplier=suppliers[1], category='no_case_studies')
     SupplierEmailNotificationFactory(
@@ -1001,6 +1005,68 @@ def test_new_companies_in_sector_company_multiple_sectors(settings):
     assert unsubscribe_url in mail.outbox[0].body
 
 
+@freeze_time()
+@pytest.mark.django_db
+def test_group_new_companies_by_industry_reads_only_email_fields(settings):
+    settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS = 3
+    company = CompanyFactory(
+        sectors=['AEROSPACE', 'AIRPORTS'],
+        date_published=timezone.now() - timedelta(days=1),
+    )
+    CompanyFactory(
+        sectors=['AEROSPACE'],
+        date_published=timezone.now() - timedelta(days=4),
+    )
+
+    grouped = helpers.group_new_companies_by_industry()
+
+    expected = helpers.NewCompany(
+        number=company.number,
+        name=company.name,
+        summary=company.summary,
+        description=company.description,
+    )
+    assert dict(grouped) == {
+        'AEROSPACE': [expected],
+        'AIRPORTS': [expected],
+    }
+
+
+@freeze_time('2017-07-01 12:00:00')
+@pytest.mark.django_db
+def test_group_new_companies_by_industry_includes_boundary_day(settings):
+    settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS = 3
+    company = CompanyFactory(
+        sectors=['AEROSPACE'], date_published=date(2017, 6, 28),
+    )
+    CompanyFactory(sectors=['AEROSPACE'], date_published=date(2017, 6, 27))
+
+    grouped = helpers.group_new_companies_by_industry()
+
+    assert [new.number for new in grouped['AEROSPACE']] == [company.number]
+
+
+@freeze_time()
+@pytest.mark.django_db
+def test_get_new_companies_anonymous_subscribers_groups_by_email(settings):
+    settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS = 3
+    BuyerFactory.create(
+        sector='AEROSPACE', email='jim@example.com', name='Jim'
+    )
+    BuyerFactory.create(
+        sector='AIRPORTS', email='jim@example.com', name='Jim'
+    )
+    BuyerFactory.create(sector='AEROSPACE', email='unsubscribed@example.com')
+    AnonymousUnsubscribeFactory(email='unsubscribed@example.com')
+
+    subscribers = list(helpers.get_new_companies_anonymous_subscribers())
+
+    assert len(subscribers) == 1
+    assert subscribers[0]['email'] == 'jim@example.com'
+    assert subscribers[0]['name'] == 'Jim'
+    assert sorted(subscribers[0]['industries']) == ['AEROSPACE', 'AIRPORTS']
+
+
 @pytest.mark.django_db
 def test_supplier_unsubscribed():
     supplier = SupplierFactory()
@@ -1032,3 +1098,125 @@ def test_anonymous_unsubscribed():
     assert AnonymousEmailNotification.objects.count() == 1
     assert notification_record.email == 'jim@example.com'
     assert notification_record.category == constants.UNSUBSCRIBED
+
+
+def get_rows_scanned(queryset, table):
+    """Rows of `table` read by the query, whether returned or filtered."""
+
+    def walk(node):
+        rows = 0
+        if node.get('Relation Name') == table:
+            rows += node['Actual Loops'] * (
+                node['Actual Rows'] + node.get('Rows Removed by Filter', 0)
+            )
+        for child in node.get('Plans', []):
+            rows += walk(child)
+        return rows
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        # the test tables are tiny, so make the planner prefer any index
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return walk(plan[0]['Plan'])
+
+
+@freeze_time('2016-12-16 19:11')
+def test_get_day_range():
+    start, end = helpers.get_day_range(8)
+
+    assert start == datetime(2016, 12, 8, tzinfo=timezone.utc)
+    assert end == datetime(2016, 12, 9, tzinfo=timezone.utc)
+
+
+def test_get_time_windows():
+    windows = helpers.get_time_windows(
+        datetime(2017, 1, 1, 0, 0),
+        datetime(2017, 1, 1, 2, 29, 59, 999999),
+        timedelta(hours=1),
+    )
+
+    assert windows == [
+        (datetime(2017, 1, 1, 0, 0), datetime(2017, 1, 1, 0, 59, 59, 999999)),
+        (datetime(2017, 1, 1, 1, 0), datetime(2017, 1, 1, 1, 59, 59, 999999)),
+        (datetime(2017, 1, 1, 2, 0), datetime(2017, 1, 1, 2, 29, 59, 999999)),
+    ]
+
+
+@freeze_time('2017-04-01 12:00:00')
+@pytest.mark.django_db
+def test_hasnt_logged_in_suppliers_matched_in_batches(settings):
+    settings.HASNT_LOGGED_IN_BATCH_SIZE = 2
+    suppliers = SupplierFactory.create_batch(3)
+    mocked_api = mock_last_login_api([
+        {'id': supplier.sso_id, 'last_login': '2017-03-02T02:14:15Z'}
+        for supplier in suppliers
+    ])
+
+    with patch(LAST_LOGIN_API_METHOD, mocked_api):
+        batches = list(
+            notifications.iterate_hasnt_logged_in_supplier_batches()
+        )
+
+    assert [batch.count() for batch in batches] == [2, 1]
+    assert {supplier for batch in batches for supplier in batch} == set(
+        suppliers
+    )
+
+
+@freeze_time()
+@pytest.mark.django_db
+def test_no_case_studies_rows_scanned_do_not_grow_with_suppliers():
+    eight_days_ago = timezone.now() - timedelta(days=8)
+    SupplierFactory.create_batch(2, date_joined=eight_days_ago)
+    queryset = notifications.get_no_case_studies_suppliers()
+    rows_scanned = get_rows_scanned(queryset, 'user_user')
+
+    SupplierFactory.create_batch(
+        20, date_joined=timezone.now() - timedelta(days=20)
+    )
+
+    assert get_rows_scanned(queryset, 'user_user') == rows_scanned
+
+
+@freeze_time()
+@pytest.mark.django_db
+def test_verification_code_not_given_rows_scanned_do_not_grow_with_suppliers(
+    settings
+):
+    eight_days_ago = timezone.now() - timedelta(days=8)
+    SupplierFactory.create_batch(
+        2,
+        company__verified_with_code=False,
+        company__date_verification_letter_sent=eight_days_ago,
+    )
+    queryset = notifications.get_verification_code_not_given_suppliers(
+        days=settings.VERIFICATION_CODE_NOT_GIVEN_DAYS,
+        category=constants.VERIFICATION_CODE_NOT_GIVEN,
+    )
+    rows_scanned = get_rows_scanned(queryset, 'company_company')
+
+    SupplierFactory.create_batch(
+        20,
+        company__verified_with_code=False,
+        company__date_verification_letter_sent=(
+            timezone.now() - timedelta(days=20)
+        ),
+    )
+
+    assert get_rows_scanned(queryset, 'company_company') == rows_scanned
+
+
+@freeze_time()
+@pytest.mark.django_db
+def test_no_case_studies_notified_check_uses_index():
+    supplier = SupplierFactory(date_joined=timezone.now() - timedelta(days=8))
+    SupplierEmailNotificationFactory.create_batch(
+        20, supplier=supplier, category='hasnt_logged_in'
+    )
+    queryset = notifications.get_no_case_studies_suppliers()
+
+    assert get_rows_scanned(
+        queryset, 'notifications_supplieremailnotification'
+    ) == 0
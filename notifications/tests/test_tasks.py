@@ -0,0 +1,315 @@
+from datetime import timedelta
+from unittest.mock import MagicMock, Mock, patch
+
+from freezegun import freeze_time
+import pytest
+
+from django.core import mail
+from django.utils import timezone
+
+from buyer.tests.factories import BuyerFactory
+from company.tests.factories import CompanyFactory
+from notifications import constants, tasks
+from notifications.leases import LeaseLost
+from notifications.models import (
+    CampaignChunk, CampaignRun, SupplierEmailNotification
+)
+from supplier.tests.factories import SupplierFactory
+
+
+@pytest.fixture(autouse=True)
+def lease():
+    stub = patch.multiple(
+        'notifications.leases.Lease',
+        acquire=lambda self: True,
+        is_held=lambda self: False,
+        renew=lambda self: True,
+        release=lambda self: True,
+    )
+    stub.start()
+    yield
+    stub.stop()
+
+
+@freeze_time()
+@pytest.mark.django_db
+@patch('notifications.tasks.chord')
+def test_no_case_studies_creates_chunks(mock_chord, settings):
+    settings.NOTIFICATIONS_CHUNK_SIZE = 2
+    suppliers = SupplierFactory.create_batch(
+        3, date_joined=timezone.now() - timedelta(days=8)
+    )
+    SupplierFactory(date_joined=timezone.now() - timedelta(days=7))
+
+    tasks.no_case_studies()
+
+    run = CampaignRun.objects.get()
+    pks = sorted(supplier.pk for supplier in suppliers)
+    assert run.campaign == constants.NO_CASE_STUDIES
+    assert run.date == timezone.now().date()
+    assert run.recipients == 3
+    assert [chunk.recipients for chunk in run.chunks.all()] == [
+        pks[:2], pks[2:]
+    ]
+    signatures = mock_chord.call_args[0][0].tasks
+    assert [signature.kwargs['chunk_pk'] for signature in signatures] == [
+        chunk.pk for chunk in run.chunks.all()
+    ]
+    callback = mock_chord.return_value.call_args[0][0]
+    assert callback.kwargs == {'run_pk': run.pk}
+
+
+@pytest.mark.django_db
+@patch('notifications.tasks.chord')
+def test_no_case_studies_nothing_to_send(mock_chord):
+    tasks.no_case_studies()
+
+    run = CampaignRun.objects.get()
+    assert mock_chord.called is False
+    assert run.status == CampaignRun.FINISHED
+
+
+@pytest.mark.django_db
+@patch('notifications.tasks.chord')
+def test_no_case_studies_resumes_chunks_not_done(mock_chord, settings):
+    settings.NOTIFICATIONS_CHUNK_SIZE = 1
+    SupplierFactory.create_batch(
+        2, date_joined=timezone.now() - timedelta(days=8)
+    )
+    tasks.no_case_studies()
+    first, second = CampaignRun.objects.get().chunks.all()
+    first.status = CampaignChunk.DONE
+    first.save()
+
+    tasks.no_case_studies()
+
+    assert CampaignRun.objects.count() == 1
+    signatures = mock_chord.call_args[0][0].tasks
+    assert [signature.kwargs['chunk_pk'] for signature in signatures] == [
+        second.pk
+    ]
+
+
+@pytest.mark.django_db
+@patch('notifications.tasks.dispatch_campaign_run')
+def test_start_campaign_gets_recipients_before_transaction(mock_dispatch):
+    calls = MagicMock()
+    calls.get_recipients.return_value = [1, 2]
+
+    with patch('notifications.tasks.transaction.atomic', calls.atomic):
+        tasks.start_campaign(
+            campaign=constants.NO_CASE_STUDIES,
+            get_recipients=calls.get_recipients,
+        )
+
+    assert [name for name, _, _ in calls.mock_calls][:2] == [
+        'get_recipients', 'atomic'
+    ]
+    assert CampaignRun.objects.get().recipients == 2
+
+
+@pytest.mark.django_db
+@patch('notifications.tasks.dispatch_campaign_run')
+def test_start_campaign_resumed_run_gets_no_recipients(mock_dispatch):
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    get_recipients = Mock()
+
+    tasks.start_campaign(
+        campaign=constants.NO_CASE_STUDIES, get_recipients=get_recipients
+    )
+
+    assert get_recipients.called is False
+    mock_dispatch.assert_called_once_with(run)
+
+
+@pytest.mark.django_db
+@patch('notifications.tasks.chord')
+@patch('notifications.leases.Lease.is_held', side_effect=[True, False])
+def test_dispatch_campaign_run_skips_held_chunks(
+    mock_is_held, mock_chord, settings
+):
+    settings.NOTIFICATIONS_CHUNK_SIZE = 1
+    SupplierFactory.create_batch(
+        2, date_joined=timezone.now() - timedelta(days=8)
+    )
+
+    tasks.no_case_studies()
+
+    # the first chunk is held by a live worker
+    second = CampaignRun.objects.get().chunks.last()
+    signatures = mock_chord.call_args[0][0].tasks
+    assert [signature.kwargs for signature in signatures] == [
+        {'chunk_pk': second.pk}
+    ]
+
+
+@pytest.mark.django_db
+@patch('notifications.tasks.chord')
+@patch('notifications.leases.Lease.acquire', return_value=False)
+def test_dispatch_campaign_run_already_dispatching(mock_acquire, mock_chord):
+    SupplierFactory(date_joined=timezone.now() - timedelta(days=8))
+
+    tasks.no_case_studies()
+
+    assert mock_chord.called is False
+
+
+@freeze_time()
+@pytest.mark.django_db
+@patch('notifications.tasks.chord')
+def test_new_companies_in_sector_creates_chunks(mock_chord, settings):
+    settings.NOTIFICATIONS_CHUNK_SIZE = 1
+    BuyerFactory.create(sector='AEROSPACE', email='a@example.com')
+    BuyerFactory.create(sector='AIRPORTS', email='a@example.com')
+    BuyerFactory.create(sector='AEROSPACE', email='b@example.com')
+
+    tasks.new_companies_in_sector()
+
+    run = CampaignRun.objects.get()
+    assert [chunk.recipients for chunk in run.chunks.all()] == [
+        ['a@example.com'], ['b@example.com']
+    ]
+
+
+@pytest.mark.django_db
+def test_send_campaign_chunk_can_run_again():
+    suppliers = SupplierFactory.create_batch(2)
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    chunk = CampaignChunk.objects.create(
+        run=run, index=0, recipients=[supplier.pk for supplier in suppliers]
+    )
+    mail.outbox = []  # reset after emails sent by signals
+
+    sent = tasks.send_campaign_chunk.run(chunk_pk=chunk.pk)
+    chunk.status = CampaignChunk.PENDING
+    chunk.save()
+    sent_again = tasks.send_campaign_chunk.run(chunk_pk=chunk.pk)
+
+    chunk.refresh_from_db()
+    assert sent == 2
+    assert sent_again == 2  # counts carried over from the first attempt
+    assert chunk.status == CampaignChunk.DONE
+    assert chunk.sent == 2
+    assert len(mail.outbox) == 2
+    assert SupplierEmailNotification.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_send_campaign_chunk_done():
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    chunk = CampaignChunk.objects.create(
+        run=run, index=0, recipients=[1], status=CampaignChunk.DONE
+    )
+
+    assert tasks.send_campaign_chunk.run(chunk_pk=chunk.pk) is None
+
+
+@pytest.mark.django_db
+@patch('notifications.leases.Lease.acquire', return_value=False)
+def test_send_campaign_chunk_lease_taken(mock_acquire):
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    chunk = CampaignChunk.objects.create(run=run, index=0, recipients=[1])
+
+    assert tasks.send_campaign_chunk.run(chunk_pk=chunk.pk) is None
+    chunk.refresh_from_db()
+    assert chunk.status == CampaignChunk.PENDING
+
+
+@pytest.mark.django_db
+@patch('notifications.notifications.send_campaign', side_effect=LeaseLost)
+def test_send_campaign_chunk_lease_lost(mock_send_campaign):
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    chunk = CampaignChunk.objects.create(run=run, index=0, recipients=[1])
+
+    tasks.send_campaign_chunk.run(chunk_pk=chunk.pk)
+
+    chunk.refresh_from_db()
+    assert chunk.status == CampaignChunk.RUNNING
+
+
+@pytest.mark.django_db
+@patch('notifications.leases.Lease.release')
+@patch('notifications.notifications.send_campaign', side_effect=Exception)
+def test_send_campaign_chunk_failure(mock_send_campaign, mock_release):
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    chunk = CampaignChunk.objects.create(run=run, index=0, recipients=[1])
+
+    # not raised, so the chord callback still runs
+    assert tasks.send_campaign_chunk.run(chunk_pk=chunk.pk) is None
+
+    chunk.refresh_from_db()
+    assert chunk.status == CampaignChunk.PENDING
+    assert mock_release.call_count == 1
+
+
+@freeze_time()
+@pytest.mark.django_db
+def test_send_campaign_chunk_new_companies_in_sector(settings):
+    settings.NEW_COMPANIES_IN_SECTOR_FREQUENCY_DAYS = 3
+    buyer = BuyerFactory.create(sector='AEROSPACE')
+    BuyerFactory.create(sector='AEROSPACE')
+    CompanyFactory(
+        sectors=['AEROSPACE'],
+        date_published=timezone.now() - timedelta(days=1),
+    )
+    run = CampaignRun.objects.create(
+        campaign=constants.NEW_COMPANIES_IN_SECTOR, date=timezone.now().date()
+    )
+    chunk = CampaignChunk.objects.create(
+        run=run, index=0, recipients=[buyer.email]
+    )
+    mail.outbox = []  # reset after emails sent by signals
+
+    sent = tasks.send_campaign_chunk.run(chunk_pk=chunk.pk)
+
+    assert sent == 1
+    assert mail.outbox[0].to == [buyer.email]
+
+
+@pytest.mark.django_db
+def test_finish_campaign_run():
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    CampaignChunk.objects.create(
+        run=run, index=0, recipients=[], status=CampaignChunk.DONE,
+        sent=2, failed=1, render_seconds=0.5, send_seconds=1.5,
+    )
+    CampaignChunk.objects.create(
+        run=run, index=1, recipients=[], status=CampaignChunk.DONE, sent=3,
+    )
+
+    assert tasks.finish_campaign_run.run([2, 3], run_pk=run.pk) == 5
+
+    run.refresh_from_db()
+    assert run.status == CampaignRun.FINISHED
+    assert run.date_finished is not None
+    assert run.sent == 5
+    assert run.failed == 1
+    assert run.render_seconds == 0.5
+    assert run.send_seconds == 1.5
+
+
+@pytest.mark.django_db
+def test_finish_campaign_run_chunks_not_done():
+    run = CampaignRun.objects.create(
+        campaign=constants.NO_CASE_STUDIES, date=timezone.now().date()
+    )
+    CampaignChunk.objects.create(run=run, index=0, recipients=[])
+
+    tasks.finish_campaign_run.run([None], run_pk=run.pk)
+
+    run.refresh_from_db()
+    assert run.status == CampaignRun.RUNNING
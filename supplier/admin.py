@@ -1,13 +1,12 @@
-import csv
 import datetime
 
 from django.contrib import admin, messages
-from django.db.models import BooleanField, Case, Count, When, Value
-from django.http import HttpResponse
 
-from company.utils import send_verification_letter
+from api.utils import stream_csv
+from company.tasks import dispatch_verification_letters
+from exportjob.helpers import start_export_job
+from supplier import exports
 from user.models import User as Supplier
-from company.models import Company
 
 
 @admin.register(Supplier)
@@ -18,80 +17,58 @@ class SupplierAdmin(admin.ModelAdmin):
         'company__description', 'company__number', 'company__website'
     )
     readonly_fields = ('created', 'modified',)
-    actions = ['download_csv', 'resend_letter']
-
-    csv_excluded_fields = (
-        'id',
-        'company',
-        'created',
-        'modified',
-        'company__supplier_case_studies',
-        'company__suppliers',
-        'company__verification_code',
-        'company__messages',
-        'supplieremailnotification',
-    )
+    actions = [
+        'download_csv', 'export_csv', 'export_csv_gzip', 'resend_letter'
+    ]
 
     def download_csv(self, request, queryset):
         """
         Generates CSV report of all suppliers, with company details included.
         """
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = (
-            'attachment; filename="find-a-buyer_suppliers_{}.csv"'.format(
-                datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-            )
+        filename = 'find-a-buyer_suppliers_{}.csv'.format(
+            datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         )
 
-        fieldnames = [field.name for field in Supplier._meta.get_fields()
-                      if field.name not in self.csv_excluded_fields]
-        fieldnames += ['company__' + field.name
-                       for field in Company._meta.get_fields()
-                       if 'company__' + field.name
-                       not in self.csv_excluded_fields]
-        fieldnames.append('company__has_case_study')
-        fieldnames.append('company__number_of_case_studies')
-        fieldnames = sorted(fieldnames)
-
-        suppliers = queryset.select_related('company').all().annotate(
-            company__has_case_study=Case(
-                When(company__supplier_case_studies__isnull=False,
-                     then=Value(True)
-                     ),
-                default=Value(False),
-                output_field=BooleanField()
-            ),
-            company__number_of_case_studies=Count(
-                'company__supplier_case_studies'
-            )
-        ).values(*fieldnames)
-        writer = csv.DictWriter(response, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for supplier in suppliers:
-            writer.writerow(supplier)
+        fieldnames = exports.get_csv_fieldnames()
+        suppliers = exports.get_csv_queryset(queryset, fieldnames)
 
-        return response
+        return stream_csv(
+            queryset=suppliers, fieldnames=fieldnames, filename=filename
+        )
 
     download_csv.short_description = (
         "Download CSV report for selected suppliers"
     )
 
+    def export_csv(self, request, queryset):
+        start_export_job(request, 'suppliers', queryset, compress=False)
+
+    export_csv.short_description = (
+        "Export CSV report for selected suppliers in the background"
+    )
+
+    def export_csv_gzip(self, request, queryset):
+        start_export_job(request, 'suppliers', queryset, compress=True)
+
+    export_csv_gzip.short_description = (
+        "Export gzipped CSV report for selected suppliers in the background"
+    )
+
     def resend_letter(self, request, queryset):
         total_selected_users = queryset.count()
-        not_verified_users_queryset = queryset.select_related(
-            'company'
-        ).exclude(
-                company__verified_with_code=True
+        company_pks = list(
+            queryset
+            .filter(company__isnull=False)
+            .exclude(company__verified_with_code=True)
+            .values_list('company_id', flat=True)
         )
-        not_verified_users_count = not_verified_users_queryset.count()
+        not_verified_users_count = len(company_pks)
 
-        for supplier in not_verified_users_queryset:
-            send_verification_letter(supplier.company)
+        dispatch_verification_letters(company_pks)
 
         messages.success(
             request,
-            'Verification letter resent to {} users'.format(
+            'Verification letter queued for {} users'.format(
                 not_verified_users_count
             )
         )
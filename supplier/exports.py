@@ -0,0 +1,47 @@
+from django.db.models import BooleanField, Case, Count, When, Value
+
+from company.models import Company
+from user.models import User as Supplier
+
+
+CSV_EXCLUDED_FIELDS = (
+    'id',
+    'company',
+    'created',
+    'modified',
+    'company__supplier_case_studies',
+    'company__suppliers',
+    'company__verification_code',
+    # exported as company__has_case_study and company__number_of_case_studies
+    'company__case_study_count',
+    'company__has_case_studies',
+    'company__messages',
+    'supplieremailnotification',
+)
+
+
+def get_csv_fieldnames():
+    fieldnames = [field.name for field in Supplier._meta.get_fields()
+                  if field.name not in CSV_EXCLUDED_FIELDS]
+    fieldnames += ['company__' + field.name
+                   for field in Company._meta.get_fields()
+                   if 'company__' + field.name
+                   not in CSV_EXCLUDED_FIELDS]
+    fieldnames.append('company__has_case_study')
+    fieldnames.append('company__number_of_case_studies')
+    return sorted(fieldnames)
+
+
+def get_csv_queryset(queryset, fieldnames):
+    return queryset.select_related('company').all().annotate(
+        company__has_case_study=Case(
+            When(company__supplier_case_studies__isnull=False,
+                 then=Value(True)
+                 ),
+            default=Value(False),
+            output_field=BooleanField()
+        ),
+        company__number_of_case_studies=Count(
+            'company__supplier_case_studies'
+        )
+    ).values(*fieldnames)
@@ -14,6 +14,7 @@ from user.models import User as Supplier
 from supplier.tests import VALID_REQUEST_DATA as SUPPLIER_DATA
 from company.models import Company, CompanyCaseStudy
 from company.tests import VALID_REQUEST_DATA
+from exportjob.models import ExportJob
 
 
 COMPANY_DATA = VALID_REQUEST_DATA.copy()
@@ -95,7 +96,8 @@ class DownloadCSVTestCase(TestCase):
             ('sso_id', '1'),
             ('unsubscribed', 'False'),
         ])
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
 
         assert actual[0] == ','.join(expected_data.keys())
         assert actual[1] == ','.join(expected_data.values())
@@ -219,12 +221,46 @@ class DownloadCSVTestCase(TestCase):
             follow=True
         )
 
-        actual = str(response.content, 'utf-8').split('\r\n')
+        content = b''.join(response.streaming_content)
+        actual = str(content, 'utf-8').split('\r\n')
         assert actual[0] == ','.join(supplier_one_expected_data.keys())
         assert actual[1] == ','.join(supplier_two_expected_data.values())
         assert actual[2] == ','.join(supplier_one_expected_data.values())
 
 
+@pytest.mark.django_db
+class ExportCSVTestCase(TestCase):
+
+    def setUp(self):
+        superuser = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='test'
+        )
+        self.client = Client()
+        self.client.force_login(superuser)
+
+    @patch('exportjob.tasks.run_export_job.delay')
+    def test_export_csv(self, mock_delay):
+        company = Company.objects.create(**COMPANY_DATA)
+        supplier = Supplier.objects.create(company=company, **SUPPLIER_DATA)
+
+        data = {
+            'action': 'export_csv_gzip',
+            '_selected_action': [supplier.pk],
+        }
+        response = self.client.post(
+            reverse('admin:user_user_changelist'),
+            data,
+            follow=True
+        )
+
+        job = ExportJob.objects.get()
+        assert response.status_code == 200
+        assert job.export == 'suppliers'
+        assert job.object_ids == [supplier.pk]
+        assert job.compress is True
+        assert job.status == ExportJob.STATUS_PENDING
+
+
 @pytest.mark.django_db
 class ResendLetterTestCase(TestCase):
 
@@ -242,8 +278,8 @@ class ResendLetterTestCase(TestCase):
         self.freezer.stop()
 
     @patch('supplier.admin.messages')
-    @patch('supplier.admin.send_verification_letter')
-    def test_resend_letter(self, mocked_send_letter, mocked_messages):
+    @patch('supplier.admin.dispatch_verification_letters')
+    def test_resend_letter(self, mocked_dispatch_letters, mocked_messages):
         company = Company.objects.create(**COMPANY_DATA)
         supplier = Supplier.objects.create(company=company, **SUPPLIER_DATA)
 
@@ -269,10 +305,10 @@ class ResendLetterTestCase(TestCase):
             follow=True
         )
 
-        assert mocked_send_letter.called_once_with(supplier.company)
+        mocked_dispatch_letters.assert_called_once_with([supplier.company.pk])
         assert mocked_messages.success.called_once_with(
             response.request,
-            'Verification letter resent to 1 users'
+            'Verification letter queued for 1 users'
         )
         assert mocked_messages.warning.called_once_with(
             response.request,
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2017-07-04 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_user_unsubscribed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='date_joined',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='date joined'),
+        ),
+    ]
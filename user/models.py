@@ -37,6 +37,7 @@ class User(TimeStampedModel):
     date_joined = models.DateTimeField(
         _('date joined'),
         default=timezone.now,
+        db_index=True,
     )
     # deprecated in favour of company.models.Company.contact_details
     mobile_number = models.CharField(